@@ -0,0 +1,89 @@
+"""
+实体抽取性能测试
+对比逐个正则扫描（legacy）与合并扫描器（fused）在万条语料上的耗时和结果一致性
+"""
+import sys
+import os
+import time
+import random
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+from entity_extractor import EntityExtractor
+
+TEMPLATES = [
+    "巡检{zone}区{room}号房{equipment}{parameter}",
+    "开启{zone}区{equipment}",
+    "关闭{equipment}{number}",
+    "查询{equipment}{number}状态",
+    "前往{zone}区{room}号房",
+    "检查配电室{number}{parameter}",
+    "设置{equipment}温度为{number}°C",
+    "{minutes}分钟后调节风机{number}到{number}%",
+    "{hour}:30巡检{floor}楼变压器{parameter}",
+    "确认{alarm}",
+]
+
+EQUIPMENT = ["主柜", "副柜", "UPS", "空调", "风机", "变压器", "开关柜", "配电柜"]
+PARAMETERS = ["温度", "湿度", "电压", "电流", "功率", "频率", "压力"]
+ALARMS = ["高温报警", "低温报警", "过载报警", "断电报警", "通信故障"]
+
+
+def build_corpus(size: int, seed: int = 42) -> list:
+    """按模板生成测试语料"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        template = rng.choice(TEMPLATES)
+        corpus.append(template.format(
+            zone=rng.choice("ABCDEF"),
+            room=rng.randint(1, 30),
+            equipment=rng.choice(EQUIPMENT),
+            parameter=rng.choice(PARAMETERS),
+            number=rng.randint(1, 99),
+            minutes=rng.randint(1, 60),
+            hour=rng.randint(0, 23),
+            floor=rng.randint(1, 9),
+            alarm=rng.choice(ALARMS),
+        ))
+    return corpus
+
+
+def run(extractor: EntityExtractor, corpus: list) -> tuple:
+    """运行正则抽取，返回耗时和结果"""
+    start = time.perf_counter()
+    results = [extractor.extract_entities_regex(text) for text in corpus]
+    elapsed = time.perf_counter() - start
+    spans = [[(e.type, e.start, e.end) for e in entities] for entities in results]
+    return elapsed, spans
+
+
+def main():
+    logger.remove()
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    corpus = build_corpus(size)
+
+    legacy_time, legacy_spans = run(EntityExtractor(scanner_mode="legacy"), corpus)
+    fused_time, fused_spans = run(EntityExtractor(scanner_mode="fused"), corpus)
+
+    mismatches = sum(1 for a, b in zip(legacy_spans, fused_spans) if a != b)
+
+    extractor = EntityExtractor()
+    start = time.perf_counter()
+    [extractor.extract_entities(text) for text in corpus]
+    single_time = time.perf_counter() - start
+    start = time.perf_counter()
+    extractor.extract_entities_batch(corpus)
+    batch_time = time.perf_counter() - start
+
+    print(f"语料条数: {size}")
+    print(f"legacy: {legacy_time * 1000:.1f} ms ({legacy_time / size * 1e6:.1f} µs/条)")
+    print(f"fused:  {fused_time * 1000:.1f} ms ({fused_time / size * 1e6:.1f} µs/条)")
+    print(f"加速比: {legacy_time / fused_time:.2f}x")
+    print(f"结果不一致条数: {mismatches}")
+    print(f"逐条 extract_entities: {single_time * 1000:.1f} ms")
+    print(f"批量 extract_entities_batch: {batch_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+大模型路径性能测试
+在本地启动离线替身服务，对比串行、并发、缓存、批量、截止时间和对冲请求下的端到端延迟
+用法:
+    python benchmarks/bench_llm_path.py [条数] [中位延迟ms]
+"""
+import sys
+import os
+import time
+import socket
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 配置在导入时读取，需要先指向替身服务并使用临时缓存
+with socket.socket() as _sock:
+    _sock.bind(("127.0.0.1", 0))
+    PORT = _sock.getsockname()[1]
+os.environ["SILICONFLOW_API_KEY"] = "fake-key"
+os.environ["SILICONFLOW_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ["LLM_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "llm_cache.sqlite")
+
+from loguru import logger
+from bench_entity_extractor import build_corpus
+from fake_llm_server import FakeLLMBackend, start_in_thread
+from nlp_processor import NLPProcessor
+from cascade import CascadePolicy
+from llm_batcher import LLMBatcher
+from metrics import LatencyTracker
+
+
+def new_processor(cache: bool = False) -> NLPProcessor:
+    """每条指令都调用大模型的处理器"""
+    processor = NLPProcessor()
+    processor.cascade = CascadePolicy(mode="always")
+    if not cache:
+        processor.llm_client.cache = None
+    return processor
+
+
+async def timed(processor: NLPProcessor, text: str, tracker: LatencyTracker, **kwargs):
+    started = time.perf_counter()
+    result = await processor.aprocess_command(text, **kwargs)
+    tracker.record("total", (time.perf_counter() - started) * 1000)
+    return result
+
+
+async def run_sequential(processor: NLPProcessor, corpus: list, **kwargs) -> tuple:
+    tracker = LatencyTracker()
+    started = time.perf_counter()
+    results = [await timed(processor, text, tracker, **kwargs) for text in corpus]
+    return time.perf_counter() - started, tracker, results
+
+
+async def run_concurrent(processor: NLPProcessor, corpus: list, **kwargs) -> tuple:
+    tracker = LatencyTracker()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(timed(processor, text, tracker, **kwargs) for text in corpus))
+    return time.perf_counter() - started, tracker, results
+
+
+def report(name: str, elapsed: float, tracker: LatencyTracker, results: list, backend: FakeLLMBackend,
+           requests_before: int) -> None:
+    summary = tracker.summary()["total"]
+    degraded = sum(1 for result in results if result.degraded)
+    # 中文字符按两个字符宽度对齐
+    label = name + " " * (10 - 2 * len(name))
+    print(f"{label} 总耗时 {elapsed * 1000:8.1f} ms  "
+          f"p50 {summary['p50']:7.1f}  p95 {summary['p95']:7.1f}  p99 {summary['p99']:7.1f} ms  "
+          f"上游请求 {backend.requests - requests_before:4d}  降级 {degraded}")
+
+
+async def main_async(size: int, latency_ms: float) -> None:
+    backend = FakeLLMBackend(latency_dist="lognormal", latency_ms=latency_ms, latency_sigma=0.6)
+    server, base_url = start_in_thread(backend, port=PORT)
+    corpus = build_corpus(size)
+    print(f"语料条数: {size}，替身服务: {base_url}，中位延迟: {latency_ms:.0f} ms（对数正态）")
+
+    scenarios = []
+
+    processor = new_processor()
+    scenarios.append(("串行", processor, run_sequential, {}))
+
+    processor = new_processor()
+    scenarios.append(("并发", processor, run_concurrent, {}))
+
+    processor = new_processor()
+    processor.llm_client.batcher = LLMBatcher(processor.llm_client)
+    scenarios.append(("微批", processor, run_concurrent, {}))
+
+    processor = new_processor()
+    scenarios.append(("截止时间", processor, run_concurrent, {"deadline_ms": latency_ms * 2}))
+
+    processor = new_processor()
+    processor.llm_client.hedge_enabled = True
+    scenarios.append(("对冲请求", processor, run_sequential, {}))
+
+    for name, processor, runner, kwargs in scenarios:
+        if name == "对冲请求":
+            # 先积累耗时样本，再统计开启对冲后的延迟
+            await runner(processor, corpus, **kwargs)
+        requests_before = backend.requests
+        elapsed, tracker, results = await runner(processor, corpus, **kwargs)
+        report(name, elapsed, tracker, results, backend, requests_before)
+
+    processor = new_processor(cache=True)
+    processor.llm_client.cache.clear()
+    await run_sequential(processor, corpus)
+    requests_before = backend.requests
+    elapsed, tracker, results = await run_sequential(processor, corpus)
+    report("缓存命中", elapsed, tracker, results, backend, requests_before)
+
+    server.should_exit = True
+
+
+def main():
+    logger.remove()
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 100
+    asyncio.run(main_async(size, latency_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+级联策略模块
+根据规则识别的置信度和实体完整性决定是否调用大模型，并统计各层命中率
+"""
+import threading
+from typing import Dict, Any, Optional
+
+from models import Intent
+from config import CASCADE_MODE, CASCADE_MIN_INTENT_CONFIDENCE
+
+# 级联模式：always 每条指令都调用大模型，confidence 规则结果足够确定时跳过，rules_only 不调用大模型
+CASCADE_MODES = ("always", "confidence", "rules_only")
+
+
+class CascadePolicy:
+    """规则层到大模型层的级联策略"""
+
+    def __init__(self, mode: str = CASCADE_MODE, min_intent_confidence: float = CASCADE_MIN_INTENT_CONFIDENCE):
+        if mode not in CASCADE_MODES:
+            raise ValueError(f"未知的级联模式: {mode}")
+        self.mode = mode
+        self.min_intent_confidence = min_intent_confidence
+        self._lock = threading.Lock()
+        self._total = 0
+        self._reasons: Dict[str, int] = {}
+
+    def decide(self, intent: Intent, is_valid: bool) -> str:
+        """返回决策原因，以 skip_ 开头的原因表示跳过大模型"""
+        if self.mode == "always":
+            reason = "always"
+        elif self.mode == "rules_only":
+            reason = "skip_rules_only"
+        elif not is_valid:
+            reason = "incomplete"
+        elif intent.confidence < self.min_intent_confidence:
+            reason = "low_confidence"
+        else:
+            reason = "skip_decisive"
+
+        with self._lock:
+            self._total += 1
+            self._reasons[reason] = self._reasons.get(reason, 0) + 1
+        return reason
+
+    def prejudge(self, intent: Intent) -> Optional[bool]:
+        """只根据规则意图预判是否需要大模型，不计入统计
+
+        True 表示无论实体是否完整都会调用大模型，False 表示一定跳过，None 表示取决于必需实体是否完整。
+        """
+        if self.mode == "always":
+            return True
+        if self.mode == "rules_only":
+            return False
+        if intent.confidence < self.min_intent_confidence:
+            return True
+        return None
+
+    def should_call_llm(self, intent: Intent, is_valid: bool) -> bool:
+        """规则结果意图明确且必需实体完整时跳过大模型"""
+        return not self.decide(intent, is_valid).startswith("skip_")
+
+    def stats(self) -> Dict[str, Any]:
+        """级联命中统计"""
+        with self._lock:
+            reasons = dict(self._reasons)
+            total = self._total
+        skipped = sum(count for reason, count in reasons.items() if reason.startswith("skip_"))
+        return {
+            "mode": self.mode,
+            "min_intent_confidence": self.min_intent_confidence,
+            "total": total,
+            "llm_calls": total - skipped,
+            "llm_skipped": skipped,
+            "skip_rate": skipped / total if total else 0.0,
+            "reasons": reasons
+        }
+
+    def reset_stats(self) -> None:
+        """清空统计"""
+        with self._lock:
+            self._total = 0
+            self._reasons = {}
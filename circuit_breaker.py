@@ -0,0 +1,107 @@
+"""
+熔断器模块
+上游连续失败达到阈值后熔断，熔断期间直接拒绝调用；冷却后放行一次试探调用，成功则恢复
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RESET_TIMEOUT
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断期间拒绝调用"""
+
+
+class Permit:
+    """一次放行的调用，probe 为 True 时占用了半开状态下的试探名额"""
+    __slots__ = ("probe",)
+
+    def __init__(self, probe: bool = False):
+        self.probe = probe
+
+
+class CircuitBreaker:
+    """连续失败计数熔断器"""
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = LLM_BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        # 半开状态下只放行一次试探调用，记录占用名额的调用
+        self._probe: Optional[Permit] = None
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probe = None
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """是否处于熔断状态（冷却结束后可以试探时返回False）"""
+        return self.state == OPEN
+
+    def allow(self) -> Optional[Permit]:
+        """放行一次调用时返回许可，结束时交给 release()；熔断期间和半开状态下已有试探调用时返回None"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return Permit()
+            if state == HALF_OPEN and self._probe is None:
+                self._probe = Permit(probe=True)
+                return self._probe
+            self.rejected += 1
+            return None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe = None
+
+    def record_rejection(self) -> None:
+        """调用方在熔断期间主动跳过调用时计数"""
+        with self._lock:
+            self.rejected += 1
+
+    def release(self, permit: Permit) -> None:
+        """调用结束时释放许可，只有占用试探名额的调用才会释放名额，试探调用被取消时允许下一次试探"""
+        with self._lock:
+            if permit.probe and self._probe is permit:
+                self._probe = None
+
+    def stats(self) -> Dict[str, Any]:
+        """熔断器状态、连续失败次数、熔断次数和拒绝的调用数"""
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected
+            }
@@ -8,11 +8,135 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# 项目目录，配置中的相对路径按此目录解析，与启动时的工作目录无关
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def project_path(path: str) -> str:
+    """相对路径按项目目录解析，绝对路径不变，空字符串保持为空（表示不使用该文件）"""
+    return os.path.join(BASE_DIR, path) if path else path
+
+
 # API配置 - 硅基流动
 SILICONFLOW_API_KEY = os.getenv("SILICONFLOW_API_KEY")
 SILICONFLOW_BASE_URL = os.getenv("SILICONFLOW_BASE_URL", "https://api.siliconflow.cn/v1")
 MODEL_NAME = os.getenv("MODEL_NAME", "Qwen/Qwen2.5-72B-Instruct")
 
+# 模型路由：配置小模型后，短指令或歧义较小的指令先使用小模型，置信度不足或输出无效时升级到 MODEL_NAME
+LLM_SMALL_MODEL_NAME = os.getenv("LLM_SMALL_MODEL_NAME", "")
+# 不超过该长度的指令使用小模型
+LLM_ROUTER_MAX_SMALL_LENGTH = int(os.getenv("LLM_ROUTER_MAX_SMALL_LENGTH", "24"))
+# 小模型置信度低于该值时升级到大模型
+LLM_ROUTER_MIN_SMALL_CONFIDENCE = float(os.getenv("LLM_ROUTER_MIN_SMALL_CONFIDENCE", "0.8"))
+
+# 大模型调用超时（秒）和异步调用的最大并发数
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# 大模型HTTP连接池：最大连接数、保持的keep-alive连接数及其空闲保留时间（秒）
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+
+# 连接失败、超时、限流和服务端错误的重试次数，重试间隔按指数退避并加随机抖动（秒）
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.2"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "2"))
+
+# 熔断器：连续失败次数达到阈值后熔断，熔断期间只使用规则结果，冷却时间（秒）后试探恢复
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_TIMEOUT = float(os.getenv("LLM_BREAKER_RESET_TIMEOUT", "30"))
+
+# 请求截止时间（毫秒），大模型未在截止前返回时降级为规则结果，0表示只受 LLM_TIMEOUT 限制
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "0"))
+# 截止前预留给结果融合和返回的时间（毫秒）
+DEADLINE_MARGIN_MS = int(os.getenv("DEADLINE_MARGIN_MS", "50"))
+
+# 对冲请求：异步调用超过该模型耗时分位数仍未返回时再发一次请求，采用先返回的结果
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# 耗时样本数少于该值时不发对冲请求
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# 大模型输出格式：full 为完整JSON（含实体位置、推理过程和结构化指令），compact 为短字段紧凑JSON
+LLM_RESPONSE_MODE = os.getenv("LLM_RESPONSE_MODE", "full")
+# 紧凑格式的最大输出token数
+LLM_COMPACT_MAX_TOKENS = int(os.getenv("LLM_COMPACT_MAX_TOKENS", "300"))
+
+# 提示词精简：只保留规则阶段得分最高的前K个意图及其相关实体类型，0表示使用完整提示词
+PROMPT_TOP_K = int(os.getenv("PROMPT_TOP_K", "3"))
+
+# 流式模式：边接收边解析大模型输出，意图字段到达后立即回调
+LLM_STREAMING_ENABLED = os.getenv("LLM_STREAMING_ENABLED", "false").lower() == "true"
+
+# 大模型响应缓存：内存LRU + SQLite持久化，TTL单位为秒（0表示不过期），路径为空时只使用内存缓存
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = project_path(os.getenv("LLM_CACHE_PATH", "cache/llm_cache.sqlite"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "604800"))
+LLM_CACHE_MEMORY_SIZE = int(os.getenv("LLM_CACHE_MEMORY_SIZE", "10000"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000"))
+
+# 大模型批量模式：在时间窗口（毫秒）内收集指令，达到上限条数时立即发送，合并为一次请求
+LLM_BATCH_ENABLED = os.getenv("LLM_BATCH_ENABLED", "false").lower() == "true"
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "20"))
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "8"))
+LLM_BATCH_MAX_TOKENS = int(os.getenv("LLM_BATCH_MAX_TOKENS", "8192"))
+
+# 正则实体扫描模式：fused 为合并扫描器一次扫描，legacy 为逐个正则扫描
+ENTITY_SCANNER_MODE = os.getenv("ENTITY_SCANNER_MODE", "fused")
+
+# 分词器：none 为免分词抽取，jieba 为启用分词并按词边界过滤关键词命中
+ENTITY_SEGMENTER = os.getenv("ENTITY_SEGMENTER", "none")
+# 启动时预热分词词典，避免首条指令承担词典加载耗时
+SEGMENTER_PRELOAD = os.getenv("SEGMENTER_PRELOAD", "false").lower() == "true"
+# jieba前缀词典缓存文件
+JIEBA_CACHE_FILE = project_path(os.getenv("JIEBA_CACHE_FILE", "cache/jieba.cache"))
+
+# 实体标准化缓存容量
+NORMALIZATION_CACHE_SIZE = int(os.getenv("NORMALIZATION_CACHE_SIZE", "100000"))
+
+# 语法快照：启动时加载预编译的关键词自动机、意图引擎和查找表
+# 正则无法序列化为编译结果，加载时仍需重新编译，实体抽取器的启动耗时基本不变，因此默认关闭
+GRAMMAR_SNAPSHOT_ENABLED = os.getenv("GRAMMAR_SNAPSHOT_ENABLED", "false").lower() == "true"
+GRAMMAR_SNAPSHOT_DIR = project_path(os.getenv("GRAMMAR_SNAPSHOT_DIR", "cache"))
+
+# 字符n-gram意图模型：文件存在时作为规则和大模型之间的识别层
+NGRAM_MODEL_PATH = project_path(os.getenv("NGRAM_MODEL_PATH", "data/intent_ngram.npz"))
+# 规则置信度低于该值时才参考模型
+NGRAM_RULE_CONFIDENCE_THRESHOLD = float(os.getenv("NGRAM_RULE_CONFIDENCE_THRESHOLD", "0.6"))
+# 模型概率达到该值才采用模型结果
+NGRAM_MODEL_MIN_CONFIDENCE = float(os.getenv("NGRAM_MODEL_MIN_CONFIDENCE", "0.7"))
+
+# 级联策略：always 每条指令都调用大模型，confidence 规则结果足够确定时跳过大模型，rules_only 只用规则
+CASCADE_MODE = os.getenv("CASCADE_MODE", "confidence")
+# 规则意图置信度达到该值且必需实体完整时跳过大模型
+CASCADE_MIN_INTENT_CONFIDENCE = float(os.getenv("CASCADE_MIN_INTENT_CONFIDENCE", "0.6"))
+
+# 并发处理：大模型调用立即开始，规则分析同时进行，规则结果缺少必需实体时并行调用大模型补充实体
+CONCURRENT_PROCESSING_ENABLED = os.getenv("CONCURRENT_PROCESSING_ENABLED", "false").lower() == "true"
+# 同步并发处理使用的线程数
+PROCESS_MAX_WORKERS = int(os.getenv("PROCESS_MAX_WORKERS", "8"))
+# 批量处理接口单次请求的最大指令条数
+PROCESS_BATCH_MAX_SIZE = int(os.getenv("PROCESS_BATCH_MAX_SIZE", "1000"))
+
+# 离线大模型替身服务（fake_llm_server.py）：端口、延迟分布（fixed/uniform/lognormal）及中位延迟（毫秒）
+FAKE_LLM_PORT = int(os.getenv("FAKE_LLM_PORT", "8001"))
+FAKE_LLM_LATENCY_DIST = os.getenv("FAKE_LLM_LATENCY_DIST", "lognormal")
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+# 对数正态分布的离散程度，越大长尾越明显
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5"))
+# 流式输出时首个分片占总延迟的比例，以及每个分片的字符数
+FAKE_LLM_FIRST_TOKEN_RATIO = float(os.getenv("FAKE_LLM_FIRST_TOKEN_RATIO", "0.3"))
+FAKE_LLM_CHUNK_SIZE = int(os.getenv("FAKE_LLM_CHUNK_SIZE", "8"))
+# 注入的错误率、错误状态码和格式错误JSON的比例
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_ERROR_STATUS = int(os.getenv("FAKE_LLM_ERROR_STATUS", "500"))
+FAKE_LLM_MALFORMED_RATE = float(os.getenv("FAKE_LLM_MALFORMED_RATE", "0"))
+# 预置回复（JSON文件，指令文本 -> 回复对象），未命中时由规则引擎生成回复
+FAKE_LLM_FIXTURES = os.getenv("FAKE_LLM_FIXTURES", "")
+# 随机种子，保证延迟、错误注入可复现
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "42"))
+
 # 兼容旧配置
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", SILICONFLOW_API_KEY)
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", SILICONFLOW_BASE_URL)
@@ -56,6 +180,25 @@ INTENT_TYPES = {
     }
 }
 
+# 意图识别规则，按顺序匹配，后命中的规则覆盖同一意图的得分
+INTENT_RULES = [
+    # 巡检相关规则
+    {"intent": "patrol_inspection", "pattern": r'巡检|检查|监测|查看.*?(温度|湿度|电压|电流)', "score": 0.95},
+    # 设备控制相关规则
+    {"intent": "equipment_control", "pattern": r'(开启|关闭|启动|停止|调节|设置).*?(设备|主柜|副柜|UPS|空调)', "score": 0.95},
+    # 状态查询相关规则
+    {"intent": "status_query", "pattern": r'(查询|状态|显示|报告).*?(设备|主柜|副柜)', "score": 0.9},
+    # 报警处理相关规则
+    {"intent": "alarm_handling", "pattern": r'(报警|警报|确认|处理|消除)', "score": 0.9},
+    # 导航移动相关规则
+    {"intent": "navigation", "pattern": r'(前往|移动|到达|回到|导航).*?([A-Z]区|\d+号房)', "score": 0.9}
+]
+
+# 各意图的模型路由策略：small 优先使用小模型，large 始终使用大模型，未配置的意图按长度和候选数量自动选择
+LLM_ROUTER_INTENT_POLICY = {
+    "equipment_control": "large"
+}
+
 # 实体类型定义
 ENTITY_TYPES = {
     "location": {
@@ -164,4 +307,15 @@ EQUIPMENT_MAPPING = {
     "副柜": {"type": "cabinet", "subtype": "secondary"},
     "UPS": {"type": "ups", "subtype": "power"},
     "空调": {"type": "air_conditioner", "subtype": "hvac"}
-}
\ No newline at end of file
+}
+
+# 参数单位映射
+PARAMETER_UNIT_MAPPING = {
+    "温度": "°C",
+    "湿度": "%",
+    "电压": "V",
+    "电流": "A",
+    "功率": "W",
+    "频率": "Hz",
+    "压力": "Pa"
+}
@@ -0,0 +1,39 @@
+"""
+请求截止时间模块
+把接口传入的时间预算换算为单调时钟上的截止时间，逐层传递给大模型调用
+"""
+import time
+from typing import Optional
+
+from config import REQUEST_DEADLINE_MS, DEADLINE_MARGIN_MS
+
+
+class Deadline:
+    """一次请求的截止时间"""
+
+    def __init__(self, budget_ms: float, margin_ms: float = DEADLINE_MARGIN_MS):
+        self.budget_ms = budget_ms
+        # 大模型需要在 expires_at 之前返回，剩余的 margin 留给规则结果融合和返回
+        self.expires_at = time.monotonic() + max(0.0, budget_ms - margin_ms) / 1000.0
+
+    @classmethod
+    def from_ms(cls, budget_ms: Optional[float] = None) -> Optional["Deadline"]:
+        """budget_ms 为空时使用 REQUEST_DEADLINE_MS，不大于0表示不设截止时间"""
+        if budget_ms is None:
+            budget_ms = REQUEST_DEADLINE_MS
+        return cls(budget_ms) if budget_ms > 0 else None
+
+    def remaining(self) -> float:
+        """剩余时间（秒）"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+def remaining_timeout(deadline: Optional[Deadline], timeout: float) -> float:
+    """单次调用的超时时间：不超过默认超时，也不超过截止时间"""
+    if deadline is None:
+        return timeout
+    return min(timeout, deadline.remaining())
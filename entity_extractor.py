@@ -3,21 +3,48 @@
 使用正则表达式和大模型结合的方式提取命名实体
 """
 import re
-import jieba
-from typing import List, Dict, Any, Tuple
+import regex
+import multiprocessing
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 from loguru import logger
 
-from models import Entity
-from config import ENTITY_TYPES, LOCATION_MAPPING, EQUIPMENT_MAPPING
+from models import Entity, Span
+from config import (
+    ENTITY_TYPES, LOCATION_MAPPING, EQUIPMENT_MAPPING, PARAMETER_UNIT_MAPPING,
+    ENTITY_SCANNER_MODE, ENTITY_SEGMENTER, SEGMENTER_PRELOAD
+)
+from keyword_automaton import KeywordAutomaton
+from span_resolver import resolve_overlaps
+from segmenter import Segmenter
+from entity_normalizer import EntityNormalizer
 
 class EntityExtractor:
     """实体抽取器"""
     
-    def __init__(self):
+    def __init__(self, scanner_mode: str = ENTITY_SCANNER_MODE, segmenter: str = ENTITY_SEGMENTER,
+                 snapshot: Optional[Dict[str, Any]] = None):
         self.entity_types = ENTITY_TYPES
         self.location_mapping = LOCATION_MAPPING
         self.equipment_mapping = EQUIPMENT_MAPPING
+        self.scanner_mode = scanner_mode
         
+        # 标准化查找表
+        self.normalizer = EntityNormalizer(self.location_mapping, self.equipment_mapping, PARAMETER_UNIT_MAPPING)
+        
+        # 默认不分词；启用jieba时关键词命中需落在词边界上
+        self.segmenter: Optional[Segmenter] = Segmenter() if segmenter == "jieba" else None
+        
+        if snapshot:
+            self._load_snapshot(snapshot)
+        else:
+            self._compile()
+        
+        if self.segmenter and SEGMENTER_PRELOAD:
+            self.segmenter.warm_up()
+    
+    def _compile(self) -> None:
+        """由配置编译正则和关键词自动机"""
         # 编译正则表达式
         self.compiled_patterns = {}
         for entity_type, config in self.entity_types.items():
@@ -28,169 +55,254 @@ class EntityExtractor:
                 except re.error as e:
                     logger.warning(f"Invalid regex pattern for {entity_type}: {pattern}, error: {e}")
             self.compiled_patterns[entity_type] = patterns
+        
+        # 将所有正则合并为一个命名分组的扫描器
+        self.fused_scanner, self.fused_group_types = self._build_fused_scanner()
+        
+        # 编译关键词自动机，一次扫描匹配所有示例词
+        self.keyword_automaton = KeywordAutomaton()
+        self.custom_keywords: Dict[str, List[str]] = {}
+        for entity_type, config in self.entity_types.items():
+            self.add_keywords(entity_type, config["examples"], custom=False)
+    
+    def export_state(self) -> Dict[str, Any]:
+        """导出编译结果，用于生成语法快照"""
+        return {
+            "patterns": {
+                entity_type: [pattern.pattern for pattern in patterns]
+                for entity_type, patterns in self.compiled_patterns.items()
+            },
+            "fused_pattern": self.fused_scanner.pattern if self.fused_scanner is not None else None,
+            "fused_group_types": self.fused_group_types,
+            "keyword_automaton": self.keyword_automaton.export_state(),
+            "custom_keywords": self.custom_keywords,
+            "normalizer": self.normalizer.export_state()
+        }
+    
+    def _load_snapshot(self, state: Dict[str, Any]) -> None:
+        """从语法快照恢复编译结果"""
+        self.compiled_patterns = {
+            entity_type: [re.compile(pattern) for pattern in patterns]
+            for entity_type, patterns in state["patterns"].items()
+        }
+        fused_pattern = state["fused_pattern"]
+        self.fused_scanner = regex.compile(fused_pattern, flags=regex.POSIX) if fused_pattern else None
+        self.fused_group_types = state["fused_group_types"]
+        if self.fused_scanner is None:
+            self.scanner_mode = "legacy"
+        
+        self.keyword_automaton = KeywordAutomaton.from_state(state["keyword_automaton"])
+        self.custom_keywords = state["custom_keywords"]
+        self.normalizer.load_state(state["normalizer"])
+        
+        if self.segmenter:
+            for config in self.entity_types.values():
+                self.segmenter.add_words(config["examples"])
+            for keywords in self.custom_keywords.values():
+                self.segmenter.add_words(keywords)
+    
+    def add_keywords(self, entity_type: str, keywords: List[str], custom: bool = True) -> None:
+        """添加关键词（如现场设备、房间名称），用于关键词匹配"""
+        if custom:
+            self.custom_keywords.setdefault(entity_type, []).extend(keywords)
+        for keyword in keywords:
+            self.keyword_automaton.add(keyword, (entity_type, keyword))
+        if self.segmenter:
+            self.segmenter.add_words(keywords)
+    
+    def _build_fused_scanner(self) -> Tuple[Any, Dict[str, str]]:
+        """构建合并扫描器，每个正则对应一个命名分组"""
+        alternatives = []
+        group_types = {}
+        for entity_type, patterns in self.compiled_patterns.items():
+            for index, pattern in enumerate(patterns):
+                group_name = f"{entity_type}_{index}"
+                alternatives.append(f"(?P<{group_name}>{pattern.pattern})")
+                group_types[group_name] = entity_type
+        
+        if not alternatives:
+            return None, group_types
+
+        # POSIX模式提供最左最长匹配语义
+        try:
+            scanner = regex.compile("|".join(alternatives), flags=regex.POSIX)
+        except regex.error as e:
+            logger.warning(f"Failed to build fused entity scanner, falling back to legacy mode: {e}")
+            self.scanner_mode = "legacy"
+            return None, group_types
+        return scanner, group_types
     
     def extract_entities_regex(self, text: str) -> List[Entity]:
         """使用正则表达式提取实体"""
-        entities = []
+        return [span.to_entity() for span in self._regex_spans(text)]
+    
+    def extract_entities_keywords(self, text: str) -> List[Entity]:
+        """使用关键词匹配提取实体"""
+        return [span.to_entity() for span in self._keyword_spans(text)]
+    
+    def _regex_spans(self, text: str) -> List[Span]:
+        """正则匹配得到的候选实体"""
+        if self.scanner_mode == "fused":
+            return self._fused_spans(text)
+        
+        spans = []
+        normalize = self.normalizer.normalize
         
         for entity_type, patterns in self.compiled_patterns.items():
             for pattern in patterns:
-                matches = pattern.finditer(text)
-                for match in matches:
-                    entity = Entity(
-                        type=entity_type,
-                        value=match.group(),
-                        start=match.start(),
-                        end=match.end(),
-                        confidence=0.9  # 正则匹配的置信度较高
-                    )
-                    
-                    # 标准化实体值
-                    normalized_value = self._normalize_entity(entity_type, entity.value)
-                    if normalized_value:
-                        entity.normalized_value = normalized_value
-                    
-                    entities.append(entity)
+                for match in pattern.finditer(text):
+                    value = match.group()
+                    # 正则匹配的置信度较高
+                    spans.append(Span(entity_type, value, match.start(), match.end(), 0.9,
+                                      normalize(entity_type, value), "regex"))
         
         # 去重和合并重叠的实体
-        entities = self._deduplicate_entities(entities)
-        return entities
+        return self._deduplicate_entities(spans)
     
-    def extract_entities_keywords(self, text: str) -> List[Entity]:
-        """使用关键词匹配提取实体"""
-        entities = []
+    def _fused_spans(self, text: str) -> List[Span]:
+        """使用合并扫描器一次扫描提取实体，结果本身不重叠"""
+        spans = []
+        if self.fused_scanner is None:
+            return spans
         
-        # 分词
-        words = jieba.lcut(text)
-        text_lower = text.lower()
+        group_types = self.fused_group_types
+        normalize = self.normalizer.normalize
+        for match in self.fused_scanner.finditer(text):
+            entity_type = group_types[match.lastgroup]
+            value = match.group()
+            spans.append(Span(entity_type, value, match.start(), match.end(), 0.9,
+                              normalize(entity_type, value), "regex"))
         
-        # 检查每个实体类型的示例
-        for entity_type, config in self.entity_types.items():
-            for example in config["examples"]:
-                if example in text or example.lower() in text_lower:
-                    # 查找在原文中的位置
-                    start_pos = text.find(example)
-                    if start_pos == -1:
-                        start_pos = text_lower.find(example.lower())
-                    
-                    if start_pos != -1:
-                        entity = Entity(
-                            type=entity_type,
-                            value=example,
-                            start=start_pos,
-                            end=start_pos + len(example),
-                            confidence=0.8
-                        )
-                        
-                        # 标准化实体值
-                        normalized_value = self._normalize_entity(entity_type, entity.value)
-                        if normalized_value:
-                            entity.normalized_value = normalized_value
-                        
-                        entities.append(entity)
-        
-        return entities
-    
-    def _normalize_entity(self, entity_type: str, value: str) -> Dict[str, Any]:
+        return spans
+    
+    def _keyword_spans(self, text: str) -> List[Span]:
+        """关键词匹配得到的候选实体"""
+        spans = []
+        normalize = self.normalizer.normalize
+        
+        # 启用分词时只保留落在词边界上的命中
+        boundaries = self.segmenter.boundaries(text) if self.segmenter else None
+        
+        # 一次扫描找出所有示例词的全部出现位置
+        for start, end, (entity_type, keyword) in self.keyword_automaton.find_all(text):
+            if boundaries is not None and (start not in boundaries or end not in boundaries):
+                continue
+            spans.append(Span(entity_type, keyword, start, end, 0.8,
+                              normalize(entity_type, keyword), "keyword"))
+        
+        return spans
+    
+    def _normalize_entity(self, entity_type: str, value: str) -> Optional[Dict[str, Any]]:
         """标准化实体值"""
-        if entity_type == "location":
-            if value in self.location_mapping:
-                return self.location_mapping[value]
-            # 解析复合位置，如"A区2号房"
-            zone_match = re.search(r'([A-Z])区', value)
-            room_match = re.search(r'(\d+)号房', value)
-            result = {}
-            if zone_match:
-                result["zone"] = zone_match.group(1)
-            if room_match:
-                result["room"] = room_match.group(1)
-            if result:
-                result["type"] = "compound"
-                return result
-                
-        elif entity_type == "equipment":
-            if value in self.equipment_mapping:
-                return self.equipment_mapping[value]
-            # 处理带编号的设备
-            for base_name, mapping in self.equipment_mapping.items():
-                if base_name in value:
-                    result = mapping.copy()
-                    # 提取编号
-                    number_match = re.search(r'\d+', value)
-                    if number_match:
-                        result["number"] = number_match.group()
-                    return result
-                    
-        elif entity_type == "parameter":
-            return {"parameter_type": value, "unit": self._extract_unit(value)}
-            
-        elif entity_type == "value":
-            # 解析数值和单位
-            value_match = re.search(r'(\d+\.?\d*)', value)
-            unit_match = re.search(r'(°C|%|V|A|Hz)', value)
-            if value_match:
-                result = {"numeric_value": float(value_match.group(1))}
-                if unit_match:
-                    result["unit"] = unit_match.group(1)
-                return result
-        
-        return None
+        return self.normalizer.normalize(entity_type, value)
     
     def _extract_unit(self, parameter: str) -> str:
         """提取参数单位"""
-        unit_mapping = {
-            "温度": "°C",
-            "湿度": "%",
-            "电压": "V", 
-            "电流": "A",
-            "功率": "W",
-            "频率": "Hz",
-            "压力": "Pa"
-        }
-        return unit_mapping.get(parameter, "")
+        return PARAMETER_UNIT_MAPPING.get(parameter, "")
     
-    def _deduplicate_entities(self, entities: List[Entity]) -> List[Entity]:
+    def _deduplicate_entities(self, spans: List[Span]) -> List[Span]:
         """去重和合并重叠的实体"""
-        if not entities:
-            return entities
-        
-        # 按位置排序
-        entities.sort(key=lambda x: (x.start, x.end))
-        
-        deduplicated = []
-        for entity in entities:
-            # 检查是否与已有实体重叠
-            overlapped = False
-            for existing in deduplicated:
-                if (entity.start < existing.end and entity.end > existing.start):
-                    # 有重叠，保留置信度更高的
-                    if entity.confidence > existing.confidence:
-                        deduplicated.remove(existing)
-                        deduplicated.append(entity)
-                    overlapped = True
-                    break
-            
-            if not overlapped:
-                deduplicated.append(entity)
-        
-        return deduplicated
+        return resolve_overlaps((span, span.source) for span in spans)
+    
+    def extract_spans(self, text: str) -> List[Span]:
+        """综合提取实体，返回内部使用的轻量实体"""
+        spans = self._deduplicate_entities(self._regex_spans(text) + self._keyword_spans(text))
+        
+        logger.info(f"Extracted {len(spans)} entities from text: {text}")
+        for span in spans:
+            logger.debug(f"Entity: {span.type} = {span.value} (confidence: {span.confidence})")
+        
+        return spans
     
     def extract_entities(self, text: str) -> List[Entity]:
         """综合提取实体"""
-        # 使用正则表达式提取
-        regex_entities = self.extract_entities_regex(text)
+        return [span.to_entity() for span in self.extract_spans(text)]
+    
+    def extract_entities_batch(self, texts: Iterable[str], workers: int = 0,
+                               chunk_size: int = 1000) -> Dict[str, List[Any]]:
+        """批量提取实体，按列返回结果
         
-        # 使用关键词匹配提取
-        keyword_entities = self.extract_entities_keywords(text)
+        返回的字典包含等长的列：text_index、type、value、start、end、confidence、
+        normalized_value，其中 text_index 为实体所属文本在输入中的序号。
+        workers 大于0时使用多进程并行处理，适合百万行级别的语料。
+        """
+        columns = _empty_columns()
+        text_count = 0
         
-        # 合并结果
-        all_entities = regex_entities + keyword_entities
+        if workers and workers > 0:
+            initargs = (self.scanner_mode, "jieba" if self.segmenter else "none", self.export_state())
+            with multiprocessing.Pool(workers, initializer=_init_batch_worker, initargs=initargs) as pool:
+                for offset, chunk_columns, size in pool.imap(_extract_batch_chunk, _chunked(texts, chunk_size)):
+                    _extend_columns(columns, chunk_columns, offset)
+                    text_count = max(text_count, offset + size)
+        else:
+            for offset, chunk in _chunked(texts, chunk_size):
+                _, chunk_columns, size = self._extract_chunk(offset, chunk)
+                _extend_columns(columns, chunk_columns, offset)
+                text_count = offset + size
         
-        # 去重
-        final_entities = self._deduplicate_entities(all_entities)
+        logger.info(f"Batch extracted {len(columns['type'])} entities from {text_count} texts")
+        return columns
+    
+    def _extract_chunk(self, offset: int, texts: List[str]) -> Tuple[int, Dict[str, List[Any]], int]:
+        """处理一个分块，text_index 为块内序号"""
+        columns = _empty_columns()
+        text_index = columns["text_index"]
+        types = columns["type"]
+        values = columns["value"]
+        starts = columns["start"]
+        ends = columns["end"]
+        confidences = columns["confidence"]
+        normalized_values = columns["normalized_value"]
         
-        logger.info(f"Extracted {len(final_entities)} entities from text: {text}")
-        for entity in final_entities:
-            logger.debug(f"Entity: {entity.type} = {entity.value} (confidence: {entity.confidence})")
+        for index, text in enumerate(texts):
+            for span in self._deduplicate_entities(self._regex_spans(text) + self._keyword_spans(text)):
+                text_index.append(index)
+                types.append(span.type)
+                values.append(span.value)
+                starts.append(span.start)
+                ends.append(span.end)
+                confidences.append(span.confidence)
+                normalized_values.append(dict(span.normalized_value) if span.normalized_value else None)
         
-        return final_entities
\ No newline at end of file
+        return offset, columns, len(texts)
+
+
+BATCH_COLUMNS = ("text_index", "type", "value", "start", "end", "confidence", "normalized_value")
+
+# 多进程批处理时每个工作进程持有的抽取器
+_batch_worker_extractor: Optional[EntityExtractor] = None
+
+
+def _empty_columns() -> Dict[str, List[Any]]:
+    return {name: [] for name in BATCH_COLUMNS}
+
+
+def _extend_columns(columns: Dict[str, List[Any]], chunk_columns: Dict[str, List[Any]], offset: int) -> None:
+    """合并分块结果，把块内序号换算为全局序号"""
+    columns["text_index"].extend(index + offset for index in chunk_columns["text_index"])
+    for name in BATCH_COLUMNS[1:]:
+        columns[name].extend(chunk_columns[name])
+
+
+def _chunked(texts: Iterable[str], chunk_size: int):
+    """把输入切分为 (起始序号, 文本列表) 分块，支持迭代器输入"""
+    iterator = iter(texts)
+    offset = 0
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield offset, chunk
+        offset += len(chunk)
+
+
+def _init_batch_worker(scanner_mode: str, segmenter: str, state: Dict[str, Any]) -> None:
+    global _batch_worker_extractor
+    logger.remove()
+    _batch_worker_extractor = EntityExtractor(scanner_mode=scanner_mode, segmenter=segmenter, snapshot=state)
+
+
+def _extract_batch_chunk(task: Tuple[int, List[str]]) -> Tuple[int, Dict[str, List[Any]], int]:
+    offset, texts = task
+    return _batch_worker_extractor._extract_chunk(offset, texts)
@@ -0,0 +1,128 @@
+"""
+实体标准化模块
+启动时把位置、设备、参数映射编译为查找表，运行时每个实体值只需一次哈希查找
+"""
+import re
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from config import LOCATION_MAPPING, EQUIPMENT_MAPPING, PARAMETER_UNIT_MAPPING, NORMALIZATION_CACHE_SIZE
+
+# 末尾编号解析，如 "UPS12" -> ("UPS", "12")
+_NUMBERED_PATTERN = re.compile(r"^(.*?)(\d+)$")
+# 复合位置解析，如 "A区2号房"
+_ZONE_PATTERN = re.compile(r"([A-Z])区")
+_ROOM_PATTERN = re.compile(r"(\d+)号房")
+_DIGITS_PATTERN = re.compile(r"\d+")
+# 数值和单位解析
+_NUMBER_PATTERN = re.compile(r"(\d+\.?\d*)")
+_UNIT_PATTERN = re.compile(r"(°C|%|V|A|Hz)")
+
+_MISSING = object()
+
+
+def _freeze(data: Dict[str, Any]) -> Mapping[str, Any]:
+    """转换为只读映射，结果在多个实体间共享"""
+    return MappingProxyType(dict(data))
+
+
+class EntityNormalizer:
+    """实体标准化器"""
+
+    def __init__(self, location_mapping: Dict[str, Dict[str, Any]] = LOCATION_MAPPING,
+                 equipment_mapping: Dict[str, Dict[str, Any]] = EQUIPMENT_MAPPING,
+                 unit_mapping: Dict[str, str] = PARAMETER_UNIT_MAPPING,
+                 cache_size: int = NORMALIZATION_CACHE_SIZE):
+        self.location_mapping = location_mapping
+        self.equipment_mapping = equipment_mapping
+        self.unit_mapping = unit_mapping
+        self.cache_size = cache_size
+
+        self._equipment_table = {name: _freeze(mapping) for name, mapping in equipment_mapping.items()}
+        self._table = self._build_table()
+        self._lookup: Dict[Tuple[str, str], Optional[Mapping[str, Any]]] = dict(self._table)
+
+    def export_state(self) -> Dict[str, Any]:
+        """导出查找表（含已缓存的解析结果），用于快照"""
+        return {
+            "table": {key: dict(value) for key, value in self._table.items()},
+            "lookup": {key: dict(value) if value is not None else None
+                       for key, value in self._lookup.items() if key not in self._table}
+        }
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        """从快照恢复查找表"""
+        self._table = {key: _freeze(value) for key, value in state["table"].items()}
+        self._lookup = dict(self._table)
+        for key, value in state["lookup"].items():
+            self._lookup[key] = _freeze(value) if value is not None else None
+
+    def _build_table(self) -> Dict[Tuple[str, str], Mapping[str, Any]]:
+        """由配置映射预先生成查找表"""
+        table = {}
+        for value, mapping in self.location_mapping.items():
+            table[("location", value)] = _freeze(mapping)
+        for value, mapping in self._equipment_table.items():
+            table[("equipment", value)] = mapping
+        for value, unit in self.unit_mapping.items():
+            table[("parameter", value)] = _freeze({"parameter_type": value, "unit": unit})
+        return table
+
+    def normalize(self, entity_type: str, value: str) -> Optional[Mapping[str, Any]]:
+        """标准化实体值，返回只读结果，无法标准化时返回None"""
+        key = (entity_type, value)
+        result = self._lookup.get(key, _MISSING)
+        if result is not _MISSING:
+            return result
+
+        result = self._compute(entity_type, value)
+        # 超出容量时只保留预生成的查找表
+        if len(self._lookup) >= self.cache_size:
+            self._lookup = dict(self._table)
+        self._lookup[key] = result
+        return result
+
+    def _compute(self, entity_type: str, value: str) -> Optional[Mapping[str, Any]]:
+        """查找表未命中时解析实体值"""
+        if entity_type == "location":
+            result = {}
+            zone_match = _ZONE_PATTERN.search(value)
+            if zone_match:
+                result["zone"] = zone_match.group(1)
+            room_match = _ROOM_PATTERN.search(value)
+            if room_match:
+                result["room"] = room_match.group(1)
+            if result:
+                result["type"] = "compound"
+                return _freeze(result)
+
+        elif entity_type == "equipment":
+            # 带编号的设备，一次解析出基础名称和编号
+            numbered_match = _NUMBERED_PATTERN.match(value)
+            if numbered_match:
+                base = self._equipment_table.get(numbered_match.group(1))
+                if base is not None:
+                    return _freeze({**base, "number": numbered_match.group(2)})
+
+            # 其他写法按包含关系匹配基础名称
+            for base_name, mapping in self._equipment_table.items():
+                if base_name in value:
+                    result = dict(mapping)
+                    number_match = _DIGITS_PATTERN.search(value)
+                    if number_match:
+                        result["number"] = number_match.group()
+                    return _freeze(result)
+
+        elif entity_type == "parameter":
+            return _freeze({"parameter_type": value, "unit": self.unit_mapping.get(value, "")})
+
+        elif entity_type == "value":
+            value_match = _NUMBER_PATTERN.search(value)
+            if value_match:
+                result = {"numeric_value": float(value_match.group(1))}
+                unit_match = _UNIT_PATTERN.search(value)
+                if unit_match:
+                    result["unit"] = unit_match.group(1)
+                return _freeze(result)
+
+        return None
@@ -4,7 +4,7 @@ API客户端示例
 """
 import requests
 import json
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 class NLPClient:
     """NLP服务客户端"""
@@ -28,6 +28,24 @@ class NLPClient:
         except requests.exceptions.RequestException as e:
             return {"success": False, "error": str(e)}
     
+    def process_batch(self, texts: List[str], context: Dict[str, Any] = None,
+                      deadline_ms: Optional[int] = None) -> Dict[str, Any]:
+        """批量处理语音指令，results 与 texts 顺序一致"""
+        url = f"{self.base_url}/process/batch"
+        
+        payload = {
+            "texts": texts,
+            "context": context or {},
+            "deadline_ms": deadline_ms
+        }
+        
+        try:
+            response = requests.post(url, json=payload)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            return {"success": False, "error": str(e)}
+    
     def health_check(self) -> Dict[str, Any]:
         """健康检查"""
         url = f"{self.base_url}/health"
@@ -125,10 +143,15 @@ def demo_batch_processing():
         "完成巡检任务"
     ]
     
+    # 一次请求提交全部任务，结果与任务顺序一致
+    batch = client.process_batch(daily_tasks)
+    if not batch.get("success"):
+        print(f"批量处理失败: {batch.get('error')}")
+        return
+    
     results = []
-    for i, task in enumerate(daily_tasks, 1):
+    for i, (task, result) in enumerate(zip(daily_tasks, batch["results"]), 1):
         print(f"\n任务 {i}: {task}")
-        result = client.process_command(task)
         
         if result.get("success"):
             data = result["result"]
@@ -0,0 +1,276 @@
+"""
+离线大模型替身服务
+兼容OpenAI对话接口（POST /v1/chat/completions），由预置回复或规则引擎生成分析结果，
+可注入延迟分布、错误和格式错误的JSON，支持流式输出，用于无网络、无密钥环境下的延迟和压力测试
+用法:
+    python fake_llm_server.py [端口]
+启动后设置 SILICONFLOW_BASE_URL=http://127.0.0.1:8001/v1，SILICONFLOW_API_KEY 任意填写
+"""
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import socket
+import asyncio
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from loguru import logger
+
+from config import (
+    INTENT_TYPES, FAKE_LLM_PORT, FAKE_LLM_LATENCY_DIST, FAKE_LLM_LATENCY_MS, FAKE_LLM_LATENCY_SIGMA,
+    FAKE_LLM_FIRST_TOKEN_RATIO, FAKE_LLM_CHUNK_SIZE, FAKE_LLM_ERROR_RATE, FAKE_LLM_ERROR_STATUS,
+    FAKE_LLM_MALFORMED_RATE, FAKE_LLM_FIXTURES, FAKE_LLM_SEED
+)
+from intent_classifier import IntentClassifier
+from entity_extractor import EntityExtractor
+from prompt_builder import estimate_tokens
+
+# 延迟分布：fixed 固定值，uniform 在 0 到两倍中位延迟之间均匀分布，lognormal 以中位延迟为中心的长尾分布
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+# 从请求内容识别请求类型
+_ENHANCEMENT_TEXT = re.compile(r'文本："(.*)"')
+_BATCH_LINE = re.compile(r'^\d+\.\s+(".*")$', re.M)
+
+
+class FakeLLMBackend:
+    """按请求内容生成回复，并按配置注入延迟、错误和格式错误"""
+
+    def __init__(self, latency_dist: str = FAKE_LLM_LATENCY_DIST, latency_ms: float = FAKE_LLM_LATENCY_MS,
+                 latency_sigma: float = FAKE_LLM_LATENCY_SIGMA, error_rate: float = FAKE_LLM_ERROR_RATE,
+                 error_status: int = FAKE_LLM_ERROR_STATUS, malformed_rate: float = FAKE_LLM_MALFORMED_RATE,
+                 fixtures_path: str = FAKE_LLM_FIXTURES, seed: int = FAKE_LLM_SEED,
+                 first_token_ratio: float = FAKE_LLM_FIRST_TOKEN_RATIO, chunk_size: int = FAKE_LLM_CHUNK_SIZE):
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"未知的延迟分布: {latency_dist}")
+        self.latency_dist = latency_dist
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.malformed_rate = malformed_rate
+        self.first_token_ratio = first_token_ratio
+        self.chunk_size = max(1, chunk_size)
+        self.fixtures = self.load_fixtures(fixtures_path) if fixtures_path else {}
+
+        self.intent_classifier = IntentClassifier()
+        self.entity_extractor = EntityExtractor()
+
+        # 同一种子下按请求到达顺序得到相同的延迟和注入序列
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.malformed = 0
+
+    @staticmethod
+    def load_fixtures(path: str) -> Dict[str, Any]:
+        """读取预置回复，键为指令文本，值为回复对象"""
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def plan(self) -> Tuple[float, bool, bool]:
+        """为一次请求抽取延迟（秒）以及是否注入错误、是否返回格式错误的JSON"""
+        with self._lock:
+            self.requests += 1
+            if self.latency_dist == "fixed":
+                latency = self.latency_ms
+            elif self.latency_dist == "uniform":
+                latency = self._rng.uniform(0, 2 * self.latency_ms)
+            else:
+                latency = self.latency_ms * math.exp(self._rng.gauss(0, self.latency_sigma))
+            error = self._rng.random() < self.error_rate
+            malformed = not error and self._rng.random() < self.malformed_rate
+            if error:
+                self.errors += 1
+            if malformed:
+                self.malformed += 1
+        return latency / 1000.0, error, malformed
+
+    def analyze(self, text: str, compact: bool = False) -> Dict[str, Any]:
+        """单条指令的分析结果，优先使用预置回复"""
+        if text in self.fixtures:
+            return self.fixtures[text]
+
+        intent = self.intent_classifier.classify_intent(text)
+        spans = self.entity_extractor.extract_spans(text)
+        if compact:
+            return {
+                "i": intent.type,
+                "c": round(intent.confidence, 2),
+                "e": [[span.type, span.value] for span in spans]
+            }
+        structured = {"action": intent.type, "intent_name": INTENT_TYPES.get(intent.type, {}).get("name", "未知")}
+        for span in spans:
+            structured.setdefault(span.type, span.value)
+        return {
+            "intent_type": intent.type,
+            "intent_confidence": round(intent.confidence, 2),
+            "entities": [
+                {"type": span.type, "value": span.value, "start": span.start, "end": span.end}
+                for span in spans
+            ],
+            "reasoning": "由离线替身服务的规则引擎生成",
+            "structured_command": structured
+        }
+
+    def reply(self, messages: List[Dict[str, Any]]) -> str:
+        """根据对话消息生成回复内容：实体补充、批量分析或单条分析"""
+        system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        compact = '"i":' in system
+
+        if "additional_entities" in user:
+            match = _ENHANCEMENT_TEXT.search(user)
+            text = match.group(1) if match else ""
+            entities = [
+                {"type": span.type, "value": span.value, "start": span.start, "end": span.end}
+                for span in self.entity_extractor.extract_spans(text)
+            ]
+            return json.dumps({"additional_entities": entities, "corrections": []}, ensure_ascii=False)
+
+        if "批量模式" in system:
+            texts = [json.loads(line) for line in _BATCH_LINE.findall(user)]
+            items = [dict(self.analyze(text, compact), index=index) for index, text in enumerate(texts, 1)]
+            return json.dumps(items, ensure_ascii=False)
+
+        return json.dumps(self.analyze(user, compact), ensure_ascii=False)
+
+    @staticmethod
+    def corrupt(content: str) -> str:
+        """截断回复，模拟输出被截断或格式错误的JSON"""
+        return content[:max(1, len(content) // 2)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "malformed": self.malformed,
+                "latency_dist": self.latency_dist,
+                "latency_ms": self.latency_ms
+            }
+
+
+def _completion(model: str, content: str, prompt: str) -> Dict[str, Any]:
+    prompt_tokens = estimate_tokens(prompt)
+    completion_tokens = estimate_tokens(content)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+
+def _chunk(completion_id: str, model: str, delta: Dict[str, str], finish_reason: Optional[str] = None) -> str:
+    data = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def create_app(backend: Optional[FakeLLMBackend] = None) -> FastAPI:
+    """创建替身服务应用"""
+    backend = backend or FakeLLMBackend()
+    app = FastAPI(title="离线大模型替身服务", version="1.0.0")
+    app.state.backend = backend
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "fake-llm")
+        latency, error, malformed = backend.plan()
+
+        if error:
+            await asyncio.sleep(latency)
+            return JSONResponse(
+                status_code=backend.error_status,
+                content={"error": {"message": "injected error", "type": "server_error", "code": backend.error_status}}
+            )
+
+        content = backend.reply(messages)
+        if malformed:
+            content = backend.corrupt(content)
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            prompt = "".join(str(m.get("content", "")) for m in messages)
+            return _completion(model, content, prompt)
+
+        async def events() -> Iterable[str]:
+            # 首个分片在 first_token_ratio 比例的延迟后到达，其余延迟平均分摊到后续分片
+            pieces = [content[i:i + backend.chunk_size] for i in range(0, len(content), backend.chunk_size)]
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            await asyncio.sleep(latency * backend.first_token_ratio)
+            yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+            interval = latency * (1 - backend.first_token_ratio) / max(1, len(pieces) - 1)
+            for index, piece in enumerate(pieces):
+                if index:
+                    await asyncio.sleep(interval)
+                yield _chunk(completion_id, model, {"content": piece})
+            yield _chunk(completion_id, model, {}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return backend.stats()
+
+    return app
+
+
+def start_in_thread(backend: Optional[FakeLLMBackend] = None, host: str = "127.0.0.1",
+                    port: int = 0) -> Tuple[uvicorn.Server, str]:
+    """在后台线程启动替身服务，port 为0时使用空闲端口，返回服务和 base_url"""
+    # 指定IPPROTO_TCP，事件循环才会为接受的连接关闭Nagle算法
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(create_app(backend), log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("替身服务启动失败")
+        time.sleep(0.01)
+    return server, f"http://{host}:{port}/v1"
+
+
+def main(argv: Iterable[str] = None):
+    args = list(argv if argv is not None else sys.argv[1:])
+    if len(args) > 1 or (args and not args[0].isdigit()):
+        print(__doc__)
+        sys.exit(1)
+    port = int(args[0]) if args else FAKE_LLM_PORT
+    logger.info(f"Starting fake LLM server on port {port}")
+    uvicorn.run(create_app(), host="127.0.0.1", port=port)
+
+
+if __name__ == "__main__":
+    main()
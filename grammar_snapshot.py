@@ -0,0 +1,114 @@
+"""
+语法快照模块
+把编译好的匹配器和标准化查找表序列化为带版本的快照文件，工作进程启动时直接加载
+用法: python grammar_snapshot.py build [输出路径]
+"""
+import os
+import sys
+import json
+import pickle
+import hashlib
+import tempfile
+from typing import Any, Dict, Optional
+from loguru import logger
+
+from config import (
+    INTENT_TYPES, INTENT_RULES, ENTITY_TYPES, LOCATION_MAPPING, EQUIPMENT_MAPPING, PARAMETER_UNIT_MAPPING,
+    GRAMMAR_SNAPSHOT_DIR
+)
+
+# 快照格式版本，内部结构变化时递增
+SNAPSHOT_VERSION = 2
+
+
+def grammar_fingerprint() -> str:
+    """根据意图、实体及映射配置计算指纹，配置变化时快照自动失效"""
+    grammar = {
+        "version": SNAPSHOT_VERSION,
+        "intent_types": INTENT_TYPES,
+        "intent_rules": INTENT_RULES,
+        "entity_types": ENTITY_TYPES,
+        "location_mapping": LOCATION_MAPPING,
+        "equipment_mapping": EQUIPMENT_MAPPING,
+        "parameter_unit_mapping": PARAMETER_UNIT_MAPPING
+    }
+    payload = json.dumps(grammar, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def snapshot_path(directory: str = GRAMMAR_SNAPSHOT_DIR) -> str:
+    """当前配置对应的快照文件路径"""
+    return os.path.join(directory, f"grammar-v{SNAPSHOT_VERSION}-{grammar_fingerprint()}.pkl")
+
+
+def build_snapshot(path: Optional[str] = None, entity_extractor: Optional[Any] = None,
+                   intent_classifier: Optional[Any] = None) -> str:
+    """编译语法并写入快照文件，返回文件路径
+
+    可以传入已加载现场词表的抽取器，把自定义关键词一并写入快照。
+    """
+    from entity_extractor import EntityExtractor
+    from intent_classifier import IntentClassifier
+
+    path = path or snapshot_path()
+    extractor = entity_extractor or EntityExtractor()
+    classifier = intent_classifier or IntentClassifier()
+
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": grammar_fingerprint(),
+        "entity_extractor": extractor.export_state(),
+        "intent_classifier": classifier.export_state()
+    }
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    # 先写临时文件再替换，避免其他进程读到不完整的快照
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    logger.info(f"Grammar snapshot written to {path}")
+    return path
+
+
+def load_snapshot(path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """加载快照，文件不存在或与当前配置不匹配时返回None"""
+    path = path or snapshot_path()
+    if not os.path.isfile(path):
+        logger.debug(f"Grammar snapshot not found: {path}")
+        return None
+
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Failed to load grammar snapshot {path}: {e}")
+        return None
+
+    if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("fingerprint") != grammar_fingerprint():
+        logger.warning(f"Grammar snapshot {path} does not match current configuration, ignoring")
+        return None
+
+    logger.info(f"Loaded grammar snapshot {path}")
+    return snapshot
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != "build":
+        print("用法: python grammar_snapshot.py build [输出路径]")
+        sys.exit(1)
+
+    path = build_snapshot(sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"语法快照已生成: {path}")
+
+
+if __name__ == "__main__":
+    main()
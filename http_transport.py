@@ -0,0 +1,48 @@
+"""
+大模型HTTP传输模块
+创建带连接池上限和keep-alive的HTTP客户端，并提供带抖动的指数退避重试
+"""
+import random
+from typing import Tuple, Type
+
+import httpx
+import openai
+
+from config import (
+    LLM_TIMEOUT, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_KEEPALIVE_EXPIRY,
+    LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY
+)
+
+# 连接失败、超时、限流和服务端错误可以重试，请求参数或鉴权错误重试无意义
+RETRYABLE_ERRORS: Tuple[Type[Exception], ...] = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+
+# 流式读取中途的错误：连接建立后的读取超时、连接中断，以及上游在流中返回的错误事件
+STREAM_ERRORS: Tuple[Type[Exception], ...] = (openai.APIError, httpx.TransportError)
+
+
+def connection_limits() -> "httpx.Limits":
+    """连接池上限和keep-alive连接的空闲保留时间"""
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+    )
+
+
+def create_http_client(timeout: float = LLM_TIMEOUT) -> "httpx.Client":
+    """同步调用共用的连接池"""
+    return openai.DefaultHttpxClient(limits=connection_limits(), timeout=timeout)
+
+
+def create_async_http_client(timeout: float = LLM_TIMEOUT) -> "httpx.AsyncClient":
+    """异步调用共用的连接池"""
+    return openai.DefaultAsyncHttpxClient(limits=connection_limits(), timeout=timeout)
+
+
+def retry_delay(attempt: int, base: float = LLM_RETRY_BASE_DELAY, cap: float = LLM_RETRY_MAX_DELAY) -> float:
+    """第 attempt 次重试前的等待时间（秒），在指数退避上限内均匀抖动，避免同时重试"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
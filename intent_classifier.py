@@ -2,92 +2,84 @@
 意图识别模块
 使用关键词匹配和大模型结合的方式识别用户意图
 """
-import re
-from typing import Dict, List, Tuple, Optional
+import os
+from typing import Any, Dict, Iterable, List, Tuple, Optional
 from loguru import logger
 
 from models import Intent
-from config import INTENT_TYPES
+from config import (
+    INTENT_TYPES, INTENT_RULES, NGRAM_MODEL_PATH,
+    NGRAM_RULE_CONFIDENCE_THRESHOLD, NGRAM_MODEL_MIN_CONFIDENCE
+)
+from intent_engine import IntentRuleEngine
 
 class IntentClassifier:
     """意图分类器"""
     
-    def __init__(self):
+    # 关键词和规则得分的融合权重
+    KEYWORD_WEIGHT = 0.6
+    RULE_WEIGHT = 0.4
+    
+    def __init__(self, snapshot: Optional[Dict[str, Any]] = None, ngram_model: Optional[Any] = None):
         self.intent_types = INTENT_TYPES
+        self.intent_rules = INTENT_RULES
         
-    def classify_intent_keywords(self, text: str) -> List[Tuple[str, float]]:
-        """基于关键词匹配的意图识别"""
-        intent_scores = {}
+        # 关键词和规则编译为一个引擎，一次扫描完成打分
+        if snapshot:
+            self.engine = IntentRuleEngine.from_state(snapshot["engine"])
+        else:
+            self.engine = IntentRuleEngine(self.intent_types, self.intent_rules)
         
-        text_lower = text.lower()
+        # 可选的字符n-gram模型，规则不够确定时作为补充
+        if ngram_model is None and NGRAM_MODEL_PATH and os.path.exists(NGRAM_MODEL_PATH):
+            from ngram_intent_model import load_model  # 仅配置了模型时需要numpy
+            ngram_model = load_model(NGRAM_MODEL_PATH)
+        self.ngram_model = ngram_model
+    
+    def export_state(self) -> Dict[str, Any]:
+        """导出编译结果，用于生成语法快照"""
+        return {"engine": self.engine.export_state()}
         
-        for intent_type, config in self.intent_types.items():
-            score = 0.0
-            matched_keywords = 0
-            
-            # 检查关键词匹配
-            for keyword in config["keywords"]:
-                if keyword in text or keyword in text_lower:
-                    score += 1.0
-                    matched_keywords += 1
-            
-            # 根据匹配的关键词数量计算置信度
-            if matched_keywords > 0:
-                confidence = min(0.9, score / len(config["keywords"]) + 0.3)
-                intent_scores[intent_type] = confidence
-        
-        # 按置信度排序
-        sorted_intents = sorted(intent_scores.items(), key=lambda x: x[1], reverse=True)
-        return sorted_intents
+    def classify_intent_keywords(self, text: str) -> List[Tuple[str, float]]:
+        """基于关键词匹配的意图识别"""
+        keyword_results, _ = self.engine.score(text)
+        return keyword_results
     
     def classify_intent_rules(self, text: str) -> List[Tuple[str, float]]:
         """基于规则的意图识别"""
-        intent_scores = {}
-        
-        # 巡检相关规则
-        if re.search(r'巡检|检查|监测|查看.*?(温度|湿度|电压|电流)', text):
-            intent_scores["patrol_inspection"] = 0.95
-        
-        # 设备控制相关规则
-        if re.search(r'(开启|关闭|启动|停止|调节|设置).*?(设备|主柜|副柜|UPS|空调)', text):
-            intent_scores["equipment_control"] = 0.95
-        
-        # 状态查询相关规则
-        if re.search(r'(查询|状态|显示|报告).*?(设备|主柜|副柜)', text):
-            intent_scores["status_query"] = 0.9
-        
-        # 报警处理相关规则
-        if re.search(r'(报警|警报|确认|处理|消除)', text):
-            intent_scores["alarm_handling"] = 0.9
-        
-        # 导航移动相关规则
-        if re.search(r'(前往|移动|到达|回到|导航).*?([A-Z]区|\d+号房)', text):
-            intent_scores["navigation"] = 0.9
-        
-        sorted_intents = sorted(intent_scores.items(), key=lambda x: x[1], reverse=True)
-        return sorted_intents
+        _, rule_results = self.engine.score(text)
+        return rule_results
     
-    def classify_intent(self, text: str) -> Intent:
-        """综合意图识别"""
-        # 基于关键词的识别
-        keyword_results = self.classify_intent_keywords(text)
-        
-        # 基于规则的识别
-        rule_results = self.classify_intent_rules(text)
+    def _combined_scores(self, text: str) -> Dict[str, float]:
+        """融合关键词和规则得分"""
+        # 一次扫描同时得到关键词和规则的识别结果
+        keyword_results, rule_results = self.engine.score(text)
         
         # 合并结果
         combined_scores = {}
         
         # 添加关键词结果
         for intent_type, score in keyword_results:
-            combined_scores[intent_type] = score * 0.6  # 关键词权重0.6
+            combined_scores[intent_type] = score * self.KEYWORD_WEIGHT
         
         # 添加规则结果
         for intent_type, score in rule_results:
             if intent_type in combined_scores:
-                combined_scores[intent_type] += score * 0.4  # 规则权重0.4
+                combined_scores[intent_type] += score * self.RULE_WEIGHT
             else:
-                combined_scores[intent_type] = score * 0.4
+                combined_scores[intent_type] = score * self.RULE_WEIGHT
+        
+        return combined_scores
+    
+    def candidate_intents(self, text: str, top_k: int) -> List[str]:
+        """得分最高的前 top_k 个意图，用于精简大模型提示词"""
+        combined_scores = self._combined_scores(text)
+        ranked = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)
+        return [intent_type for intent_type, _ in ranked[:top_k]]
+    
+    def classify_intent(self, text: str) -> Intent:
+        """综合意图识别"""
+        combined_scores = self._combined_scores(text)
         
         # 找到最高分的意图
         if combined_scores:
@@ -109,9 +101,146 @@ class IntentClassifier:
                 description="无法识别的意图"
             )
         
+        intent = self._apply_ngram_model(text, intent)
+        
         logger.info(f"Classified intent: {intent.type} ({intent.name}) with confidence {intent.confidence:.2f}")
         return intent
     
+    def _apply_ngram_model(self, text: str, intent: Intent) -> Intent:
+        """规则置信度不足时参考n-gram模型，模型足够确定且高于规则置信度时采用模型结果"""
+        if self.ngram_model is None or intent.confidence >= NGRAM_RULE_CONFIDENCE_THRESHOLD:
+            return intent
+        
+        intent_type, confidence = self.ngram_model.predict(text)
+        if intent_type not in self.intent_types:
+            return intent
+        if confidence < NGRAM_MODEL_MIN_CONFIDENCE or confidence <= intent.confidence:
+            return intent
+        
+        logger.debug(f"N-gram model overrides {intent.type} with {intent_type} ({confidence:.2f})")
+        return Intent(
+            type=intent_type,
+            name=self.intent_types[intent_type]["name"],
+            confidence=confidence,
+            description=self.intent_types[intent_type]["description"]
+        )
+    
+    def intent_feature_matrices(self, texts: Iterable[str]) -> Dict[str, Any]:
+        """批量计算关键词置信度和规则得分矩阵（文本 × 意图），供批量打分和阈值调优使用
+        
+        返回的字典包含 keyword、rule 两个得分矩阵，keyword_present、rule_present 两个命中掩码，
+        以及用于平分时排序的 first_rule（各意图首个命中规则的编号）。
+        """
+        import numpy as np  # 仅批量接口需要numpy
+        
+        engine = self.engine
+        texts = list(texts)
+        rule_total = len(engine.rules)
+        intent_index = {name: index for index, name in enumerate(engine.intent_names)}
+        
+        # 关键词命中以坐标形式记录（稀疏），规则数量少，直接用布尔矩阵
+        hit_rows: List[int] = []
+        hit_keywords: List[int] = []
+        rule_hits = np.zeros((len(texts), rule_total), dtype=bool)
+        for row, text in enumerate(texts):
+            matched_keywords, matched_rules = engine.match(text)
+            if matched_keywords:
+                hit_rows.extend([row] * len(matched_keywords))
+                hit_keywords.extend(matched_keywords)
+            if matched_rules:
+                rule_hits[row, matched_rules] = True
+        
+        # 按关键词归属的意图累加，得到每个意图命中的关键词数量（文本 × 意图）
+        counts = np.zeros((len(texts), len(engine.intent_names)), dtype=np.float64)
+        if hit_rows:
+            keyword_intents = np.asarray(engine.keyword_intents, dtype=np.int64)
+            np.add.at(counts, (np.asarray(hit_rows), keyword_intents[np.asarray(hit_keywords)]), 1.0)
+        
+        keyword_counts = np.maximum(np.array(engine.keyword_counts, dtype=np.float64), 1.0)
+        keyword_present = counts > 0
+        keyword_scores = np.where(keyword_present, np.minimum(0.9, counts / keyword_counts + 0.3), 0.0)
+        
+        # 规则按顺序覆盖，与逐条计分的语义一致
+        rule_scores = np.zeros_like(keyword_scores)
+        rule_present = np.zeros(keyword_scores.shape, dtype=bool)
+        first_rule = np.full(keyword_scores.shape, rule_total, dtype=np.int64)
+        for rule_index, (intent_type, score) in enumerate(engine.rules):
+            column = intent_index.get(intent_type)
+            if column is None:
+                continue
+            hit = rule_hits[:, rule_index]
+            rule_scores[hit, column] = score
+            first_rule[hit & ~rule_present[:, column], column] = rule_index
+            rule_present[:, column] |= hit
+        
+        return {
+            "keyword": keyword_scores,
+            "rule": rule_scores,
+            "keyword_present": keyword_present,
+            "rule_present": rule_present,
+            "first_rule": first_rule
+        }
+    
+    def score_intent_batch(self, texts: Iterable[str], keyword_weight: Optional[float] = None,
+                           rule_weight: Optional[float] = None) -> Tuple[Any, List[str]]:
+        """批量计算融合得分矩阵（文本 × 意图），未命中的意图为0"""
+        features = self.intent_feature_matrices(texts)
+        combined = self._combine_features(features, keyword_weight, rule_weight)
+        return combined, list(self.engine.intent_names)
+    
+    def _combine_features(self, features: Dict[str, Any], keyword_weight: Optional[float],
+                          rule_weight: Optional[float]) -> Any:
+        keyword_weight = self.KEYWORD_WEIGHT if keyword_weight is None else keyword_weight
+        rule_weight = self.RULE_WEIGHT if rule_weight is None else rule_weight
+        return features["keyword"] * keyword_weight + features["rule"] * rule_weight
+    
+    def classify_intent_batch(self, texts: Iterable[str], chunk_size: int = 4096) -> List[Intent]:
+        """批量意图识别，结果与逐条调用 classify_intent 一致"""
+        import numpy as np  # 仅批量接口需要numpy
+        
+        texts = list(texts)
+        intent_names = self.engine.intent_names
+        results = []
+        
+        for offset in range(0, len(texts), chunk_size):
+            features = self.intent_feature_matrices(texts[offset:offset + chunk_size])
+            combined = self._combine_features(features, None, None)
+            keyword_scores = features["keyword"]
+            keyword_present = features["keyword_present"]
+            present = keyword_present | features["rule_present"]
+            
+            # 平分时与逐条计分相同：先比较关键词置信度（取配置中靠前的意图），其次取规则顺序靠前的意图
+            masked = np.where(present, combined, -np.inf)
+            best = masked.max(axis=1)
+            tied = present & (masked == best[:, None])
+            tied_keyword = np.where(tied & keyword_present, keyword_scores, -1.0)
+            best_keyword = tied_keyword.max(axis=1)
+            keyword_choice = np.argmax(tied_keyword == best_keyword[:, None], axis=1)
+            rule_choice = np.argmin(np.where(tied, features["first_rule"], np.iinfo(np.int64).max), axis=1)
+            choice = np.where(best_keyword >= 0, keyword_choice, rule_choice)
+            has_intent = present.any(axis=1)
+            
+            for row in range(len(combined)):
+                if has_intent[row]:
+                    intent_type = intent_names[choice[row]]
+                    intent = Intent(
+                        type=intent_type,
+                        name=self.intent_types[intent_type]["name"],
+                        confidence=float(combined[row, choice[row]]),
+                        description=self.intent_types[intent_type]["description"]
+                    )
+                else:
+                    intent = Intent(
+                        type="unknown",
+                        name="未知意图",
+                        confidence=0.1,
+                        description="无法识别的意图"
+                    )
+                results.append(self._apply_ngram_model(texts[offset + row], intent))
+        
+        logger.info(f"Classified {len(results)} intents in batch")
+        return results
+    
     def validate_intent_entities(self, intent_type: str, entities: List[Dict[str, str]]) -> Tuple[bool, List[str]]:
         """验证意图所需的实体是否完整"""
         if intent_type not in self.intent_types:
@@ -0,0 +1,337 @@
+"""
+意图规则引擎
+把意图关键词和规则正则编译为一个关键词自动机，一次扫描同时更新所有意图的得分
+"""
+import re
+from bisect import bisect_right
+from itertools import product
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from keyword_automaton import KeywordAutomaton
+
+# 单个规则片段允许展开的最大字面量数量，超出时该规则回退为正则匹配
+MAX_SEGMENT_EXPANSION = 256
+
+# 片段项：(前导数字个数, 字面量, 后缀数字个数)
+Term = Tuple[int, str, int]
+
+
+class UnsupportedPattern(Exception):
+    """规则正则超出引擎可编译的子集"""
+
+
+def _expand_items(items) -> List[List[Any]]:
+    """把正则语法树序列展开为若干候选，候选由字符和数字占位（int，表示最少个数）组成"""
+    alternatives: List[List[Any]] = [[]]
+    for op, av in items:
+        expansions = _expand_item(op, av)
+        alternatives = [left + right for left, right in product(alternatives, expansions)]
+        if len(alternatives) > MAX_SEGMENT_EXPANSION:
+            raise UnsupportedPattern("too many alternatives")
+    return alternatives
+
+
+def _expand_item(op, av) -> List[List[Any]]:
+    if op == sre_constants.LITERAL:
+        return [[chr(av)]]
+
+    if op == sre_constants.IN:
+        if av == [(sre_constants.CATEGORY, sre_constants.CATEGORY_DIGIT)]:
+            return [[1]]
+        chars = []
+        for item_op, item_av in av:
+            if item_op == sre_constants.LITERAL:
+                chars.append(chr(item_av))
+            elif item_op == sre_constants.RANGE:
+                chars.extend(chr(code) for code in range(item_av[0], item_av[1] + 1))
+            else:
+                raise UnsupportedPattern(f"character class item {item_op}")
+            if len(chars) > MAX_SEGMENT_EXPANSION:
+                raise UnsupportedPattern("character class too large")
+        return [[char] for char in chars]
+
+    if op == sre_constants.SUBPATTERN:
+        _, add_flags, del_flags, pattern = av
+        if add_flags or del_flags:
+            raise UnsupportedPattern("inline flags")
+        return _expand_items(pattern)
+
+    if op == sre_constants.BRANCH:
+        alternatives = []
+        for branch in av[1]:
+            alternatives.extend(_expand_items(branch))
+        return alternatives
+
+    if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+        min_count, max_count, pattern = av
+        if list(pattern) == [(sre_constants.IN, [(sre_constants.CATEGORY, sre_constants.CATEGORY_DIGIT)])]:
+            # 只关心是否存在，数字重复只需满足最少个数
+            return [[min_count]] if min_count else [[]]
+        if max_count > 2:
+            raise UnsupportedPattern("unbounded repeat")
+        inner = _expand_items(pattern)
+        alternatives = []
+        for count in range(min_count, max_count + 1):
+            for combination in product(inner, repeat=count):
+                alternatives.append([atom for part in combination for atom in part])
+        return alternatives
+
+    raise UnsupportedPattern(f"operator {op}")
+
+
+def _to_terms(alternatives: List[List[Any]]) -> List[Term]:
+    """把展开后的候选转换为 (前导数字, 字面量, 后缀数字) 形式"""
+    terms = []
+    for atoms in alternatives:
+        lead = 0
+        while atoms and isinstance(atoms[0], int):
+            lead += atoms.pop(0)
+        trail = 0
+        while atoms and isinstance(atoms[-1], int):
+            trail += atoms.pop()
+        if not atoms or any(isinstance(atom, int) for atom in atoms):
+            raise UnsupportedPattern("digit class must surround a literal")
+        terms.append((lead, "".join(atoms), trail))
+    return terms
+
+
+def _is_gap(op, av) -> bool:
+    """是否为 .* 或 .*? 形式的任意间隔"""
+    return (op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+            and av[0] == 0 and av[1] == sre_constants.MAXREPEAT
+            and list(av[2]) == [(sre_constants.ANY, None)])
+
+
+def compile_rule(pattern: str) -> List[List[List[Term]]]:
+    """把规则正则编译为 分支 -> 片段 -> 片段项 的结构
+
+    一个分支匹配当且仅当各片段按顺序出现在同一行中，后一片段的起点不早于前一片段的终点，
+    与 re.search 的结果一致。无法编译时抛出 UnsupportedPattern。
+    """
+    parsed = sre_parse.parse(pattern)
+    if parsed.state.flags & ~re.UNICODE:
+        raise UnsupportedPattern("flags")
+
+    items = list(parsed)
+    if len(items) == 1 and items[0][0] == sre_constants.BRANCH:
+        branch_items = [list(branch) for branch in items[0][1][1]]
+    else:
+        branch_items = [items]
+
+    branches = []
+    for branch in branch_items:
+        segments = []
+        current = []
+        for op, av in branch:
+            if _is_gap(op, av):
+                if current:
+                    segments.append(current)
+                current = []
+            else:
+                current.append((op, av))
+        if current:
+            segments.append(current)
+        if not segments:
+            raise UnsupportedPattern("empty branch")
+        branches.append([_to_terms(_expand_items(segment)) for segment in segments])
+    return branches
+
+
+class IntentRuleEngine:
+    """意图规则引擎"""
+
+    def __init__(self, intent_types: Dict[str, Dict[str, Any]], rules: List[Dict[str, Any]]):
+        self.intent_names = list(intent_types)
+        self.keyword_counts = [len(config["keywords"]) for config in intent_types.values()]
+        self.rules = [(rule["intent"], rule["score"]) for rule in rules]
+
+        self.automaton = KeywordAutomaton(case_sensitive=True)
+        term_ids: Dict[str, int] = {}
+        # 每个字面量对应的关键词编号，以及所属的 (规则, 分支, 片段, 前导数字, 后缀数字)
+        self.term_keywords: List[List[int]] = []
+        self.term_segments: List[List[Tuple[int, int, int, int, int]]] = []
+
+        def term_id(literal: str) -> int:
+            if literal not in term_ids:
+                term_ids[literal] = len(term_ids)
+                self.term_keywords.append([])
+                self.term_segments.append([])
+                self.automaton.add(literal, term_ids[literal])
+            return term_ids[literal]
+
+        # 关键词编号 -> 意图下标；含大小写字母的关键词需同时检查小写文本，单独处理
+        self.keyword_intents: List[int] = []
+        self.cased_keywords: List[Tuple[int, str]] = []
+        for intent_index, config in enumerate(intent_types.values()):
+            for keyword in config["keywords"]:
+                keyword_id = len(self.keyword_intents)
+                self.keyword_intents.append(intent_index)
+                if keyword.lower() == keyword.upper():
+                    self.term_keywords[term_id(keyword)].append(keyword_id)
+                else:
+                    self.cased_keywords.append((keyword_id, keyword))
+
+        # 规则编号 -> 分支片段数量；无法编译的规则回退为正则匹配
+        self.rule_branches: List[Optional[List[int]]] = []
+        self.fallback_rules: Dict[int, re.Pattern] = {}
+        for rule_index, rule in enumerate(rules):
+            try:
+                branches = compile_rule(rule["pattern"])
+            except (UnsupportedPattern, re.error) as e:
+                logger.debug(f"Intent rule {rule['pattern']} falls back to regex: {e}")
+                self.fallback_rules[rule_index] = re.compile(rule["pattern"])
+                self.rule_branches.append(None)
+                continue
+
+            self.rule_branches.append([len(segments) for segments in branches])
+            for branch_index, segments in enumerate(branches):
+                for segment_index, terms in enumerate(segments):
+                    for lead, literal, trail in terms:
+                        self.term_segments[term_id(literal)].append(
+                            (rule_index, branch_index, segment_index, lead, trail)
+                        )
+
+        self.automaton.build()
+
+    def score(self, text: str) -> Tuple[List[Tuple[str, float]], List[Tuple[str, float]]]:
+        """一次扫描计算关键词得分和规则得分，均按置信度从高到低排序"""
+        matched_keywords, matched_rules = self.match(text)
+        return self._keyword_scores(matched_keywords), self._rule_scores(matched_rules)
+
+    def match(self, text: str) -> Tuple[set, List[int]]:
+        """一次扫描返回命中的关键词编号集合和按顺序排列的命中规则编号"""
+        matched_keywords = set()
+        # (规则, 分支) -> 各片段的出现位置 [(start, end)]
+        occurrences: Dict[Tuple[int, int], Dict[int, List[Tuple[int, int]]]] = {}
+
+        term_keywords = self.term_keywords
+        term_segments = self.term_segments
+        for start, end, term in self.automaton.find_all(text):
+            if term_keywords[term]:
+                matched_keywords.update(term_keywords[term])
+            for rule_index, branch_index, segment_index, lead, trail in term_segments[term]:
+                if lead and (start < lead or not text[start - lead:start].isdecimal()):
+                    continue
+                if trail and (end + trail > len(text) or not text[end:end + trail].isdecimal()):
+                    continue
+                occurrences.setdefault((rule_index, branch_index), {}).setdefault(segment_index, []).append(
+                    (start - lead, end + trail)
+                )
+
+        if self.cased_keywords:
+            text_lower = text.lower()
+            for keyword_id, keyword in self.cased_keywords:
+                if keyword in text or keyword in text_lower:
+                    matched_keywords.add(keyword_id)
+
+        return matched_keywords, self._match_rules(text, occurrences)
+
+    def _keyword_scores(self, matched_keywords) -> List[Tuple[str, float]]:
+        """根据匹配的关键词数量计算置信度"""
+        counts: Dict[int, int] = {}
+        for keyword_id in matched_keywords:
+            intent_index = self.keyword_intents[keyword_id]
+            counts[intent_index] = counts.get(intent_index, 0) + 1
+
+        intent_scores = {}
+        for intent_index in sorted(counts):
+            confidence = min(0.9, counts[intent_index] / self.keyword_counts[intent_index] + 0.3)
+            intent_scores[self.intent_names[intent_index]] = confidence
+
+        return sorted(intent_scores.items(), key=lambda x: x[1], reverse=True)
+
+    def _match_rules(self, text: str, occurrences) -> List[int]:
+        """判断哪些规则命中，返回按规则顺序排列的编号"""
+        line_starts = None
+        if "\n" in text:
+            line_starts = [0] + [index + 1 for index, char in enumerate(text) if char == "\n"]
+
+        candidate_rules = {rule_index for rule_index, _ in occurrences}
+        candidate_rules.update(self.fallback_rules)
+
+        matched_rules = []
+        for rule_index in sorted(candidate_rules):
+            if rule_index in self.fallback_rules:
+                matched = self.fallback_rules[rule_index].search(text) is not None
+            else:
+                matched = any(
+                    self._branch_matches(occurrences.get((rule_index, branch_index)), segment_count, line_starts)
+                    for branch_index, segment_count in enumerate(self.rule_branches[rule_index])
+                )
+            if matched:
+                matched_rules.append(rule_index)
+
+        return matched_rules
+
+    def _rule_scores(self, matched_rules: List[int]) -> List[Tuple[str, float]]:
+        """按规则顺序计分，后命中的规则覆盖同一意图的得分"""
+        intent_scores = {}
+        for rule_index in matched_rules:
+            intent_type, score = self.rules[rule_index]
+            intent_scores[intent_type] = score
+
+        return sorted(intent_scores.items(), key=lambda x: x[1], reverse=True)
+
+    @staticmethod
+    def _branch_matches(segments: Optional[Dict[int, List[Tuple[int, int]]]], segment_count: int,
+                        line_starts: Optional[List[int]]) -> bool:
+        """各片段能否在同一行内依次出现"""
+        if not segments or len(segments) < segment_count:
+            return False
+
+        # 每行内已匹配片段的最早终点
+        earliest_end: Dict[int, int] = {}
+        for start, end in segments[0]:
+            line = bisect_right(line_starts, start) if line_starts else 0
+            if end < earliest_end.get(line, end + 1):
+                earliest_end[line] = end
+
+        for segment_index in range(1, segment_count):
+            next_end: Dict[int, int] = {}
+            for start, end in segments[segment_index]:
+                line = bisect_right(line_starts, start) if line_starts else 0
+                if line in earliest_end and start >= earliest_end[line] and end < next_end.get(line, end + 1):
+                    next_end[line] = end
+            if not next_end:
+                return False
+            earliest_end = next_end
+
+        return True
+
+    def export_state(self) -> Dict[str, Any]:
+        """导出编译结果，用于语法快照"""
+        return {
+            "intent_names": self.intent_names,
+            "keyword_counts": self.keyword_counts,
+            "rules": self.rules,
+            "automaton": self.automaton.export_state(),
+            "term_keywords": self.term_keywords,
+            "term_segments": self.term_segments,
+            "keyword_intents": self.keyword_intents,
+            "cased_keywords": self.cased_keywords,
+            "rule_branches": self.rule_branches,
+            "fallback_rules": {index: pattern.pattern for index, pattern in self.fallback_rules.items()}
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "IntentRuleEngine":
+        """从语法快照恢复"""
+        engine = cls.__new__(cls)
+        engine.intent_names = state["intent_names"]
+        engine.keyword_counts = state["keyword_counts"]
+        engine.rules = state["rules"]
+        engine.automaton = KeywordAutomaton.from_state(state["automaton"])
+        engine.term_keywords = state["term_keywords"]
+        engine.term_segments = state["term_segments"]
+        engine.keyword_intents = state["keyword_intents"]
+        engine.cased_keywords = state["cased_keywords"]
+        engine.rule_branches = state["rule_branches"]
+        engine.fallback_rules = {index: re.compile(pattern) for index, pattern in state["fallback_rules"].items()}
+        return engine
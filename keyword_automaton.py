@@ -0,0 +1,127 @@
+"""
+关键词自动机模块
+基于Aho-Corasick算法的多模式匹配，一次线性扫描返回全部命中
+"""
+from collections import deque
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+class KeywordAutomaton:
+    """Aho-Corasick多模式匹配自动机"""
+
+    def __init__(self, case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        # 状态转移表和失配指针，下标为状态编号，0为根状态
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每个状态自身对应的关键词，以及构建后合并了后缀状态的完整输出
+        self._keywords: List[List[Tuple[int, Any]]] = [[]]
+        self._output: List[List[Tuple[int, Any]]] = [[]]
+        self._keyword_count = 0
+        self._built = True
+
+    def __len__(self) -> int:
+        return self._keyword_count
+
+    def add(self, keyword: str, payload: Any) -> None:
+        """添加关键词及其附带数据（同一关键词可以对应多个payload）"""
+        if not keyword:
+            return
+        if not self.case_sensitive:
+            keyword = keyword.lower()
+
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._keywords.append([])
+            state = next_state
+
+        self._keywords[state].append((len(keyword), payload))
+        self._keyword_count += 1
+        self._built = False
+
+    def add_many(self, items: Iterable[Tuple[str, Any]]) -> None:
+        """批量添加关键词"""
+        for keyword, payload in items:
+            self.add(keyword, payload)
+
+    def build(self) -> None:
+        """构建失配指针，并把后缀状态的输出合并到当前状态"""
+        output = [list(keywords) for keywords in self._keywords]
+
+        # 按BFS顺序处理，保证失配状态的指针和输出先于当前状态完成
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(char, 0)
+                output[next_state].extend(output[self._fail[next_state]])
+                queue.append(next_state)
+
+        self._output = output
+        self._built = True
+
+    def find_all(self, text: str) -> List[Tuple[int, int, Any]]:
+        """扫描文本，返回所有命中 (start, end, payload)，按结束位置排序"""
+        if not self._built:
+            self.build()
+
+        if not self.case_sensitive:
+            lowered = text.lower()
+            # 个别字符小写后长度会变化，此时逐字符转换以保持位置对应
+            if len(lowered) != len(text):
+                lowered = "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+            text = lowered
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        matches = []
+
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                end = index + 1
+                for length, payload in output[state]:
+                    matches.append((end - length, end, payload))
+
+        return matches
+
+    def export_state(self) -> Dict[str, Any]:
+        """导出已构建的自动机状态，用于快照"""
+        if not self._built:
+            self.build()
+        return {
+            "case_sensitive": self.case_sensitive,
+            "goto": self._goto,
+            "fail": self._fail,
+            "keywords": self._keywords,
+            "output": self._output,
+            "keyword_count": self._keyword_count
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "KeywordAutomaton":
+        """从快照状态恢复自动机，无需重新构建"""
+        automaton = cls(case_sensitive=state["case_sensitive"])
+        automaton._goto = state["goto"]
+        automaton._fail = state["fail"]
+        automaton._keywords = state["keywords"]
+        automaton._output = state["output"]
+        automaton._keyword_count = state["keyword_count"]
+        return automaton
@@ -0,0 +1,89 @@
+"""
+大模型微批处理模块
+在短时间窗口内收集异步请求，合并为一次批量分析，再把结果分发给各个调用方
+"""
+import asyncio
+from typing import Any, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from config import LLM_BATCH_WINDOW_MS, LLM_BATCH_MAX_SIZE
+
+
+class LLMBatcher:
+    """按时间窗口或条数上限合并大模型请求"""
+
+    def __init__(self, client: Any, window_ms: float = LLM_BATCH_WINDOW_MS, max_size: int = LLM_BATCH_MAX_SIZE):
+        # client 需要提供 aanalyze_commands_batch(texts)
+        self.client = client
+        self.window = window_ms / 1000.0
+        self.max_size = max_size
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 事件循环只保留任务的弱引用，发送中的批次需要在这里持有
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, text: str) -> Any:
+        """提交一条指令，等待所在批次的分析结果"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 切换事件循环时丢弃旧循环上的状态
+            self._pending = []
+            self._timer = None
+            self._tasks = set()
+            self._loop = loop
+
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """发送当前窗口内收集的指令"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            task = self._loop.create_task(self._run(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending: List[Tuple[str, asyncio.Future]]) -> None:
+        texts = [text for text, _ in pending]
+        self.batches += 1
+        self.items += len(texts)
+        logger.debug(f"Sending batch of {len(texts)} commands to LLM")
+        results: List[Any] = []
+        error: Optional[Exception] = None
+        completed = False
+        try:
+            results = await self.client.aanalyze_commands_batch(texts) or []
+            completed = True
+        except Exception as e:
+            error = e
+        finally:
+            # 出错、被取消或返回条数不足时，保证每个调用方都能结束等待
+            for index, (_, future) in enumerate(pending):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                elif not completed:
+                    future.cancel()
+                else:
+                    future.set_result(results[index] if index < len(results) else None)
+
+    def stats(self) -> dict:
+        """批次统计"""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "average_batch_size": self.items / self.batches if self.batches else 0.0
+        }
@@ -0,0 +1,273 @@
+"""
+大模型响应缓存
+内存LRU + SQLite持久化，按标准化文本、模型名称和系统提示词哈希缓存解析后的响应
+用法:
+    python llm_cache.py warm logs/nlp_processor.log [更多日志文件...]
+    python llm_cache.py stats
+    python llm_cache.py clear
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Union
+
+from loguru import logger
+
+from config import LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MEMORY_SIZE, LLM_CACHE_MAX_ENTRIES
+
+# 处理日志中记录指令原文的行
+LOG_COMMAND_PATTERN = re.compile(r"Processing command: (.+)$")
+
+
+def normalize_text(text: str) -> str:
+    """缓存键使用的文本标准化：全角转半角并去掉首尾空白"""
+    return unicodedata.normalize("NFKC", text).strip()
+
+
+def prompt_hash(prompt: str) -> str:
+    """系统提示词哈希，配置变化后旧缓存自然失效"""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class LLMResponseCache:
+    """大模型响应的两级缓存"""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 memory_size: int = LLM_CACHE_MEMORY_SIZE, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+
+        # 内存LRU：键 -> (过期时间, 响应数据)
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 数据库读写使用单独的锁，查询内存时不必等待磁盘I/O
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str, model: str, prompt_version: str) -> str:
+        """由标准化文本、模型名称和提示词哈希生成缓存键"""
+        raw = json.dumps([normalize_text(text), model, prompt_version], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """首次使用时打开数据库，未配置路径时只使用内存缓存"""
+        if self._conn is None and self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, text TEXT, model TEXT, prompt_hash TEXT, "
+                "response TEXT, expires_at REAL, accessed_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON llm_cache (accessed_at)")
+            self._conn.commit()
+        return self._conn
+
+    def _expires_at(self, now: float) -> float:
+        return now + self.ttl if self.ttl > 0 else float("inf")
+
+    def _remember(self, key: str, expires_at: float, data: Dict[str, Any]) -> None:
+        self._memory[key] = (expires_at, data)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    @property
+    def persistent(self) -> bool:
+        """是否配置了SQLite持久化"""
+        return bool(self.path)
+
+    def get(self, text: str, model: Union[str, Sequence[str]], prompt_version: str,
+            disk: bool = True) -> Optional[Dict[str, Any]]:
+        """查询缓存，返回响应数据或None
+
+        model 可以是多个模型名称，按顺序返回第一个命中的条目，只计一次命中或未命中。
+        disk 为False时只查询内存LRU，未命中时不计入未命中次数，可在事件循环中直接调用；
+        异步调用方随后应在线程中执行完整查询。
+        """
+        models = [model] if isinstance(model, str) else list(model)
+        keys = [self.make_key(text, name, prompt_version) for name in models]
+        now = time.time()
+
+        with self._lock:
+            for key in keys:
+                cached = self._memory.get(key)
+                if cached is None:
+                    continue
+                expires_at, data = cached
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return data
+                del self._memory[key]
+            if not disk:
+                return None
+
+        found = None
+        for key in keys:
+            found = self._read_disk(key, now)
+            if found is not None:
+                break
+        with self._lock:
+            if found is None:
+                self.misses += 1
+                return None
+            expires_at, data = found
+            self._remember(key, expires_at, data)
+            self.disk_hits += 1
+            return data
+
+    def _read_disk(self, key: str, now: float) -> Optional[tuple]:
+        """从数据库读取未过期的记录，返回 (过期时间, 响应数据)"""
+        with self._db_lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            row = conn.execute(
+                "SELECT response, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, expires_at = row
+            expires_at = float("inf") if expires_at is None else expires_at
+            if expires_at > now:
+                conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+                return expires_at, json.loads(response)
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            conn.commit()
+            return None
+
+    def set(self, text: str, model: str, prompt_version: str, data: Dict[str, Any],
+            memory: bool = True, disk: bool = True) -> None:
+        """写入缓存，异步调用方先只写内存，再在线程中写入数据库"""
+        key = self.make_key(text, model, prompt_version)
+        now = time.time()
+        expires_at = self._expires_at(now)
+
+        if memory:
+            with self._lock:
+                self._remember(key, expires_at, data)
+        if not disk:
+            return
+
+        with self._db_lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, normalize_text(text), model, prompt_version, json.dumps(data, ensure_ascii=False),
+                 None if expires_at == float("inf") else expires_at, now)
+            )
+            self._writes += 1
+            # 定期清理过期和超出容量的记录，避免每次写入都扫描表
+            if self._writes % 100 == 0:
+                self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """删除过期记录，并按最近访问时间淘汰超出容量的记录"""
+        conn.execute("DELETE FROM llm_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        count = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._memory.clear()
+        with self._db_lock:
+            conn = self._connect()
+            if conn is not None:
+                conn.execute("DELETE FROM llm_cache")
+                conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        with self._db_lock:
+            conn = self._connect()
+            disk_entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] if conn else 0
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries
+            }
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def commands_from_logs(paths: Iterable[str]) -> List[str]:
+    """从处理日志中提取历史指令，按首次出现顺序去重"""
+    seen = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                match = LOG_COMMAND_PATTERN.search(line.rstrip("\n"))
+                if match:
+                    seen.setdefault(match.group(1), None)
+    return list(seen)
+
+
+def warm_from_logs(paths: Iterable[str], analyze: Callable[[str], Any]) -> int:
+    """用历史日志中的指令预热缓存，analyze 为带缓存的分析函数，返回处理的指令数"""
+    commands = commands_from_logs(paths)
+    for text in commands:
+        analyze(text)
+    logger.info(f"Warmed LLM cache with {len(commands)} commands")
+    return len(commands)
+
+
+def main(argv: Iterable[str] = None):
+    args = list(argv if argv is not None else sys.argv[1:])
+    if len(args) >= 2 and args[0] == "warm":
+        from llm_client import LLMClient
+        client = LLMClient()
+        if client.cache is None:
+            print("未配置大模型API密钥，无法预热缓存")
+            sys.exit(1)
+        count = warm_from_logs(args[1:], client.analyze_command)
+        print(f"已预热 {count} 条指令: {client.cache.stats()}")
+    elif args == ["stats"]:
+        print(json.dumps(LLMResponseCache().stats(), ensure_ascii=False, indent=2))
+    elif args == ["clear"]:
+        LLMResponseCache().clear()
+        print("缓存已清空")
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,53 @@
 用于调用大模型API进行自然语言理解
 """
 import json
+import time
+import asyncio
+import inspect
 import requests
-from typing import Dict, Any, Optional
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
 from loguru import logger
-from openai import OpenAI
+import openai
+from openai import OpenAI, AsyncOpenAI
 
-from config import SILICONFLOW_API_KEY, SILICONFLOW_BASE_URL, MODEL_NAME, INTENT_TYPES, ENTITY_TYPES
+from config import (
+    SILICONFLOW_API_KEY, SILICONFLOW_BASE_URL, MODEL_NAME, PROMPT_TOP_K,
+    LLM_TIMEOUT, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES, LLM_CACHE_ENABLED, LLM_BATCH_ENABLED, LLM_BATCH_MAX_TOKENS,
+    LLM_RESPONSE_MODE, LLM_COMPACT_MAX_TOKENS, LLM_HEDGE_ENABLED, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES
+)
 from models import LLMResponse
+from llm_cache import LLMResponseCache, prompt_hash
+from singleflight import SingleFlight, AsyncSingleFlight
+from llm_batcher import LLMBatcher
+from stream_parser import IncrementalJSONParser
+from metrics import LatencyTracker, TokenCounter
+from prompt_builder import PromptBuilder
+from model_router import ModelRouter
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from http_transport import RETRYABLE_ERRORS, STREAM_ERRORS, create_http_client, create_async_http_client, retry_delay
+from deadline import Deadline, remaining_timeout
+
+
+def locate_entities(text: str, pairs: List[Any]) -> List[Dict[str, Any]]:
+    """在原文中查找实体文本，计算位置；同一文本多次出现时依次对应，找不到的实体丢弃"""
+    entities = []
+    used = set()
+    for pair in pairs:
+        if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+            continue
+        entity_type, value = str(pair[0]), str(pair[1])
+        if not value:
+            continue
+        start = text.find(value)
+        while start != -1 and (start, start + len(value)) in used:
+            start = text.find(value, start + 1)
+        if start == -1:
+            logger.debug(f"Dropped LLM entity not found in text: {entity_type}={value}")
+            continue
+        used.add((start, start + len(value)))
+        entities.append({"type": entity_type, "value": value, "start": start, "end": start + len(value)})
+    return entities
+
 
 class LLMClient:
     """硅基流动大模型客户端"""
@@ -18,127 +58,879 @@ class LLMClient:
         self.api_key = SILICONFLOW_API_KEY
         self.base_url = SILICONFLOW_BASE_URL
         self.model_name = MODEL_NAME
+        self.timeout = LLM_TIMEOUT
+        self.max_concurrency = LLM_MAX_CONCURRENCY
+        # 输出格式：full 为完整JSON，compact 为短字段紧凑JSON
+        self.response_mode = LLM_RESPONSE_MODE
+        self.max_tokens = LLM_COMPACT_MAX_TOKENS if self.response_mode == "compact" else 1500
+        
+        self.max_retries = LLM_MAX_RETRIES
         
         if self.api_key:
+            # 所有模型共用带连接池和keep-alive的HTTP客户端，重试由 _create/_acreate 处理
             self.client = OpenAI(
                 api_key=self.api_key,
-                base_url=self.base_url
+                base_url=self.base_url,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=create_http_client(self.timeout)
             )
+            self.async_client = self._build_async_client()
             logger.info(f"Initialized SiliconFlow client with model: {self.model_name}")
         else:
             logger.warning("No SiliconFlow API key provided, LLM features will be disabled")
             self.client = None
+            self.async_client = None
+        
+        # 提示词由缓存的片段按候选意图组装
+        self.prompt_builder = PromptBuilder()
+        self.prompt_top_k = PROMPT_TOP_K
+        # 各输出格式完整提示词的估算token数只计算一次，用于与精简后的提示词比较
+        self.unpruned_prompt_tokens = {
+            mode: self.prompt_builder.build_with_tokens(None, mode)[1] for mode in self.prompt_builder.formats
+        }
+        self.tokens = TokenCounter()
+        
+        # 响应缓存，键中包含系统提示词哈希，修改意图或实体配置后自动失效
+        self.prompt_version = prompt_hash(f"{self._build_system_prompt()}\ntop_k={self.prompt_top_k}")
+        self.cache = LLMResponseCache() if LLM_CACHE_ENABLED and self.client else None
+        
+        # 合并进行中的相同请求
+        self.flight = SingleFlight()
+        self.async_flight = AsyncSingleFlight()
+        
+        # 异步路径的批量模式
+        self.batcher = LLMBatcher(self) if LLM_BATCH_ENABLED else None
+        
+        # 大模型调用耗时：llm_total 为完整响应耗时，llm_first_intent 为流式模式下首次得到意图的耗时
+        self.latency = LatencyTracker()
+        
+        # 小模型和大模型之间的路由，未配置小模型时始终使用 MODEL_NAME
+        self.router = ModelRouter(large_model=self.model_name)
+        
+        # 对冲请求统计：hedged 为发出的对冲请求数，won 为对冲请求先返回的次数
+        self.hedge_enabled = LLM_HEDGE_ENABLED
+        self.hedged = 0
+        self.hedges_won = 0
+        
+        # 上游连续失败时熔断，熔断期间不再调用大模型
+        self.breaker = CircuitBreaker()
+        
+        # 并发信号量绑定在事件循环上，首次在某个循环中调用时创建
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """获取当前事件循环的并发信号量"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+    
+    def _build_async_client(self) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=create_async_http_client(self.timeout)
+        )
+    
+    def _get_async_client(self) -> AsyncOpenAI:
+        """异步连接池中的连接绑定在事件循环上，切换事件循环时重新创建客户端"""
+        loop = asyncio.get_running_loop()
+        if self.api_key and self._async_client_loop is not None and self._async_client_loop is not loop:
+            self.async_client = self._build_async_client()
+        self._async_client_loop = loop
+        return self.async_client
+    
+    def _create(self, **kwargs) -> Any:
+        """调用对话接口，可重试的错误按带抖动的指数退避重试，总耗时不超过本次调用的超时"""
+        permit = self.breaker.allow()
+        if permit is None:
+            raise CircuitOpenError("SiliconFlow circuit is open")
+        expires_at = time.monotonic() + kwargs.get("timeout", self.timeout)
+        attempt = 0
+        try:
+            while True:
+                try:
+                    response = self.client.chat.completions.create(**kwargs)
+                except RETRYABLE_ERRORS as e:
+                    delay = retry_delay(attempt)
+                    remaining = expires_at - time.monotonic() - delay
+                    if attempt >= self.max_retries or remaining <= 0:
+                        self.breaker.record_failure()
+                        raise
+                    logger.warning(f"Retrying SiliconFlow API in {delay:.2f}s after error: {e}")
+                    time.sleep(delay)
+                    kwargs["timeout"] = remaining
+                    attempt += 1
+                    continue
+                except openai.APIStatusError:
+                    # 上游可以访问，只是拒绝了本次请求
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_success()
+                return response
+        finally:
+            self.breaker.release(permit)
+    
+    async def _acreate(self, **kwargs) -> Any:
+        """异步调用对话接口，重试策略与 _create 相同"""
+        permit = self.breaker.allow()
+        if permit is None:
+            raise CircuitOpenError("SiliconFlow circuit is open")
+        expires_at = time.monotonic() + kwargs.get("timeout", self.timeout)
+        attempt = 0
+        try:
+            while True:
+                try:
+                    response = await self._get_async_client().chat.completions.create(**kwargs)
+                except RETRYABLE_ERRORS as e:
+                    delay = retry_delay(attempt)
+                    remaining = expires_at - time.monotonic() - delay
+                    if attempt >= self.max_retries or remaining <= 0:
+                        self.breaker.record_failure()
+                        raise
+                    logger.warning(f"Retrying SiliconFlow API in {delay:.2f}s after error: {e}")
+                    await asyncio.sleep(delay)
+                    kwargs["timeout"] = remaining
+                    attempt += 1
+                    continue
+                except openai.APIStatusError:
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_success()
+                return response
+        finally:
+            self.breaker.release(permit)
+    
+    def _record_stream_failure(self, stream: Any, error: Exception) -> None:
+        """建立连接时已按成功记录，流式读取中途的传输错误补记为熔断器失败"""
+        if stream is not None and isinstance(error, STREAM_ERRORS):
+            self.breaker.record_failure()
+    
+    @property
+    def enabled(self) -> bool:
+        """是否配置了API密钥，未配置时不会调用大模型"""
+        return self.client is not None or self.async_client is not None
+    
+    def _circuit_open(self) -> bool:
+        """熔断期间跳过大模型调用，由调用方使用规则结果"""
+        if self.breaker.is_open:
+            logger.debug("SiliconFlow circuit is open, skipping LLM analysis")
+            self.breaker.record_rejection()
+            return True
+        return False
     
-    def _build_system_prompt(self) -> str:
-        """构建系统提示词"""
-        intent_descriptions = []
-        for intent_type, config in INTENT_TYPES.items():
-            intent_descriptions.append(f"- {intent_type}: {config['name']} - {config['description']}")
+    def _build_system_prompt(self, candidates: Optional[List[str]] = None) -> str:
+        """构建系统提示词，给定候选意图时只包含这些意图及其相关的实体类型"""
+        return self.prompt_builder.build(candidates, self.response_mode)
+    
+    def _build_messages(self, text: str, candidates: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        """构建指令分析的对话消息，并记录估算的提示词token数"""
+        system_prompt, tokens = self.prompt_builder.build_with_tokens(candidates, self.response_mode)
+        self.tokens.record("prompt_estimated", tokens)
+        self.tokens.record("prompt_unpruned_estimated", self.unpruned_prompt_tokens[self.response_mode])
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ]
+    
+    def _record_usage(self, response: Any) -> None:
+        """记录接口返回的实际token用量"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        if getattr(usage, "prompt_tokens", None) is not None:
+            self.tokens.record("prompt_tokens", usage.prompt_tokens)
+        if getattr(usage, "completion_tokens", None) is not None:
+            self.tokens.record("completion_tokens", usage.completion_tokens)
+    
+    @staticmethod
+    def _strip_code_fence(content: str) -> str:
+        """清理响应内容，移除可能的markdown格式"""
+        content = content.strip()
+        if content.startswith("```json"):
+            content = content[7:]
+        if content.endswith("```"):
+            content = content[:-3]
+        return content.strip()
+    
+    def _parse_response(self, text: str, content: str) -> Optional[LLMResponse]:
+        """把大模型返回的文本解析为LLMResponse"""
+        logger.debug(f"SiliconFlow response: {content}")
+        content = self._strip_code_fence(content)
         
-        entity_descriptions = []
-        for entity_type, config in ENTITY_TYPES.items():
-            examples = ", ".join(config['examples'][:3])
-            entity_descriptions.append(f"- {entity_type}: {config['name']} - 例如: {examples}")
+        # 解析JSON响应
+        try:
+            result_data = json.loads(content)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse SiliconFlow response as JSON: {e}")
+            logger.error(f"Raw response: {content}")
+            return None
         
-        system_prompt = f"""你是一个语音控制机器人的自然语言理解系统。你的任务是分析用户的语音指令，识别意图并提取相关实体。
-
-支持的意图类型：
-{chr(10).join(intent_descriptions)}
-
-支持的实体类型：
-{chr(10).join(entity_descriptions)}
-
-请分析用户输入的文本，返回JSON格式的结果，包含：
-1. intent_type: 识别的意图类型
-2. intent_confidence: 意图识别的置信度 (0-1)
-3. entities: 提取的实体列表，每个实体包含type、value、start、end
-4. reasoning: 分析推理过程
-5. structured_command: 结构化的指令参数
-
-示例输入："巡检A区2号房主柜温度"
-示例输出：
-{{
-    "intent_type": "patrol_inspection",
-    "intent_confidence": 0.95,
-    "entities": [
-        {{"type": "location", "value": "A区", "start": 2, "end": 4}},
-        {{"type": "location", "value": "2号房", "start": 4, "end": 7}},
-        {{"type": "equipment", "value": "主柜", "start": 7, "end": 9}},
-        {{"type": "parameter", "value": "温度", "start": 9, "end": 11}}
-    ],
-    "reasoning": "用户要求巡检A区2号房的主柜温度，这是一个典型的巡检指令",
-    "structured_command": {{
-        "action": "patrol_inspection",
-        "location": {{"zone": "A", "room": "2"}},
-        "equipment": "主柜",
-        "parameter": "温度"
-    }}
-}}
-
-重要提示：
-1. 请严格按照JSON格式返回结果，不要包含其他内容
-2. 确保JSON格式正确，可以被Python json.loads()解析
-3. 如果无法识别意图，请将intent_type设为"unknown"
-4. 实体的start和end位置要准确对应原文中的字符位置"""
+        try:
+            llm_response = self._response_from_data(text, result_data)
+            logger.info(f"Successfully parsed SiliconFlow response for text: {text}")
+            return llm_response
+        except Exception as e:
+            logger.error(f"Failed to create LLMResponse: {e}")
+            logger.error(f"Response data: {result_data}")
+            return None
+    
+    def _response_from_data(self, text: str, data: Dict[str, Any]) -> LLMResponse:
+        """按输出格式构建LLMResponse，紧凑格式的实体位置在原文中重新计算"""
+        if self.response_mode != "compact":
+            return LLMResponse(**data)
+        return LLMResponse(
+            intent_type=data["i"],
+            intent_confidence=data["c"],
+            entities=locate_entities(text, data.get("e") or []),
+            reasoning="",
+            structured_command={}
+        )
+    
+    def _cache_models(self, model: Optional[str] = None) -> List[str]:
+        """可以使用的缓存条目对应的模型：大模型的结果总是可用，小模型的结果只在路由选择小模型时使用"""
+        large_model = self.router.large_model
+        if model is None or model == large_model:
+            return [large_model]
+        return [large_model, model]
+    
+    def _cache_get(self, text: str, model: Optional[str] = None) -> Optional[LLMResponse]:
+        """查询响应缓存，model 为路由选择的模型，默认大模型"""
+        if self.cache is None:
+            return None
+        return self._cached_response(text, self._cache_data([text], model)[0])
+    
+    async def _acache_get(self, text: str, model: Optional[str] = None) -> Optional[LLMResponse]:
+        return (await self._acache_lookup([text], model))[0]
+    
+    async def _acache_lookup(self, texts: List[str], model: Optional[str] = None) -> List[Optional[LLMResponse]]:
+        """异步查询响应缓存：内存LRU在事件循环中直接查询，未命中的条目在一个线程任务中查询SQLite"""
+        if self.cache is None:
+            return [None] * len(texts)
+        data = self._cache_data(texts, model, disk=False)
+        missing = [index for index, item in enumerate(data) if item is None]
+        if missing:
+            pending = [texts[index] for index in missing]
+            if self.cache.persistent:
+                found = await asyncio.to_thread(self._cache_data, pending, model)
+            else:
+                found = self._cache_data(pending, model)
+            for index, item in zip(missing, found):
+                data[index] = item
+        return [self._cached_response(text, item) for text, item in zip(texts, data)]
+    
+    def _cache_data(self, texts: List[str], model: Optional[str] = None,
+                    disk: bool = True) -> List[Optional[Dict[str, Any]]]:
+        models = self._cache_models(model)
+        return [self.cache.get(text, models, self.prompt_version, disk=disk) for text in texts]
+    
+    def _cached_response(self, text: str, data: Optional[Dict[str, Any]]) -> Optional[LLMResponse]:
+        if data is None:
+            return None
+        logger.debug(f"LLM cache hit for text: {text}")
+        return LLMResponse(**dict(data, entities=self._relocate_entities(text, data.get("entities") or [])))
+    
+    @staticmethod
+    def _relocate_entities(text: str, entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """缓存键按标准化文本计算，命中的响应可能来自空白或全角字符不同的文本，实体位置按当前文本重新计算
         
-        return system_prompt
+        位置与当前文本一致的实体保持不变，其余实体按文本重新查找，找不到的丢弃。
+        """
+        relocated = []
+        used = set()
+        for entity in entities:
+            value = str(entity.get("value") or "")
+            start, end = entity.get("start"), entity.get("end")
+            if not (value and isinstance(start, int) and isinstance(end, int) and text[start:end] == value):
+                start = text.find(value) if value else -1
+                while start != -1 and (start, start + len(value)) in used:
+                    start = text.find(value, start + 1)
+                if start == -1:
+                    logger.debug(f"Dropped cached entity not found in text: {entity.get('type')}={value}")
+                    continue
+            used.add((start, start + len(value)))
+            relocated.append(dict(entity, start=start, end=start + len(value)))
+        return relocated
+    
+    def _cacheable(self, response: Optional[LLMResponse], model: str) -> bool:
+        """只缓存不需要升级的响应：升级失败时保留的小模型结果不写入缓存，之后仍会尝试升级"""
+        return response is not None and not self.router.needs_escalation(model, response)
+    
+    def _cache_set(self, text: str, response: Optional[LLMResponse], model: Optional[str] = None) -> None:
+        """缓存成功解析的响应，按实际给出结果的模型（默认大模型）存放"""
+        model = model or self.router.large_model
+        if self.cache is not None and self._cacheable(response, model):
+            self.cache.set(text, model, self.prompt_version, response.model_dump())
+    
+    async def _acache_set(self, text: str, response: Optional[LLMResponse], model: Optional[str] = None) -> None:
+        await self._acache_store([text], [response], model)
+    
+    async def _acache_store(self, texts: List[str], responses: List[Optional[LLMResponse]],
+                            model: Optional[str] = None) -> None:
+        """异步写入响应缓存，先写内存LRU，SQLite写入在一个线程任务中执行"""
+        if self.cache is None:
+            return
+        model = model or self.router.large_model
+        items = [(text, response.model_dump()) for text, response in zip(texts, responses)
+                 if self._cacheable(response, model)]
+        for text, data in items:
+            self.cache.set(text, model, self.prompt_version, data, disk=False)
+        if items and self.cache.persistent:
+            await asyncio.to_thread(self._cache_write, items, model)
+    
+    def _cache_write(self, items: List[Tuple[str, Dict[str, Any]]], model: str) -> None:
+        for text, data in items:
+            self.cache.set(text, model, self.prompt_version, data, memory=False)
+    
+    def _coalesce(self, key: tuple, fn: Callable[[], Optional[LLMResponse]], timeout: float) -> Optional[LLMResponse]:
+        """合并相同请求，等待其他线程的调用最多 timeout 秒"""
+        try:
+            return self.flight.do(key, fn, timeout=timeout)
+        except TimeoutError:
+            logger.warning(f"Coalesced LLM call did not finish in time for text: {key[0]}")
+            return None
     
-    def analyze_command(self, text: str) -> Optional[LLMResponse]:
-        """使用硅基流动大模型分析指令"""
+    async def _acoalesce(self, key: tuple, fn: Callable[[], Awaitable[Optional[LLMResponse]]],
+                         timeout: float) -> Optional[LLMResponse]:
+        """异步合并相同请求，等待最多 timeout 秒"""
+        try:
+            return await self.async_flight.do(key, fn, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Coalesced LLM call did not finish in time for text: {key[0]}")
+            return None
+    
+    def _flight_key(self, text: str, model: Optional[str] = None) -> tuple:
+        """请求合并的键：相同文本、模型和提示词版本的分析结果相同"""
+        return (text, model or self.model_name, self.prompt_version)
+    
+    def analyze_command(self, text: str, candidates: Optional[List[str]] = None,
+                        deadline: Optional[Deadline] = None) -> Optional[LLMResponse]:
+        """使用硅基流动大模型分析指令，优先使用缓存结果，并发的相同请求合并为一次调用
+        
+        配置了小模型时先由路由选择模型，小模型结果不可用时升级到大模型。
+        传入 deadline 时单次调用的超时不超过剩余时间，截止后不再发起调用。
+        """
         if not self.client:
             logger.warning("SiliconFlow client not initialized, skipping LLM analysis")
             return None
         
+        model = self.router.choose(text, candidates)
+        cached = self._cache_get(text, model)
+        if cached is not None:
+            return cached
+        
+        if self._circuit_open():
+            return None
+        
+        if deadline is not None and deadline.expired:
+            logger.warning(f"Deadline expired before LLM call for text: {text}")
+            return None
+        
+        timeout = remaining_timeout(deadline, self.timeout)
+        llm_response = self._coalesce(
+            self._flight_key(text, model), lambda: self._request_analysis(text, candidates, model, timeout), timeout
+        )
+        if self.router.should_escalate(model, llm_response):
+            llm_response, model = self._escalate(text, candidates, llm_response, deadline)
+        self._cache_set(text, llm_response, model)
+        return llm_response
+    
+    def _escalate(self, text: str, candidates: Optional[List[str]], small_response: Optional[LLMResponse],
+                  deadline: Optional[Deadline] = None) -> Tuple[Optional[LLMResponse], str]:
+        """升级到大模型，大模型调用失败或已到截止时间时保留小模型的结果，同时返回给出结果的模型"""
+        large_model = self.router.large_model
+        if deadline is not None and deadline.expired:
+            logger.warning(f"Deadline expired, skipped escalation to {large_model} for text: {text}")
+            return small_response, self.router.small_model
+        logger.info(f"Escalating to {large_model} for text: {text}")
+        timeout = remaining_timeout(deadline, self.timeout)
+        llm_response = self._coalesce(
+            self._flight_key(text, large_model),
+            lambda: self._request_analysis(text, candidates, large_model, timeout), timeout
+        )
+        if llm_response is None:
+            return small_response, self.router.small_model
+        return llm_response, large_model
+    
+    def _request_analysis(self, text: str, candidates: Optional[List[str]] = None,
+                          model: Optional[str] = None, timeout: Optional[float] = None) -> Optional[LLMResponse]:
+        """调用大模型API分析指令"""
+        model = model or self.model_name
+        started = time.perf_counter()
         try:
-            system_prompt = self._build_system_prompt()
-            
-            logger.debug(f"Calling SiliconFlow API with model: {self.model_name}")
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": text}
-                ],
+            logger.debug(f"Calling SiliconFlow API with model: {model}")
+            response = self._create(
+                model=model,
+                messages=self._build_messages(text, candidates),
                 temperature=0.1,
-                max_tokens=1500
+                max_tokens=self.max_tokens,
+                timeout=self.timeout if timeout is None else timeout
             )
-            
-            content = response.choices[0].message.content.strip()
-            logger.debug(f"SiliconFlow response: {content}")
-            
-            # 清理响应内容，移除可能的markdown格式
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.endswith("```"):
-                content = content[:-3]
-            content = content.strip()
-            
-            # 解析JSON响应
+            self._record_model_latency(model, started)
+            self._record_usage(response)
+            return self._parse_response(text, response.choices[0].message.content)
+                
+        except Exception as e:
+            logger.error(f"Error calling SiliconFlow API: {e}")
+            return None
+    
+    async def aanalyze_command(self, text: str, candidates: Optional[List[str]] = None,
+                               deadline: Optional[Deadline] = None, *,
+                               timeout: Optional[float] = None) -> Optional[LLMResponse]:
+        """异步分析指令，同时进行的调用数受 LLM_MAX_CONCURRENCY 限制，并发的相同请求合并为一次调用
+        
+        开启对冲请求时，首个请求超过该模型的耗时分位数仍未返回则再发一次，采用先返回的有效结果。
+        """
+        if not self.async_client:
+            logger.warning("SiliconFlow client not initialized, skipping LLM analysis")
+            return None
+        
+        model = self.router.choose(text, candidates)
+        cached = await self._acache_get(text, model)
+        if cached is not None:
+            return cached
+        
+        if self._circuit_open():
+            return None
+        
+        if deadline is not None and deadline.expired:
+            logger.warning(f"Deadline expired before LLM call for text: {text}")
+            return None
+        
+        # 开启批量模式时由批处理器在时间窗口内收集指令，合并为一次请求
+        # 批量请求不经过模型路由和提示词精简，固定使用大模型和完整提示词；等待时间不超过截止时间
+        if self.batcher is not None:
+            call = self.async_flight.do(self._flight_key(text), lambda: self.batcher.submit(text))
+            if deadline is None:
+                return await call
             try:
-                result_data = json.loads(content)
-                llm_response = LLMResponse(**result_data)
-                logger.info(f"Successfully parsed SiliconFlow response for text: {text}")
-                return llm_response
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse SiliconFlow response as JSON: {e}")
-                logger.error(f"Raw response: {content}")
-                return None
-            except Exception as e:
-                logger.error(f"Failed to create LLMResponse: {e}")
-                logger.error(f"Response data: {result_data}")
+                return await asyncio.wait_for(call, remaining_timeout(deadline, self.timeout))
+            except asyncio.TimeoutError:
+                logger.warning(f"Batched LLM call did not finish before deadline for text: {text}")
                 return None
+        
+        timeout = remaining_timeout(deadline, self.timeout if timeout is None else timeout)
+        llm_response = await self._acoalesce(
+            self._flight_key(text, model),
+            lambda: self._ahedged(model, timeout, lambda t: self._arequest_analysis(text, t, candidates, model)),
+            timeout
+        )
+        if self.router.should_escalate(model, llm_response):
+            llm_response, model = await self._aescalate(text, timeout, candidates, llm_response, deadline)
+        await self._acache_set(text, llm_response, model)
+        return llm_response
+    
+    async def _aescalate(self, text: str, timeout: float, candidates: Optional[List[str]],
+                         small_response: Optional[LLMResponse],
+                         deadline: Optional[Deadline] = None) -> Tuple[Optional[LLMResponse], str]:
+        """异步升级到大模型，大模型调用失败或已到截止时间时保留小模型的结果，同时返回给出结果的模型"""
+        large_model = self.router.large_model
+        if deadline is not None and deadline.expired:
+            logger.warning(f"Deadline expired, skipped escalation to {large_model} for text: {text}")
+            return small_response, self.router.small_model
+        logger.info(f"Escalating to {large_model} for text: {text}")
+        timeout = remaining_timeout(deadline, timeout)
+        llm_response = await self._acoalesce(
+            self._flight_key(text, large_model),
+            lambda: self._ahedged(
+                large_model, timeout, lambda t: self._arequest_analysis(text, t, candidates, large_model)
+            ),
+            timeout
+        )
+        if llm_response is None:
+            return small_response, self.router.small_model
+        return llm_response, large_model
+    
+    def _hedge_delay(self, model: str) -> Optional[float]:
+        """对冲请求的等待时间（秒）：该模型耗时的 LLM_HEDGE_PERCENTILE 分位数，样本不足时不对冲"""
+        if not self.hedge_enabled or self.router.latency.count(model) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return self.router.latency.percentile(model, LLM_HEDGE_PERCENTILE) / 1000.0
+    
+    async def _ahedged(self, model: str, timeout: float,
+                       call: Callable[[float], Awaitable[Optional[LLMResponse]]]) -> Optional[LLMResponse]:
+        """执行 call(timeout)，超过对冲等待时间仍未返回时再执行一次，返回先得到的有效结果"""
+        delay = self._hedge_delay(model)
+        if delay is None or delay >= timeout:
+            return await call(timeout)
+        
+        tasks = [asyncio.ensure_future(call(timeout))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return tasks[0].result()
+            
+            logger.debug(f"Sending hedged request to {model} after {delay * 1000:.0f}ms")
+            self.hedged += 1
+            tasks.append(asyncio.ensure_future(call(timeout - delay)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    llm_response = task.result()
+                    if llm_response is not None:
+                        if task is tasks[1]:
+                            self.hedges_won += 1
+                        return llm_response
+            return None
+        finally:
+            # 采用一个结果后取消仍在进行的请求
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    def hedging_stats(self) -> Dict[str, Any]:
+        """对冲请求统计"""
+        return {
+            "enabled": self.hedge_enabled,
+            "hedged": self.hedged,
+            "won": self.hedges_won
+        }
+    
+    async def _arequest_analysis(self, text: str, timeout: float, candidates: Optional[List[str]] = None,
+                                 model: Optional[str] = None) -> Optional[LLMResponse]:
+        """异步调用大模型API分析指令"""
+        model = model or self.model_name
+        started = time.perf_counter()
+        try:
+            async with self._get_semaphore():
+                logger.debug(f"Calling SiliconFlow API asynchronously with model: {model}")
+                response = await self._acreate(
+                    model=model,
+                    messages=self._build_messages(text, candidates),
+                    temperature=0.1,
+                    max_tokens=self.max_tokens,
+                    timeout=timeout
+                )
+            self._record_model_latency(model, started)
+            self._record_usage(response)
+            return self._parse_response(text, response.choices[0].message.content)
                 
         except Exception as e:
             logger.error(f"Error calling SiliconFlow API: {e}")
             return None
     
-    def enhance_entity_extraction(self, text: str, existing_entities: list) -> Optional[Dict[str, Any]]:
-        """使用硅基流动大模型增强实体抽取"""
+    def _record_latency(self, name: str, started: float) -> None:
+        self.latency.record(name, (time.perf_counter() - started) * 1000)
+    
+    def _record_model_latency(self, model: str, started: float) -> None:
+        """记录完整响应耗时，并按模型记录路由统计"""
+        milliseconds = (time.perf_counter() - started) * 1000
+        self.latency.record("llm_total", milliseconds)
+        self.router.record(model, milliseconds)
+    
+    def _record_batch_latency(self, model: str, started: float) -> None:
+        """批量请求的耗时单独计入路由统计，不影响单条请求的对冲等待时间"""
+        self.router.record_batch(model, (time.perf_counter() - started) * 1000)
+    
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        """流式响应块中的文本增量"""
+        if not chunk.choices:
+            return ""
+        return chunk.choices[0].delta.content or ""
+    
+    def _stream_intent(self, parser: IncrementalJSONParser) -> Optional[Tuple[str, float]]:
+        """意图类型和置信度都已解析完成时返回"""
+        fields = parser.fields
+        type_key, confidence_key = ("i", "c") if self.response_mode == "compact" else ("intent_type", "intent_confidence")
+        if type_key in fields and confidence_key in fields:
+            try:
+                return str(fields[type_key]), float(fields[confidence_key])
+            except (TypeError, ValueError):
+                return None
+        return None
+    
+    def analyze_command_stream(self, text: str, on_intent: Optional[Callable[[str, float], Any]] = None,
+                               candidates: Optional[List[str]] = None,
+                               deadline: Optional[Deadline] = None) -> Optional[LLMResponse]:
+        """流式分析指令，意图字段解析完成时立即回调 on_intent(intent_type, intent_confidence)"""
         if not self.client:
+            logger.warning("SiliconFlow client not initialized, skipping LLM analysis")
             return None
         
+        model = self.router.choose(text, candidates)
+        cached = self._cache_get(text, model)
+        if cached is not None:
+            if on_intent:
+                on_intent(cached.intent_type, cached.intent_confidence)
+            return cached
+        
+        if self._circuit_open():
+            return None
+        
+        if deadline is not None and deadline.expired:
+            logger.warning(f"Deadline expired before LLM call for text: {text}")
+            return None
+        
+        started = time.perf_counter()
+        parser = IncrementalJSONParser()
+        emitted = False
+        stream = None
+        try:
+            logger.debug(f"Streaming SiliconFlow API with model: {model}")
+            stream = self._create(
+                model=model,
+                messages=self._build_messages(text, candidates),
+                temperature=0.1,
+                max_tokens=self.max_tokens,
+                timeout=remaining_timeout(deadline, self.timeout),
+                stream=True
+            )
+            for chunk in stream:
+                delta = self._chunk_text(chunk)
+                if not delta:
+                    continue
+                parser.feed(delta)
+                if not emitted:
+                    intent = self._stream_intent(parser)
+                    if intent is not None:
+                        emitted = True
+                        self._record_latency("llm_first_intent", started)
+                        if on_intent:
+                            on_intent(*intent)
+            self._record_model_latency(model, started)
+            llm_response = self._parse_response(text, parser.buffer)
+            
+        except Exception as e:
+            logger.error(f"Error streaming SiliconFlow API: {e}")
+            self._record_stream_failure(stream, e)
+            llm_response = None
+        
+        # 升级时意图已经回调，最终结果以返回值为准
+        if self.router.should_escalate(model, llm_response):
+            llm_response, model = self._escalate(text, candidates, llm_response, deadline)
+        self._cache_set(text, llm_response, model)
+        return llm_response
+    
+    async def aanalyze_command_stream(self, text: str,
+                                      on_intent: Optional[Callable[[str, float], Any]] = None,
+                                      candidates: Optional[List[str]] = None,
+                                      deadline: Optional[Deadline] = None, *,
+                                      timeout: Optional[float] = None) -> Optional[LLMResponse]:
+        """异步流式分析指令，on_intent 可以是普通函数或协程函数"""
+        if not self.async_client:
+            logger.warning("SiliconFlow client not initialized, skipping LLM analysis")
+            return None
+        
+        async def emit(intent_type: str, confidence: float) -> None:
+            if on_intent:
+                result = on_intent(intent_type, confidence)
+                if inspect.isawaitable(result):
+                    await result
+        
+        model = self.router.choose(text, candidates)
+        cached = await self._acache_get(text, model)
+        if cached is not None:
+            await emit(cached.intent_type, cached.intent_confidence)
+            return cached
+        
+        if self._circuit_open():
+            return None
+        
+        if deadline is not None and deadline.expired:
+            logger.warning(f"Deadline expired before LLM call for text: {text}")
+            return None
+        
+        timeout = remaining_timeout(deadline, self.timeout if timeout is None else timeout)
+        started = time.perf_counter()
+        parser = IncrementalJSONParser()
+        emitted = False
+        stream = None
+        try:
+            async with self._get_semaphore():
+                logger.debug(f"Streaming SiliconFlow API asynchronously with model: {model}")
+                stream = await self._acreate(
+                    model=model,
+                    messages=self._build_messages(text, candidates),
+                    temperature=0.1,
+                    max_tokens=self.max_tokens,
+                    timeout=timeout,
+                    stream=True
+                )
+                async for chunk in stream:
+                    delta = self._chunk_text(chunk)
+                    if not delta:
+                        continue
+                    parser.feed(delta)
+                    if not emitted:
+                        intent = self._stream_intent(parser)
+                        if intent is not None:
+                            emitted = True
+                            self._record_latency("llm_first_intent", started)
+                            await emit(*intent)
+            self._record_model_latency(model, started)
+            llm_response = self._parse_response(text, parser.buffer)
+            
+        except Exception as e:
+            logger.error(f"Error streaming SiliconFlow API: {e}")
+            self._record_stream_failure(stream, e)
+            llm_response = None
+        
+        # 升级时意图已经回调，最终结果以返回值为准
+        if self.router.should_escalate(model, llm_response):
+            llm_response, model = await self._aescalate(text, timeout, candidates, llm_response, deadline)
+        await self._acache_set(text, llm_response, model)
+        return llm_response
+    
+    def _build_batch_messages(self, texts: List[str]) -> List[Dict[str, str]]:
+        """构建批量分析的对话消息，多条指令以编号列表形式放在一条用户消息中"""
+        instruction = f"""
+
+批量模式：
+用户消息是编号列表，每行一条带引号的指令。请返回JSON数组，按编号顺序每条指令对应一个元素，
+每个元素的格式与上面的示例输出相同，并额外包含 index 字段（指令编号，从1开始）。
+实体位置（如有）是该条指令原文（不含引号）中的字符位置。只返回JSON数组，不要包含其他内容。"""
+        numbered = "\n".join(
+            f"{index}. {json.dumps(text, ensure_ascii=False)}" for index, text in enumerate(texts, 1)
+        )
+        return [
+            {"role": "system", "content": self._build_system_prompt() + instruction},
+            {"role": "user", "content": numbered}
+        ]
+    
+    def _batch_max_tokens(self, count: int) -> int:
+        return min(self.max_tokens * count, LLM_BATCH_MAX_TOKENS)
+    
+    def _parse_batch_response(self, texts: List[str], content: str) -> List[Optional[LLMResponse]]:
+        """把批量响应的JSON数组拆分回各条指令，无法解析的条目为None"""
+        results: List[Optional[LLMResponse]] = [None] * len(texts)
         try:
-            prompt = f"""请分析以下文本中的实体，特别关注可能被遗漏的实体：
+            items = json.loads(self._strip_code_fence(content))
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse SiliconFlow batch response as JSON: {e}")
+            return results
+        if not isinstance(items, list):
+            logger.error("SiliconFlow batch response is not a JSON array")
+            return results
+        
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            # 优先按 index 字段对应，缺失时按数组位置对应
+            index = item.pop("index", position + 1)
+            if not isinstance(index, int) or not 1 <= index <= len(texts) or results[index - 1] is not None:
+                continue
+            try:
+                results[index - 1] = self._response_from_data(texts[index - 1], item)
+            except Exception as e:
+                logger.error(f"Failed to create LLMResponse for batch item {index}: {e}")
+        return results
+    
+    def _with_cached(self, texts: List[str]) -> Tuple[List[Optional[LLMResponse]], List[int]]:
+        """批量分析前先查缓存，返回各条的缓存结果和未命中的序号"""
+        results = [self._cache_get(text) for text in texts]
+        return results, [index for index, result in enumerate(results) if result is None]
+    
+    async def _awith_cached(self, texts: List[str]) -> Tuple[List[Optional[LLMResponse]], List[int]]:
+        """异步批量查询缓存"""
+        results = await self._acache_lookup(texts)
+        return results, [index for index, result in enumerate(results) if result is None]
+    
+    def analyze_commands_batch(self, texts: List[str]) -> List[Optional[LLMResponse]]:
+        """一次请求分析多条指令，已缓存的指令不再发送，批量结果中缺失或无法解析的条目逐条重试"""
+        if not self.client:
+            logger.warning("SiliconFlow client not initialized, skipping LLM analysis")
+            return [None] * len(texts)
+        
+        results, missing = self._with_cached(texts)
+        if missing and not self._circuit_open():
+            analyzed = self._request_batch([texts[index] for index in missing])
+            for index, result in zip(missing, analyzed):
+                results[index] = result
+        return results
+    
+    def _request_batch(self, texts: List[str]) -> List[Optional[LLMResponse]]:
+        model = self.router.large_model
+        started = time.perf_counter()
+        try:
+            logger.debug(f"Calling SiliconFlow API with {len(texts)} commands in one batch")
+            response = self._create(
+                model=model,
+                messages=self._build_batch_messages(texts),
+                temperature=0.1,
+                max_tokens=self._batch_max_tokens(len(texts))
+            )
+        except Exception as e:
+            # 请求本身失败时逐条重试只会放大压力，整批返回None
+            logger.error(f"Error calling SiliconFlow API in batch: {e}")
+            return [None] * len(texts)
+        self._record_batch_latency(model, started)
+        self._record_usage(response)
+        results = self._parse_batch_response(texts, response.choices[0].message.content or "")
+        
+        # 只有缺失或无法解析的条目逐条重试，熔断后不再发送
+        for index, text in enumerate(texts):
+            if results[index] is None and not self._circuit_open():
+                results[index] = self._request_analysis(text)
+            self._cache_set(text, results[index])
+        return results
+    
+    async def aanalyze_commands_batch(self, texts: List[str], *,
+                                      timeout: Optional[float] = None) -> List[Optional[LLMResponse]]:
+        """异步批量分析多条指令，已缓存的指令不再发送，缺失或无法解析的条目逐条重试"""
+        if not self.async_client:
+            logger.warning("SiliconFlow client not initialized, skipping LLM analysis")
+            return [None] * len(texts)
+        
+        results, missing = await self._awith_cached(texts)
+        if missing and not self._circuit_open():
+            analyzed = await self._arequest_batch(
+                [texts[index] for index in missing], self.timeout if timeout is None else timeout
+            )
+            for index, result in zip(missing, analyzed):
+                results[index] = result
+        return results
+    
+    async def _arequest_batch(self, texts: List[str], timeout: float) -> List[Optional[LLMResponse]]:
+        model = self.router.large_model
+        started = time.perf_counter()
+        try:
+            async with self._get_semaphore():
+                logger.debug(f"Calling SiliconFlow API asynchronously with {len(texts)} commands in one batch")
+                response = await self._acreate(
+                    model=model,
+                    messages=self._build_batch_messages(texts),
+                    temperature=0.1,
+                    max_tokens=self._batch_max_tokens(len(texts)),
+                    timeout=timeout
+                )
+        except Exception as e:
+            # 请求本身失败时逐条重试只会放大压力，整批返回None
+            logger.error(f"Error calling SiliconFlow API in batch: {e}")
+            return [None] * len(texts)
+        self._record_batch_latency(model, started)
+        self._record_usage(response)
+        results = self._parse_batch_response(texts, response.choices[0].message.content or "")
+        
+        # 只有缺失或无法解析的条目逐条重试，使用批量请求剩余的超时，熔断后不再发送
+        retries = [index for index, result in enumerate(results) if result is None]
+        remaining = timeout - (time.perf_counter() - started)
+        if retries and remaining > 0 and not self._circuit_open():
+            logger.warning(f"Retrying {len(retries)} of {len(texts)} batch items individually")
+            retried = await asyncio.gather(*(self._arequest_analysis(texts[index], remaining) for index in retries))
+            for index, result in zip(retries, retried):
+                results[index] = result
+        await self._acache_store(texts, results)
+        return results
+    
+    def coalescing_stats(self) -> Dict[str, Any]:
+        """请求合并和批量统计"""
+        return {
+            "sync": self.flight.stats(),
+            "async": self.async_flight.stats(),
+            "batching": self.batcher.stats() if self.batcher else None
+        }
+    
+    @staticmethod
+    def _build_enhancement_messages(text: str, existing_entities: list) -> List[Dict[str, str]]:
+        prompt = f"""请分析以下文本中的实体，特别关注可能被遗漏的实体：
 
 文本："{text}"
 
@@ -155,25 +947,49 @@ class LLMClient:
 }}
 
 请确保返回有效的JSON格式，不要包含其他内容。"""
-
-            response = self.client.chat.completions.create(
+        return [{"role": "user", "content": prompt}]
+    
+    def enhance_entity_extraction(self, text: str, existing_entities: list,
+                                  deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """使用硅基流动大模型增强实体抽取"""
+        if not self.client or self._circuit_open():
+            return None
+        
+        try:
+            response = self._create(
                 model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
+                messages=self._build_enhancement_messages(text, existing_entities),
                 temperature=0.1,
-                max_tokens=800
+                max_tokens=800,
+                timeout=remaining_timeout(deadline, self.timeout)
             )
             
-            content = response.choices[0].message.content.strip()
+            content = self._strip_code_fence(response.choices[0].message.content)
+            return json.loads(content)
             
-            # 清理响应内容
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.endswith("```"):
-                content = content[:-3]
-            content = content.strip()
+        except Exception as e:
+            logger.error(f"Error in SiliconFlow entity enhancement: {e}")
+            return None
+    
+    async def aenhance_entity_extraction(self, text: str, existing_entities: list,
+                                         deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """异步增强实体抽取"""
+        if not self.async_client or self._circuit_open():
+            return None
+        
+        try:
+            async with self._get_semaphore():
+                response = await self._acreate(
+                    model=self.model_name,
+                    messages=self._build_enhancement_messages(text, existing_entities),
+                    temperature=0.1,
+                    max_tokens=800,
+                    timeout=remaining_timeout(deadline, self.timeout)
+                )
             
+            content = self._strip_code_fence(response.choices[0].message.content)
             return json.loads(content)
             
         except Exception as e:
             logger.error(f"Error in SiliconFlow entity enhancement: {e}")
-            return None
\ No newline at end of file
+            return None
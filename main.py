@@ -3,14 +3,17 @@
 """
 import sys
 import json
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, List, Optional
 from loguru import logger
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 
 from nlp_processor import NLPProcessor
-from models import ProcessingContext
+from models import CommandResult, ProcessingContext
+from config import PROCESS_BATCH_MAX_SIZE
 
 # 配置日志
 logger.add("logs/nlp_processor.log", rotation="1 day", retention="7 days")
@@ -24,12 +27,54 @@ app = FastAPI(title="语音控制机器人NLP服务", version="1.0.0")
 class CommandRequest(BaseModel):
     text: str
     context: Dict[str, Any] = {}
+    # 本次请求的时间预算（毫秒），为空时使用 REQUEST_DEADLINE_MS
+    deadline_ms: Optional[int] = None
 
 class CommandResponse(BaseModel):
     success: bool
     result: Dict[str, Any] = {}
     error: str = ""
 
+class BatchCommandRequest(BaseModel):
+    texts: List[str]
+    context: Dict[str, Any] = {}
+    deadline_ms: Optional[int] = None
+
+class BatchCommandResponse(BaseModel):
+    success: bool
+    # 与请求中的 texts 一一对应，单条失败时该条 success 为 false
+    results: List[CommandResponse] = []
+    error: str = ""
+
+def result_to_dict(result: CommandResult) -> Dict[str, Any]:
+    """把处理结果转换为接口返回的字典"""
+    return {
+        "original_text": result.original_text,
+        "intent": {
+            "type": result.intent.type,
+            "name": result.intent.name,
+            "confidence": result.intent.confidence,
+            "description": result.intent.description
+        },
+        "entities": [
+            {
+                "type": entity.type,
+                "value": entity.value,
+                "start": entity.start,
+                "end": entity.end,
+                "confidence": entity.confidence,
+                "normalized_value": entity.normalized_value
+            }
+            for entity in result.entities
+        ],
+        "confidence": result.confidence,
+        "structured_command": result.structured_command,
+        "is_valid": result.is_valid,
+        "validation_errors": result.validation_errors,
+        "degraded": result.degraded,
+        "timestamp": result.timestamp.isoformat()
+    }
+
 @app.post("/process", response_model=CommandResponse)
 async def process_command(request: CommandRequest):
     """处理语音指令API"""
@@ -37,46 +82,87 @@ async def process_command(request: CommandRequest):
         # 构建处理上下文
         context = ProcessingContext(**request.context) if request.context else None
         
-        # 处理指令
-        result = nlp_processor.process_command(request.text, context)
-        
-        # 转换为字典格式
-        result_dict = {
-            "original_text": result.original_text,
-            "intent": {
-                "type": result.intent.type,
-                "name": result.intent.name,
-                "confidence": result.intent.confidence,
-                "description": result.intent.description
-            },
-            "entities": [
-                {
-                    "type": entity.type,
-                    "value": entity.value,
-                    "start": entity.start,
-                    "end": entity.end,
-                    "confidence": entity.confidence,
-                    "normalized_value": entity.normalized_value
-                }
-                for entity in result.entities
-            ],
-            "confidence": result.confidence,
-            "structured_command": result.structured_command,
-            "is_valid": result.is_valid,
-            "validation_errors": result.validation_errors,
-            "timestamp": result.timestamp.isoformat()
-        }
+        # 处理指令，等待大模型期间事件循环可以处理其他请求
+        result = await nlp_processor.aprocess_command(request.text, context, deadline_ms=request.deadline_ms)
         
-        return CommandResponse(success=True, result=result_dict)
+        return CommandResponse(success=True, result=result_to_dict(result))
         
     except Exception as e:
         logger.error(f"Error processing command: {e}")
         return CommandResponse(success=False, error=str(e))
 
+@app.post("/process/stream")
+async def process_command_stream(request: CommandRequest):
+    """流式处理语音指令API，按行返回JSON：意图确定后先返回 intent 事件，处理完成后返回 result 事件"""
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def run():
+        try:
+            context = ProcessingContext(**request.context) if request.context else None
+            result = await nlp_processor.aprocess_command(
+                request.text, context,
+                on_intent=lambda intent: queue.put_nowait({"event": "intent", "intent": intent.model_dump()}),
+                deadline_ms=request.deadline_ms
+            )
+            queue.put_nowait({"event": "result", "success": True, "result": result_to_dict(result)})
+        except Exception as e:
+            logger.error(f"Error processing command: {e}")
+            queue.put_nowait({"event": "result", "success": False, "error": str(e)})
+    
+    async def events():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event = await queue.get()
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+                if event["event"] == "result":
+                    break
+        finally:
+            if not task.done():
+                task.cancel()
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/process/batch", response_model=BatchCommandResponse)
+async def process_command_batch(request: BatchCommandRequest):
+    """批量处理语音指令API，结果顺序与请求一致，单条指令失败不影响其余指令"""
+    if len(request.texts) > PROCESS_BATCH_MAX_SIZE:
+        return BatchCommandResponse(
+            success=False, error=f"批量指令数 {len(request.texts)} 超过上限 {PROCESS_BATCH_MAX_SIZE}"
+        )
+    try:
+        context = ProcessingContext(**request.context) if request.context else None
+        results = await nlp_processor.aprocess_batch(request.texts, context, deadline_ms=request.deadline_ms)
+        return BatchCommandResponse(success=True, results=[
+            CommandResponse(success=False, error=str(result)) if isinstance(result, Exception)
+            else CommandResponse(success=True, result=result_to_dict(result))
+            for result in results
+        ])
+    except Exception as e:
+        logger.error(f"Error processing command batch: {e}")
+        return BatchCommandResponse(success=False, error=str(e))
+
 @app.get("/health")
 async def health_check():
-    """健康检查"""
-    return {"status": "healthy", "service": "nlp_processor"}
+    """健康检查，大模型熔断时状态为 degraded，指令只使用规则识别"""
+    breaker = nlp_processor.llm_client.breaker.stats()
+    status = "degraded" if breaker["state"] == "open" else "healthy"
+    return {"status": status, "service": "nlp_processor", "llm_circuit": breaker}
+
+@app.get("/stats")
+async def get_stats():
+    """级联、大模型缓存、请求合并、大模型耗时、token用量、模型路由、对冲请求和降级统计"""
+    cache = nlp_processor.llm_client.cache
+    return {
+        "cascade": nlp_processor.get_cascade_stats(),
+        "llm_cache": cache.stats() if cache else None,
+        "llm_coalescing": nlp_processor.llm_client.coalescing_stats(),
+        "llm_latency_ms": nlp_processor.llm_client.latency.summary(),
+        "llm_tokens": nlp_processor.llm_client.tokens.summary(),
+        "llm_routing": nlp_processor.llm_client.router.stats(),
+        "llm_hedging": nlp_processor.llm_client.hedging_stats(),
+        "degraded_results": nlp_processor.degraded_results
+    }
 
 def process_command_cli(text: str) -> None:
     """命令行处理接口"""
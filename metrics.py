@@ -0,0 +1,82 @@
+"""
+运行指标模块
+按名称记录最近的耗时样本计算分位数，并累计token用量
+"""
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class LatencyTracker:
+    """滑动窗口内的延迟分位数统计（单位：毫秒）"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, milliseconds: float) -> None:
+        """记录一次耗时"""
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+                self._counts[name] = 0
+            samples.append(milliseconds)
+            self._counts[name] += 1
+
+    def count(self, name: str) -> int:
+        """窗口内的样本数"""
+        with self._lock:
+            return len(self._samples.get(name, ()))
+
+    def percentile(self, name: str, percent: float) -> Optional[float]:
+        """窗口内样本的分位数，没有样本时返回None"""
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(percent / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """各项耗时的样本数和 p50/p95/p99"""
+        with self._lock:
+            names = list(self._samples)
+        result = {}
+        for name in names:
+            result[name] = {
+                "count": self._counts[name],
+                "p50": self.percentile(name, 50),
+                "p95": self.percentile(name, 95),
+                "p99": self.percentile(name, 99)
+            }
+        return result
+
+
+class TokenCounter:
+    """按名称累计token数"""
+
+    def __init__(self):
+        self._totals: Dict[str, int] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, tokens: int) -> None:
+        """记录一次请求的token数"""
+        with self._lock:
+            self._totals[name] = self._totals.get(name, 0) + tokens
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """各项的请求数、累计和平均token数"""
+        with self._lock:
+            return {
+                name: {
+                    "count": self._counts[name],
+                    "total": total,
+                    "average": total / self._counts[name]
+                }
+                for name, total in self._totals.items()
+            }
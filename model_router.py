@@ -0,0 +1,110 @@
+"""
+模型路由模块
+短指令或歧义较小的指令先交给小模型，小模型置信度不足或输出无效时升级到大模型
+"""
+import threading
+from typing import Any, Dict, List, Optional
+
+from metrics import LatencyTracker
+from config import (
+    MODEL_NAME, LLM_SMALL_MODEL_NAME, LLM_ROUTER_MAX_SMALL_LENGTH,
+    LLM_ROUTER_MIN_SMALL_CONFIDENCE, LLM_ROUTER_INTENT_POLICY
+)
+
+
+class ModelRouter:
+    """小模型和大模型之间的路由"""
+
+    def __init__(self, large_model: str = MODEL_NAME, small_model: str = LLM_SMALL_MODEL_NAME,
+                 max_small_length: int = LLM_ROUTER_MAX_SMALL_LENGTH,
+                 min_small_confidence: float = LLM_ROUTER_MIN_SMALL_CONFIDENCE,
+                 intent_policy: Optional[Dict[str, str]] = None):
+        self.large_model = large_model
+        # 未配置小模型时所有请求都使用大模型
+        self.small_model = small_model or None
+        self.max_small_length = max_small_length
+        self.min_small_confidence = min_small_confidence
+        self.intent_policy = LLM_ROUTER_INTENT_POLICY if intent_policy is None else intent_policy
+
+        self.latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self._requests: Dict[str, int] = {}
+        self._escalations: Dict[str, int] = {}
+        # 批量模式的请求不经过路由，固定使用大模型，单独计数
+        self._batch_requests: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.small_model is not None and self.small_model != self.large_model
+
+    def choose(self, text: str, candidates: Optional[List[str]] = None) -> str:
+        """选择首次调用的模型"""
+        if not self.enabled:
+            return self.large_model
+
+        candidates = candidates or []
+        policies = [self.intent_policy.get(intent_type, "auto") for intent_type in candidates]
+        if "large" in policies:
+            return self.large_model
+        if policies and policies[0] == "small":
+            return self.small_model
+
+        # 指令较短，或规则阶段只有一个候选意图时歧义较小
+        if len(text) <= self.max_small_length or len(candidates) == 1:
+            return self.small_model
+        return self.large_model
+
+    def needs_escalation(self, model: str, response: Optional[Any]) -> bool:
+        """小模型的结果无效、置信度不足或识别为必须由大模型处理的意图时需要升级，不计数"""
+        if model == self.large_model:
+            return False
+        return (
+            response is None
+            or response.intent_confidence < self.min_small_confidence
+            or self.intent_policy.get(response.intent_type) == "large"
+        )
+
+    def should_escalate(self, model: str, response: Optional[Any]) -> bool:
+        """判断是否升级到大模型，升级时计数"""
+        escalate = self.needs_escalation(model, response)
+        if escalate:
+            with self._lock:
+                self._escalations[model] = self._escalations.get(model, 0) + 1
+        return escalate
+
+    def record(self, model: str, milliseconds: float) -> None:
+        """记录一次模型调用的耗时"""
+        with self._lock:
+            self._requests[model] = self._requests.get(model, 0) + 1
+        self.latency.record(model, milliseconds)
+
+    def record_batch(self, model: str, milliseconds: float) -> None:
+        """记录一次批量请求的耗时，与单条请求分开统计"""
+        with self._lock:
+            self._batch_requests[model] = self._batch_requests.get(model, 0) + 1
+        self.latency.record(f"{model}:batch", milliseconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """各模型的请求数、p50/p99耗时、升级率和批量请求数"""
+        with self._lock:
+            requests = dict(self._requests)
+            escalations = dict(self._escalations)
+            batch_requests = dict(self._batch_requests)
+        models = {}
+        for model in list(requests) + [model for model in batch_requests if model not in requests]:
+            count = requests.get(model, 0)
+            models[model] = {
+                "requests": count,
+                "p50_ms": self.latency.percentile(model, 50),
+                "p99_ms": self.latency.percentile(model, 99),
+                "escalations": escalations.get(model, 0),
+                "escalation_rate": escalations.get(model, 0) / count if count else 0.0,
+                "batch_requests": batch_requests.get(model, 0),
+                "batch_p50_ms": self.latency.percentile(f"{model}:batch", 50)
+            }
+        return {
+            "enabled": self.enabled,
+            "small_model": self.small_model,
+            "large_model": self.large_model,
+            "models": models
+        }
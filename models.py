@@ -15,6 +15,34 @@ class Entity(BaseModel):
     confidence: float = Field(default=1.0, description="置信度")
     normalized_value: Optional[Dict[str, Any]] = Field(default=None, description="标准化后的值")
 
+class Span:
+    """流水线内部使用的轻量实体，不做校验，在接口边界再转换为Entity"""
+    __slots__ = ("type", "value", "start", "end", "confidence", "normalized_value", "source")
+    
+    def __init__(self, type: str, value: str, start: int, end: int, confidence: float = 1.0,
+                 normalized_value: Optional[Dict[str, Any]] = None, source: str = "regex"):
+        self.type = type
+        self.value = value
+        self.start = start
+        self.end = end
+        self.confidence = confidence
+        self.normalized_value = normalized_value
+        self.source = source
+    
+    def __repr__(self) -> str:
+        return f"Span({self.type}={self.value!r}, {self.start}-{self.end}, {self.confidence}, {self.source})"
+    
+    def to_entity(self) -> Entity:
+        """转换为对外的Entity"""
+        return Entity(
+            type=self.type,
+            value=self.value,
+            start=self.start,
+            end=self.end,
+            confidence=self.confidence,
+            normalized_value=self.normalized_value
+        )
+
 class Intent(BaseModel):
     """意图信息"""
     type: str = Field(description="意图类型")
@@ -36,6 +64,7 @@ class CommandResult(BaseModel):
     # 执行状态
     is_valid: bool = Field(default=True, description="指令是否有效")
     validation_errors: List[str] = Field(default=[], description="验证错误信息")
+    degraded: bool = Field(default=False, description="大模型超时或调用失败，降级为规则识别结果")
 
 class ProcessingContext(BaseModel):
     """处理上下文"""
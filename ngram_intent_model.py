@@ -0,0 +1,164 @@
+"""
+字符n-gram意图模型
+基于哈希字符n-gram特征的线性分类器（仅依赖NumPy），介于规则和大模型之间的快速识别层
+用法:
+    python ngram_intent_model.py train 标注数据.jsonl 模型输出.npz
+    python ngram_intent_model.py predict 模型.npz "巡检A区主柜温度"
+标注数据每行一个JSON对象，包含 text 和 intent（或大模型输出中的 intent_type）字段。
+"""
+import sys
+import json
+import zlib
+import random
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+class NgramIntentModel:
+    """哈希字符n-gram线性意图分类器"""
+
+    def __init__(self, labels: Sequence[str], weights: np.ndarray, bias: np.ndarray,
+                 n_features: int = 2 ** 17, ngram_range: Tuple[int, int] = (1, 3)):
+        self.labels = list(labels)
+        self.weights = weights
+        self.bias = bias
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+
+    @staticmethod
+    def featurize(text: str, n_features: int, ngram_range: Tuple[int, int]) -> np.ndarray:
+        """提取字符n-gram并哈希为特征下标（使用crc32，保证跨进程稳定）"""
+        padded = f"\x02{text}\x03"
+        min_n, max_n = ngram_range
+        indices = []
+        for n in range(min_n, max_n + 1):
+            for start in range(len(padded) - n + 1):
+                gram = padded[start:start + n]
+                indices.append(zlib.crc32(gram.encode("utf-8")) % n_features)
+        return np.array(indices, dtype=np.int64)
+
+    def predict_proba(self, text: str) -> np.ndarray:
+        """各意图的概率"""
+        indices = self.featurize(text, self.n_features, self.ngram_range)
+        logits = self.weights[indices].sum(axis=0) + self.bias
+        return _softmax(logits)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """返回概率最高的意图及其概率"""
+        probabilities = self.predict_proba(text)
+        best = int(np.argmax(probabilities))
+        return self.labels[best], float(probabilities[best])
+
+    @classmethod
+    def train(cls, texts: Sequence[str], labels: Sequence[str], n_features: int = 2 ** 17,
+              ngram_range: Tuple[int, int] = (1, 3), epochs: int = 10, learning_rate: float = 0.5,
+              l2: float = 1e-6, seed: int = 42) -> "NgramIntentModel":
+        """使用随机梯度下降训练多分类逻辑回归"""
+        label_names = sorted(set(labels))
+        label_index = {label: index for index, label in enumerate(label_names)}
+        features = [cls.featurize(text, n_features, ngram_range) for text in texts]
+        targets = [label_index[label] for label in labels]
+
+        weights = np.zeros((n_features, len(label_names)), dtype=np.float32)
+        bias = np.zeros(len(label_names), dtype=np.float32)
+
+        rng = random.Random(seed)
+        order = list(range(len(features)))
+        for epoch in range(epochs):
+            rng.shuffle(order)
+            rate = learning_rate / (1 + epoch)
+            loss = 0.0
+            for sample in order:
+                indices = features[sample]
+                # 按n-gram数量归一化步长，避免长文本更新过大
+                step = rate / max(len(indices), 1)
+                probabilities = _softmax(weights[indices].sum(axis=0) + bias)
+                loss -= float(np.log(probabilities[targets[sample]] + 1e-12))
+                gradient = probabilities
+                gradient[targets[sample]] -= 1.0
+                np.add.at(weights, indices, -step * (gradient + l2 * weights[indices]))
+                bias -= rate * 0.1 * gradient
+            logger.info(f"Epoch {epoch + 1}/{epochs}: loss {loss / max(len(order), 1):.4f}")
+
+        return cls(label_names, weights, bias, n_features, ngram_range)
+
+    def save(self, path: str) -> None:
+        """保存为未压缩的npz文件，便于快速加载"""
+        np.savez(
+            path,
+            weights=self.weights,
+            bias=self.bias,
+            labels=np.array(self.labels),
+            n_features=np.array(self.n_features),
+            ngram_range=np.array(self.ngram_range)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "NgramIntentModel":
+        """加载模型"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                labels=[str(label) for label in data["labels"]],
+                weights=data["weights"],
+                bias=data["bias"],
+                n_features=int(data["n_features"]),
+                ngram_range=tuple(int(n) for n in data["ngram_range"])
+            )
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max())
+    return exp / exp.sum()
+
+
+def load_training_data(path: str) -> Tuple[List[str], List[str]]:
+    """读取标注数据，兼容人工标注和缓存的大模型输出"""
+    texts, labels = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            label = record.get("intent") or record.get("intent_type")
+            if "text" in record and label:
+                texts.append(record["text"])
+                labels.append(label)
+    return texts, labels
+
+
+def load_model(path: Optional[str]) -> Optional[NgramIntentModel]:
+    """按路径加载模型，文件不存在或加载失败时返回None"""
+    if not path:
+        return None
+    try:
+        model = NgramIntentModel.load(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Failed to load n-gram intent model {path}: {e}")
+        return None
+    logger.info(f"Loaded n-gram intent model {path} with {len(model.labels)} labels")
+    return model
+
+
+def main(argv: Iterable[str] = None):
+    args = list(argv if argv is not None else sys.argv[1:])
+    if len(args) == 3 and args[0] == "train":
+        texts, labels = load_training_data(args[1])
+        model = NgramIntentModel.train(texts, labels)
+        model.save(args[2])
+        print(f"模型已保存: {args[2]} ({len(texts)} 条样本, {len(model.labels)} 个意图)")
+    elif len(args) == 3 and args[0] == "predict":
+        model = NgramIntentModel.load(args[1])
+        label, probability = model.predict(args[2])
+        print(f"{label} ({probability:.3f})")
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
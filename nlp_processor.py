@@ -2,38 +2,414 @@
 自然语言处理主控制器
 整合意图识别、实体抽取和大模型分析功能
 """
-from typing import Dict, List, Optional, Any
+import asyncio
+import inspect
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, Dict, List, Optional, Any, Tuple, Union
 from loguru import logger
 
-from models import CommandResult, Intent, Entity, ProcessingContext
+from models import CommandResult, Intent, Entity, Span, ProcessingContext
 from intent_classifier import IntentClassifier
 from entity_extractor import EntityExtractor
-from llm_client import LLMClient
-from config import INTENT_TYPES
+from llm_client import LLMClient, locate_entities
+from span_resolver import resolve_overlaps
+from cascade import CascadePolicy
+from deadline import Deadline
+from grammar_snapshot import load_snapshot
+from config import (
+    INTENT_TYPES, ENTITY_TYPES, GRAMMAR_SNAPSHOT_ENABLED, LLM_STREAMING_ENABLED,
+    CONCURRENT_PROCESSING_ENABLED, PROCESS_MAX_WORKERS, LLM_BATCH_MAX_SIZE
+)
 
 class NLPProcessor:
     """自然语言处理器"""
     
     def __init__(self):
-        self.intent_classifier = IntentClassifier()
-        self.entity_extractor = EntityExtractor()
+        # 有可用的语法快照时直接加载，避免重新编译
+        snapshot = load_snapshot() if GRAMMAR_SNAPSHOT_ENABLED else None
+        
+        self.intent_classifier = IntentClassifier(snapshot=snapshot["intent_classifier"] if snapshot else None)
+        self.entity_extractor = EntityExtractor(snapshot=snapshot["entity_extractor"] if snapshot else None)
         self.llm_client = LLMClient()
+        self.cascade = CascadePolicy()
+        self.streaming = LLM_STREAMING_ENABLED
+        self.concurrent = CONCURRENT_PROCESSING_ENABLED
+        # 调用了大模型但超时或失败、降级为规则结果的次数，并发处理时在锁内计数
+        self.degraded_results = 0
+        self._degraded_lock = threading.Lock()
+        # 并发处理使用的线程池，首次使用时创建
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        
+    def process_command(self, text: str, context: Optional[ProcessingContext] = None,
+                        on_intent: Optional[Callable[[Intent], Any]] = None,
+                        deadline_ms: Optional[float] = None) -> CommandResult:
+        """处理语音指令
+        
+        on_intent 在意图确定后立即回调一次：规则结果足够确定时使用规则意图，
+        流式模式下在大模型输出意图字段后回调，其余情况在处理完成时回调。
+        deadline_ms 为本次请求的时间预算，为空时使用 REQUEST_DEADLINE_MS。
+        """
+        deadline = Deadline.from_ms(deadline_ms)
+        if self.concurrent:
+            return self._process_concurrently(text, on_intent, deadline)
+        
+        rule_based_intent, rule_based_entities, call_llm = self._analyze_rules(text)
+        
+        emitted = []
+        
+        def emit(intent: Intent) -> None:
+            if on_intent and not emitted:
+                emitted.append(intent)
+                on_intent(intent)
+        
+        # 第二阶段：规则结果不够确定时使用大模型进行深度分析
+        if not call_llm:
+            emit(rule_based_intent)
+            llm_result = None
+        else:
+            llm_result = self._call_llm(
+                text, self._prompt_candidates(text), deadline,
+                lambda intent_type, confidence: emit(
+                    self._choose_intent(rule_based_intent, intent_type, confidence)
+                )
+            )
+        
+        result = self._build_result(text, rule_based_intent, rule_based_entities, llm_result, call_llm)
+        emit(result.intent)
+        return result
+    
+    def _process_concurrently(self, text: str, on_intent: Optional[Callable[[Intent], Any]],
+                              deadline: Optional[Deadline]) -> CommandResult:
+        """并发处理：规则意图已能确定需要大模型时，大模型调用在线程池中立即开始，实体抽取同时进行
+        
+        意图明确、是否调用大模型取决于实体是否完整时，等级联策略决定后再调用，
+        规则结果足够确定的指令不会产生大模型调用。
+        """
+        executor = self._get_executor()
+        lock = threading.Lock()
+        emitted = []
+        
+        def emit(intent: Intent) -> None:
+            with lock:
+                if not on_intent or emitted:
+                    return
+                emitted.append(intent)
+            on_intent(intent)
         
-    def process_command(self, text: str, context: Optional[ProcessingContext] = None) -> CommandResult:
-        """处理语音指令"""
         logger.info(f"Processing command: {text}")
+        rule_based_intent = self.intent_classifier.classify_intent(text)
         
-        # 第一阶段：使用规则和关键词进行初步分析
+        def submit_llm() -> Future:
+            return executor.submit(
+                self._call_llm, text, self._prompt_candidates(text), deadline,
+                lambda intent_type, confidence: emit(
+                    self._choose_intent(rule_based_intent, intent_type, confidence)
+                )
+            )
+        
+        llm_future = submit_llm() if self.cascade.prejudge(rule_based_intent) else None
+        _, rule_based_entities, call_llm = self._analyze_rules_with_intent(text, rule_based_intent)
+        
+        llm_result = None
+        if not call_llm:
+            emit(rule_based_intent)
+        else:
+            if llm_future is None:
+                llm_future = submit_llm()
+            # 规则结果缺少必需实体时，与大模型分析并行补充实体
+            enhance_future = None
+            if self._missing_entities(rule_based_intent, rule_based_entities):
+                enhance_future = executor.submit(
+                    self.llm_client.enhance_entity_extraction, text,
+                    self._entity_summary(rule_based_entities), deadline
+                )
+            llm_result = self._wait_future(llm_future, text, deadline)
+            if enhance_future is not None:
+                enhancement = self._wait_future(enhance_future, text, deadline)
+                rule_based_entities = self._apply_enhancement(text, rule_based_entities, enhancement)
+        
+        result = self._build_result(text, rule_based_intent, rule_based_entities, llm_result, call_llm)
+        emit(result.intent)
+        return result
+    
+    def _call_llm(self, text: str, candidates: Optional[List[str]], deadline: Optional[Deadline],
+                  on_llm_intent: Callable[[str, float], Any]) -> Optional[Any]:
+        """调用大模型分析指令，流式模式下意图字段到达时回调 on_llm_intent"""
+        if self.streaming:
+            return self.llm_client.analyze_command_stream(
+                text, on_intent=on_llm_intent, candidates=candidates, deadline=deadline
+            )
+        return self.llm_client.analyze_command(text, candidates=candidates, deadline=deadline)
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=PROCESS_MAX_WORKERS, thread_name_prefix="nlp")
+            return self._executor
+    
+    def _wait_future(self, future: Future, text: str, deadline: Optional[Deadline]) -> Optional[Any]:
+        """等待线程池中的大模型调用，超过截止时间时放弃等待"""
+        try:
+            return future.result(timeout=deadline.remaining() if deadline else None)
+        except FutureTimeoutError:
+            logger.warning(f"LLM did not respond within {deadline.budget_ms:.0f}ms, using rule result for: {text}")
+            return None
+    
+    async def aprocess_command(self, text: str, context: Optional[ProcessingContext] = None,
+                               on_intent: Optional[Callable[[Intent], Any]] = None,
+                               deadline_ms: Optional[float] = None) -> CommandResult:
+        """异步处理语音指令，等待大模型时不阻塞事件循环，on_intent 可以是协程函数
+        
+        大模型在截止时间前仍未返回时停止等待，返回标记为降级的规则结果。
+        """
+        deadline = Deadline.from_ms(deadline_ms)
+        
+        emitted = []
+        
+        async def emit(intent: Intent) -> None:
+            if on_intent and not emitted:
+                emitted.append(intent)
+                result = on_intent(intent)
+                if inspect.isawaitable(result):
+                    await result
+        
+        if self.concurrent:
+            return await self._aprocess_concurrently(text, emit, deadline)
+        
+        rule_based_intent, rule_based_entities, call_llm = self._analyze_rules(text)
+        
+        # 第二阶段：规则结果不够确定时使用大模型进行深度分析
+        if not call_llm:
+            await emit(rule_based_intent)
+            llm_result = None
+        else:
+            llm_result = await self._await_llm(self._acall_llm(
+                text, self._prompt_candidates(text), deadline,
+                lambda intent_type, confidence: emit(
+                    self._choose_intent(rule_based_intent, intent_type, confidence)
+                )
+            ), text, deadline)
+        
+        result = self._build_result(text, rule_based_intent, rule_based_entities, llm_result, call_llm)
+        await emit(result.intent)
+        return result
+    
+    async def _aprocess_concurrently(self, text: str, emit: Callable[[Intent], Awaitable[None]],
+                                     deadline: Optional[Deadline]) -> CommandResult:
+        """异步并发处理：规则意图已能确定需要大模型时立即发出请求，实体抽取在线程池中同时进行"""
+        loop = asyncio.get_running_loop()
+        logger.info(f"Processing command: {text}")
         rule_based_intent = self.intent_classifier.classify_intent(text)
-        rule_based_entities = self.entity_extractor.extract_entities(text)
         
-        # 第二阶段：使用大模型进行深度分析
-        llm_result = self.llm_client.analyze_command(text)
+        async def on_llm_intent(intent_type: str, confidence: float) -> None:
+            await emit(self._choose_intent(rule_based_intent, intent_type, confidence))
+        
+        def start_llm() -> asyncio.Future:
+            return asyncio.ensure_future(
+                self._acall_llm(text, self._prompt_candidates(text), deadline, on_llm_intent)
+            )
+        
+        llm_task = start_llm() if self.cascade.prejudge(rule_based_intent) else None
+        try:
+            _, rule_based_entities, call_llm = await loop.run_in_executor(
+                self._get_executor(), self._analyze_rules_with_intent, text, rule_based_intent
+            )
+        except BaseException:
+            if llm_task is not None:
+                llm_task.cancel()
+            raise
+        
+        llm_result = None
+        if not call_llm:
+            await emit(rule_based_intent)
+        else:
+            if llm_task is None:
+                llm_task = start_llm()
+            enhance_task = None
+            if self._missing_entities(rule_based_intent, rule_based_entities):
+                enhance_task = asyncio.ensure_future(self.llm_client.aenhance_entity_extraction(
+                    text, self._entity_summary(rule_based_entities), deadline
+                ))
+            llm_result = await self._await_llm(llm_task, text, deadline)
+            if enhance_task is not None:
+                enhancement = await self._await_llm(enhance_task, text, deadline)
+                rule_based_entities = self._apply_enhancement(text, rule_based_entities, enhancement)
+        
+        result = self._build_result(text, rule_based_intent, rule_based_entities, llm_result, call_llm)
+        await emit(result.intent)
+        return result
+    
+    async def _acall_llm(self, text: str, candidates: Optional[List[str]], deadline: Optional[Deadline],
+                         on_llm_intent: Callable[[str, float], Any]) -> Optional[Any]:
+        """异步调用大模型分析指令"""
+        if self.streaming:
+            return await self.llm_client.aanalyze_command_stream(
+                text, on_intent=on_llm_intent, candidates=candidates, deadline=deadline
+            )
+        return await self.llm_client.aanalyze_command(text, candidates=candidates, deadline=deadline)
+    
+    async def _await_llm(self, call: Awaitable[Any], text: str, deadline: Optional[Deadline]) -> Optional[Any]:
+        """等待大模型结果，超过截止时间时放弃等待；合并的共享调用会继续执行并写入缓存"""
+        if deadline is None:
+            return await call
+        try:
+            return await asyncio.wait_for(call, deadline.remaining())
+        except asyncio.TimeoutError:
+            logger.warning(f"LLM did not respond within {deadline.budget_ms:.0f}ms, using rule result for: {text}")
+            return None
+    
+    def process_batch(self, texts: List[str], context: Optional[ProcessingContext] = None,
+                      deadline_ms: Optional[float] = None) -> List[Union[CommandResult, Exception]]:
+        """批量处理语音指令，结果与输入顺序一致
+        
+        相同的文本只处理一次；规则阶段的意图批量计分，实体抽取在线程池中进行；
+        需要大模型的指令按 LLM_BATCH_MAX_SIZE 分组，每组一次批量请求。
+        单条指令处理失败时对应位置为异常对象，不影响其余指令。
+        """
+        deadline = Deadline.from_ms(deadline_ms)
+        unique = list(dict.fromkeys(texts))
+        executor = self._get_executor()
+        
+        intents = self.intent_classifier.classify_intent_batch(unique) if unique else []
+        rule_futures = [executor.submit(self._analyze_rules_with_intent, text, intent)
+                        for text, intent in zip(unique, intents)]
+        rules = {}
+        for text, future in zip(unique, rule_futures):
+            try:
+                rules[text] = future.result()
+            except Exception as e:
+                rules[text] = e
+        
+        chunks = self._llm_chunks(texts, unique, rules)
+        llm_futures = [executor.submit(self.llm_client.analyze_commands_batch, chunk) for chunk in chunks]
+        llm_results = {}
+        for chunk, future in zip(chunks, llm_futures):
+            try:
+                responses = self._wait_future(future, f"batch of {len(chunk)} commands", deadline)
+            except Exception as e:
+                logger.error(f"Batch LLM analysis failed: {e}")
+                responses = None
+            llm_results.update(zip(chunk, responses or [None] * len(chunk)))
+        
+        return self._build_batch_results(texts, rules, llm_results)
+    
+    async def aprocess_batch(self, texts: List[str], context: Optional[ProcessingContext] = None,
+                             deadline_ms: Optional[float] = None) -> List[Union[CommandResult, Exception]]:
+        """异步批量处理语音指令，规则阶段在线程池中进行，各组大模型批量请求同时发出"""
+        deadline = Deadline.from_ms(deadline_ms)
+        unique = list(dict.fromkeys(texts))
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        
+        intents = []
+        if unique:
+            intents = await loop.run_in_executor(executor, self.intent_classifier.classify_intent_batch, unique)
+        analyzed = await asyncio.gather(*(
+            loop.run_in_executor(executor, self._analyze_rules_with_intent, text, intent)
+            for text, intent in zip(unique, intents)
+        ), return_exceptions=True)
+        rules = dict(zip(unique, analyzed))
+        
+        chunks = self._llm_chunks(texts, unique, rules)
+        responses = await asyncio.gather(*(
+            self._await_llm(self.llm_client.aanalyze_commands_batch(chunk), f"batch of {len(chunk)} commands", deadline)
+            for chunk in chunks
+        ), return_exceptions=True)
+        llm_results = {}
+        for chunk, response in zip(chunks, responses):
+            if isinstance(response, Exception):
+                logger.error(f"Batch LLM analysis failed: {response}")
+                response = None
+            llm_results.update(zip(chunk, response or [None] * len(chunk)))
+        
+        return self._build_batch_results(texts, rules, llm_results)
+    
+    def _llm_chunks(self, texts: List[str], unique: List[str], rules: Dict[str, Any]) -> List[List[str]]:
+        """规则分析成功且需要大模型的指令，按 LLM_BATCH_MAX_SIZE 分组"""
+        pending = [text for text in unique if not isinstance(rules[text], Exception) and rules[text][2]]
+        logger.info(f"Batch of {len(texts)} commands, {len(unique)} unique, {len(pending)} need LLM")
+        size = max(1, LLM_BATCH_MAX_SIZE)
+        return [pending[offset:offset + size] for offset in range(0, len(pending), size)]
+    
+    def _build_batch_results(self, texts: List[str], rules: Dict[str, Any],
+                             llm_results: Dict[str, Any]) -> List[Union[CommandResult, Exception]]:
+        """逐条构建结果并按输入顺序展开，重复的文本共享同一结果"""
+        results = {}
+        for text, analyzed in rules.items():
+            if isinstance(analyzed, Exception):
+                logger.error(f"Error processing command in batch: {text}: {analyzed}")
+                results[text] = analyzed
+                continue
+            rule_based_intent, rule_based_entities, call_llm = analyzed
+            try:
+                results[text] = self._build_result(
+                    text, rule_based_intent, rule_based_entities, llm_results.get(text), call_llm
+                )
+            except Exception as e:
+                logger.error(f"Error processing command in batch: {text}: {e}")
+                results[text] = e
+        return [results[text] for text in texts]
+    
+    @staticmethod
+    def _entity_summary(entities: List[Span]) -> List[Dict[str, str]]:
+        """已识别实体的类型和文本，作为补充实体时的参考"""
+        return [{"type": span.type, "value": span.value} for span in entities]
+    
+    def _apply_enhancement(self, text: str, entities: List[Span], enhancement: Optional[Dict[str, Any]]) -> List[Span]:
+        """合并大模型补充的实体，位置按原文重新计算"""
+        if not enhancement:
+            return entities
+        pairs = [
+            (item.get("type"), item.get("value"))
+            for item in enhancement.get("additional_entities", [])
+            if isinstance(item, dict)
+        ]
+        additions = [
+            Span(type=entity["type"], value=entity["value"], start=entity["start"], end=entity["end"],
+                 confidence=0.85, source="llm")
+            for entity in locate_entities(text, pairs)
+            if entity["type"] in ENTITY_TYPES
+        ]
+        if additions:
+            logger.debug(f"LLM enhancement added {len(additions)} entities for: {text}")
+        return self._merge_entities(entities, additions)
+    
+    def _analyze_rules(self, text: str) -> Tuple[Intent, List[Span], bool]:
+        """第一阶段：使用规则和关键词进行初步分析，并决定是否需要大模型"""
+        logger.info(f"Processing command: {text}")
+        
+        return self._analyze_rules_with_intent(text, self.intent_classifier.classify_intent(text))
+    
+    def _analyze_rules_with_intent(self, text: str, rule_based_intent: Intent) -> Tuple[Intent, List[Span], bool]:
+        """已知规则意图时抽取实体，并决定是否需要大模型"""
+        rule_based_entities = self.entity_extractor.extract_spans(text)
         
+        rule_valid, _ = self._validate_command(rule_based_intent, rule_based_entities)
+        call_llm = self.cascade.should_call_llm(rule_based_intent, rule_valid)
+        return rule_based_intent, rule_based_entities, call_llm
+    
+    def _prompt_candidates(self, text: str) -> Optional[List[str]]:
+        """规则阶段得分最高的候选意图，用于精简大模型提示词；没有候选时使用完整提示词"""
+        top_k = self.llm_client.prompt_top_k
+        if top_k <= 0:
+            return None
+        return self.intent_classifier.candidate_intents(text, top_k) or None
+    
+    def _build_result(self, text: str, rule_based_intent: Intent, rule_based_entities: List[Span],
+                      llm_result: Optional[Any], call_llm: bool) -> CommandResult:
+        """融合、验证并构建处理结果"""
         # 第三阶段：融合结果
         final_intent, final_entities, structured_command = self._merge_results(
             text, rule_based_intent, rule_based_entities, llm_result
         )
+        if not call_llm:
+            logger.debug(f"Rule result is decisive, skipped LLM for: {text}")
+            structured_command = self.build_structured_command(final_intent, final_entities)
+        elif llm_result is not None and not structured_command:
+            # 紧凑输出格式不含结构化指令，由融合后的结果在本地生成
+            structured_command = self.build_structured_command(final_intent, final_entities)
         
         # 第四阶段：验证和结构化
         is_valid, validation_errors = self._validate_command(final_intent, final_entities)
@@ -41,21 +417,33 @@ class NLPProcessor:
         # 计算整体置信度
         overall_confidence = self._calculate_confidence(final_intent, final_entities, llm_result)
         
-        # 构建结果
+        # 调用了大模型但超时或失败时，结果降级为规则结果；未配置大模型时规则结果即为正常结果
+        degraded = call_llm and llm_result is None and self.llm_client.enabled
+        if degraded:
+            with self._degraded_lock:
+                self.degraded_results += 1
+            structured_command = self.build_structured_command(final_intent, final_entities)
+        
+        # 构建结果，内部实体在此转换为Entity
         result = CommandResult(
             original_text=text,
             intent=final_intent,
-            entities=final_entities,
+            entities=[span.to_entity() for span in final_entities],
             confidence=overall_confidence,
             structured_command=structured_command,
             is_valid=is_valid,
-            validation_errors=validation_errors
+            validation_errors=validation_errors,
+            degraded=degraded
         )
         
         logger.info(f"Command processed: {result.intent.type} with confidence {result.confidence:.2f}")
         return result
     
-    def _merge_results(self, text: str, rule_intent: Intent, rule_entities: List[Entity], 
+    def get_cascade_stats(self) -> Dict[str, Any]:
+        """级联命中统计"""
+        return self.cascade.stats()
+    
+    def _merge_results(self, text: str, rule_intent: Intent, rule_entities: List[Span], 
                       llm_result: Optional[Any]) -> tuple:
         """融合规则和大模型的结果"""
         
@@ -66,24 +454,18 @@ class NLPProcessor:
         
         if llm_result:
             # 比较意图识别结果
-            if llm_result.intent_confidence > rule_intent.confidence:
-                # 使用大模型的意图识别结果
-                final_intent = Intent(
-                    type=llm_result.intent_type,
-                    name=INTENT_TYPES.get(llm_result.intent_type, {}).get("name", "未知"),
-                    confidence=llm_result.intent_confidence,
-                    description=INTENT_TYPES.get(llm_result.intent_type, {}).get("description", "")
-                )
+            final_intent = self._choose_intent(rule_intent, llm_result.intent_type, llm_result.intent_confidence)
             
             # 合并实体识别结果
             llm_entities = []
             for entity_data in llm_result.entities:
-                llm_entity = Entity(
-                    type=entity_data["type"],
-                    value=entity_data["value"],
-                    start=entity_data["start"],
-                    end=entity_data["end"],
-                    confidence=0.9  # 大模型实体的置信度
+                llm_entity = Span(
+                    type=str(entity_data["type"]),
+                    value=str(entity_data["value"]),
+                    start=int(entity_data["start"]),
+                    end=int(entity_data["end"]),
+                    confidence=0.9,  # 大模型实体的置信度
+                    source="llm"
                 )
                 llm_entities.append(llm_entity)
             
@@ -95,30 +477,28 @@ class NLPProcessor:
         
         return final_intent, final_entities, structured_command
     
-    def _merge_entities(self, rule_entities: List[Entity], llm_entities: List[Entity]) -> List[Entity]:
+    def _choose_intent(self, rule_intent: Intent, intent_type: str, confidence: float) -> Intent:
+        """大模型意图置信度更高时使用大模型的意图识别结果"""
+        if confidence <= rule_intent.confidence:
+            return rule_intent
+        return Intent(
+            type=intent_type,
+            name=INTENT_TYPES.get(intent_type, {}).get("name", "未知"),
+            confidence=confidence,
+            description=INTENT_TYPES.get(intent_type, {}).get("description", "")
+        )
+    
+    def _merge_entities(self, rule_entities: List[Span], llm_entities: List[Span]) -> List[Span]:
         """合并不同来源的实体"""
-        merged = []
-        
-        # 添加大模型实体
-        for llm_entity in llm_entities:
-            merged.append(llm_entity)
-        
-        # 添加规则实体（如果不重叠）
-        for rule_entity in rule_entities:
-            overlapped = False
-            for existing in merged:
-                if (rule_entity.start < existing.end and rule_entity.end > existing.start):
-                    overlapped = True
-                    break
-            
-            if not overlapped:
-                merged.append(rule_entity)
-        
-        # 按位置排序
-        merged.sort(key=lambda x: x.start)
-        return merged
+        return resolve_overlaps((span, span.source) for span in llm_entities + rule_entities)
     
-    def _validate_command(self, intent: Intent, entities: List[Entity]) -> tuple:
+    def _missing_entities(self, intent: Intent, entities: List[Span]) -> List[str]:
+        """意图要求但尚未识别出的实体类型"""
+        required_entities = INTENT_TYPES.get(intent.type, {}).get("required_entities", [])
+        entity_types = {entity.type for entity in entities}
+        return [required_entity for required_entity in required_entities if required_entity not in entity_types]
+    
+    def _validate_command(self, intent: Intent, entities: List[Span]) -> tuple:
         """验证指令的完整性"""
         errors = []
         
@@ -131,22 +511,14 @@ class NLPProcessor:
             return False, errors
         
         # 检查必需实体
-        config = INTENT_TYPES[intent.type]
-        required_entities = config.get("required_entities", [])
-        entity_types = [entity.type for entity in entities]
-        
-        missing_entities = []
-        for required_entity in required_entities:
-            if required_entity not in entity_types:
-                missing_entities.append(required_entity)
-        
+        missing_entities = self._missing_entities(intent, entities)
         if missing_entities:
             errors.append(f"缺少必需的实体: {', '.join(missing_entities)}")
         
         is_valid = len(errors) == 0
         return is_valid, errors
     
-    def _calculate_confidence(self, intent: Intent, entities: List[Entity], 
+    def _calculate_confidence(self, intent: Intent, entities: List[Span], 
                             llm_result: Optional[Any]) -> float:
         """计算整体置信度"""
         # 意图置信度权重0.5
@@ -166,7 +538,7 @@ class NLPProcessor:
         overall_confidence = intent_score + entity_score + llm_score
         return min(1.0, overall_confidence)
     
-    def build_structured_command(self, intent: Intent, entities: List[Entity]) -> Dict[str, Any]:
+    def build_structured_command(self, intent: Intent, entities: List[Union[Entity, Span]]) -> Dict[str, Any]:
         """构建结构化指令"""
         structured = {
             "action": intent.type,
@@ -185,7 +557,7 @@ class NLPProcessor:
             }
             
             if entity.normalized_value:
-                entity_info["normalized"] = entity.normalized_value
+                entity_info["normalized"] = dict(entity.normalized_value)
             
             entity_dict[entity.type].append(entity_info)
         
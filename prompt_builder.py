@@ -0,0 +1,135 @@
+"""
+提示词构建模块
+由缓存的提示词片段按规则阶段的候选意图组装精简提示词，并估算输入token数
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import INTENT_TYPES, ENTITY_TYPES
+
+# 完整输出格式：包含实体位置、推理过程和结构化指令
+FULL_OUTPUT_FORMAT = """
+请分析用户输入的文本，返回JSON格式的结果，包含：
+1. intent_type: 识别的意图类型
+2. intent_confidence: 意图识别的置信度 (0-1)
+3. entities: 提取的实体列表，每个实体包含type、value、start、end
+4. reasoning: 分析推理过程
+5. structured_command: 结构化的指令参数
+
+示例输入："巡检A区2号房主柜温度"
+示例输出：
+{
+    "intent_type": "patrol_inspection",
+    "intent_confidence": 0.95,
+    "entities": [
+        {"type": "location", "value": "A区", "start": 2, "end": 4},
+        {"type": "location", "value": "2号房", "start": 4, "end": 7},
+        {"type": "equipment", "value": "主柜", "start": 7, "end": 9},
+        {"type": "parameter", "value": "温度", "start": 9, "end": 11}
+    ],
+    "reasoning": "用户要求巡检A区2号房的主柜温度，这是一个典型的巡检指令",
+    "structured_command": {
+        "action": "patrol_inspection",
+        "location": {"zone": "A", "room": "2"},
+        "equipment": "主柜",
+        "parameter": "温度"
+    }
+}
+
+重要提示：
+1. 请严格按照JSON格式返回结果，不要包含其他内容
+2. 确保JSON格式正确，可以被Python json.loads()解析
+3. 如果无法识别意图，请将intent_type设为"unknown"
+4. 实体的start和end位置要准确对应原文中的字符位置"""
+
+# 紧凑输出格式：短字段名，只返回实体原文，位置和结构化指令在本地计算
+COMPACT_OUTPUT_FORMAT = """
+请分析用户输入的文本，返回单行紧凑JSON，字段：
+i: 意图类型；c: 意图置信度 (0-1)；e: 实体列表，每项为 [实体类型, 原文中的实体文本]，按出现顺序排列
+
+示例输入："巡检A区2号房主柜温度"
+示例输出：{"i":"patrol_inspection","c":0.95,"e":[["location","A区"],["location","2号房"],["equipment","主柜"],["parameter","温度"]]}
+
+重要提示：
+1. 只返回JSON，不要输出推理过程或其他内容，不要换行和缩进
+2. 实体文本必须与原文完全一致
+3. 无法识别意图时，i 取 "unknown"，c 取较低的置信度"""
+
+
+PROMPT_HEADER = "你是一个语音控制机器人的自然语言理解系统。你的任务是分析用户的语音指令，识别意图并提取相关实体。\n"
+
+# 估算token数：汉字按1个计，连续的字母数字按1个计，其余非空白符号各计1个
+_TOKEN_PATTERN = re.compile(r"[一-鿿]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_一-鿿]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的token数，用于比较提示词长度"""
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+class PromptBuilder:
+    """按候选意图组装系统提示词"""
+
+    def __init__(self, intent_types: Dict[str, Any] = INTENT_TYPES, entity_types: Dict[str, Any] = ENTITY_TYPES):
+        self.intent_types = intent_types
+        self.entity_types = entity_types
+
+        # 预先生成每个意图和实体类型的描述行
+        self.intent_lines = {
+            intent_type: f"- {intent_type}: {config['name']} - {config['description']}"
+            for intent_type, config in intent_types.items()
+        }
+        self.entity_lines = {
+            entity_type: f"- {entity_type}: {config['name']} - 例如: {', '.join(config['examples'][:3])}"
+            for entity_type, config in entity_types.items()
+        }
+        self.formats = {"full": FULL_OUTPUT_FORMAT, "compact": COMPACT_OUTPUT_FORMAT}
+        # 组装结果缓存：(输出格式, 意图集合) -> (提示词, 估算token数)
+        self._cache: Dict[Tuple[str, Optional[Tuple[str, ...]]], Tuple[str, int]] = {}
+
+    def select(self, candidates: Optional[Iterable[str]]) -> Optional[Tuple[str, ...]]:
+        """按配置顺序保留已知的候选意图，没有可用候选时返回None（使用完整提示词）"""
+        if candidates is None:
+            return None
+        wanted = set(candidates)
+        selected = tuple(intent_type for intent_type in self.intent_types if intent_type in wanted)
+        return selected or None
+
+    def entity_types_for(self, intents: Sequence[str]) -> List[str]:
+        """候选意图需要或允许的实体类型，按配置顺序排列"""
+        wanted = set()
+        for intent_type in intents:
+            config = self.intent_types[intent_type]
+            wanted.update(config.get("required_entities", []))
+            wanted.update(config.get("optional_entities", []))
+        return [entity_type for entity_type in self.entity_types if entity_type in wanted]
+
+    def build(self, candidates: Optional[Iterable[str]] = None, response_mode: str = "full") -> str:
+        """组装系统提示词，candidates 为None时包含全部意图和实体类型"""
+        return self.build_with_tokens(candidates, response_mode)[0]
+
+    def build_with_tokens(self, candidates: Optional[Iterable[str]] = None,
+                          response_mode: str = "full") -> Tuple[str, int]:
+        """组装系统提示词并返回估算的token数"""
+        intents = self.select(candidates)
+        key = (response_mode, intents)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        if intents is None:
+            intent_types = list(self.intent_types)
+            entity_types = list(self.entity_types)
+        else:
+            intent_types = list(intents)
+            entity_types = self.entity_types_for(intents)
+
+        prompt = (
+            PROMPT_HEADER
+            + "\n支持的意图类型：\n" + "\n".join(self.intent_lines[name] for name in intent_types)
+            + "\n\n支持的实体类型：\n" + "\n".join(self.entity_lines[name] for name in entity_types)
+            + "\n" + self.formats[response_mode]
+        )
+        result = (prompt, estimate_tokens(prompt))
+        self._cache[key] = result
+        return result
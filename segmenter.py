@@ -0,0 +1,86 @@
+"""
+分词模块
+可选的jieba分词器，延迟加载或在启动时预热，并使用持久化的词典缓存
+"""
+import os
+import threading
+from typing import Iterable, List, Optional, Set
+from loguru import logger
+
+from config import JIEBA_CACHE_FILE
+
+
+class Segmenter:
+    """jieba分词器封装"""
+
+    def __init__(self, cache_file: Optional[str] = JIEBA_CACHE_FILE, user_words: Iterable[str] = ()):
+        self.cache_file = cache_file
+        self.user_words = list(user_words)
+        self._tokenizer = None
+        # 未安装jieba时为False，此时不按词边界过滤
+        self.available = True
+        self._lock = threading.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        """词典是否已加载"""
+        return self._tokenizer is not None
+
+    def warm_up(self) -> None:
+        """加载前缀词典（优先读取缓存文件），可在服务启动时调用"""
+        if self._tokenizer is not None or not self.available:
+            return
+
+        with self._lock:
+            if self._tokenizer is not None or not self.available:
+                return
+
+            # 只有真正需要分词时才导入jieba
+            try:
+                import jieba
+            except ImportError:
+                logger.warning("jieba is not installed, keyword matches will not be filtered by word boundaries")
+                self.available = False
+                return
+
+            tokenizer = jieba.Tokenizer()
+            if self.cache_file:
+                cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+                os.makedirs(cache_dir, exist_ok=True)
+                tokenizer.tmp_dir = cache_dir
+                tokenizer.cache_file = os.path.basename(self.cache_file)
+            tokenizer.initialize()
+
+            # 实体词作为整词加入词典，避免被切开
+            for word in self.user_words:
+                tokenizer.add_word(word)
+
+            self._tokenizer = tokenizer
+            logger.info(f"Segmenter ready with {len(self.user_words)} user words")
+
+    def add_words(self, words: Iterable[str]) -> None:
+        """添加自定义词"""
+        words = list(words)
+        self.user_words.extend(words)
+        if self._tokenizer is not None:
+            for word in words:
+                self._tokenizer.add_word(word)
+
+    def cut(self, text: str) -> List[str]:
+        """分词，未安装jieba时整句作为一个词"""
+        self.warm_up()
+        if self._tokenizer is None:
+            return [text]
+        return self._tokenizer.lcut(text)
+
+    def boundaries(self, text: str) -> Optional[Set[int]]:
+        """返回所有词边界的字符位置，未安装jieba时返回None（不过滤）"""
+        self.warm_up()
+        if self._tokenizer is None:
+            return None
+        positions = {0}
+        offset = 0
+        for word in self.cut(text):
+            offset += len(word)
+            positions.add(offset)
+        return positions
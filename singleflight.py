@@ -0,0 +1,110 @@
+"""
+请求合并模块
+相同键的并发调用只执行一次，结果分发给所有等待者
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """一次进行中的同步调用"""
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Counters:
+    """调用和合并次数统计"""
+
+    def __init__(self):
+        self._counter_lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def _count(self, coalesced: bool) -> None:
+        with self._counter_lock:
+            self.calls += 1
+            if coalesced:
+                self.coalesced += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "coalesce_rate": self.coalesced / self.calls if self.calls else 0.0
+            }
+
+
+class SingleFlight(_Counters):
+    """线程间的请求合并"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """执行 fn，同一键已有进行中的调用时等待其结果，等待超过 timeout 秒时抛出 TimeoutError"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        self._count(not leader)
+
+        if not leader:
+            if not call.event.wait(timeout):
+                raise TimeoutError(f"Coalesced call did not finish within {timeout}s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class AsyncSingleFlight(_Counters):
+    """协程间的请求合并"""
+
+    def __init__(self):
+        super().__init__()
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """执行 fn()，同一键已有进行中的调用时等待其结果，等待超过 timeout 秒时抛出 TimeoutError
+
+        共享调用运行在独立任务中，单个等待者被取消或超时不会影响其他等待者。
+        """
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(key)
+        coalesced = task is not None and not task.done() and task.get_loop() is loop
+        if not coalesced:
+            task = loop.create_task(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        self._count(coalesced)
+        # 发起调用的一方由调用本身的超时约束，只对等待者限时
+        if timeout is None or not coalesced:
+            return await asyncio.shield(task)
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # 所有等待者都已取消时，避免未读取的异常产生告警
+        if not task.cancelled():
+            task.exception()
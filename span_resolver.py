@@ -0,0 +1,51 @@
+"""
+实体重叠消解模块
+按统一策略从候选实体中选出互不重叠的集合，供实体抽取和结果融合共用
+"""
+from bisect import bisect_left
+from typing import Iterable, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# 来源优先级，数值越大越优先
+SOURCE_PRIORITY = {
+    "llm": 3,
+    "regex": 2,
+    "keyword": 1
+}
+
+
+def resolve_overlaps(candidates: Iterable[Tuple[T, str]]) -> List[T]:
+    """消解重叠实体
+
+    candidates 为 (实体, 来源) 序列，实体需要有 start、end、confidence 属性。
+    按置信度、长度、来源优先级依次从高到低排序（再按位置保证结果确定），
+    依次选取与已选实体不重叠的候选，整体复杂度 O(n log n)。
+    返回结果按起始位置排序。
+    """
+    ranked = sorted(
+        candidates,
+        key=lambda item: (
+            -item[0].confidence,
+            item[0].start - item[0].end,
+            -SOURCE_PRIORITY.get(item[1], 0),
+            item[0].start,
+            item[0].end
+        )
+    )
+
+    # 已选实体按 (start, end) 有序存放，互不重叠，因此结束位置同样有序
+    kept_keys: List[Tuple[int, int]] = []
+    kept: List[T] = []
+    for span, _ in ranked:
+        # 起始位置小于当前结束位置的已选实体中，只需检查结束位置最大的那个
+        index = bisect_left(kept_keys, (span.end, -1))
+        if index > 0 and kept_keys[index - 1][1] > span.start:
+            continue
+
+        key = (span.start, span.end)
+        position = bisect_left(kept_keys, key)
+        kept_keys.insert(position, key)
+        kept.insert(position, span)
+
+    return kept
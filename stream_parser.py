@@ -0,0 +1,99 @@
+"""
+流式JSON解析模块
+逐块读取大模型的流式输出，顶层字段的值一旦完整即可取出，无需等待整个JSON结束
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class IncrementalJSONParser:
+    """增量解析JSON对象的顶层字段"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        # 顶层对象内的状态：key 等待字段名，colon 等待冒号，value 读取字段值
+        self._state = "key"
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """追加一段输出，返回本次新解析完成的顶层字段"""
+        self.buffer += chunk
+        completed = []
+        buffer = self.buffer
+
+        for index in range(self._pos, len(buffer)):
+            if self._done:
+                break
+            char = buffer[index]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._state == "key":
+                        self._key = json.loads(buffer[self._string_start:index + 1])
+                        self._state = "colon"
+                continue
+
+            if self._depth == 0:
+                # 忽略对象之前的内容，例如markdown代码块标记
+                if char == "{":
+                    self._depth = 1
+                    self._state = "key"
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+                if self._depth == 1 and self._state == "value" and self._value_start is None:
+                    self._value_start = index
+            elif char in "{[":
+                if self._depth == 1 and self._state == "value" and self._value_start is None:
+                    self._value_start = index
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 1:
+                    self._complete(buffer, index, completed)
+                    self._done = True
+                self._depth -= 1
+            elif self._depth == 1:
+                if char == ":" and self._state == "colon":
+                    self._state = "value"
+                    self._value_start = None
+                elif char == ",":
+                    self._complete(buffer, index, completed)
+                    self._state = "key"
+                elif self._state == "value" and self._value_start is None and not char.isspace():
+                    self._value_start = index
+
+        self._pos = len(buffer)
+        return completed
+
+    def _complete(self, buffer: str, end: int, completed: List[Tuple[str, Any]]) -> None:
+        """字段值读取完毕时解析并记录"""
+        if self._state != "value" or self._key is None or self._value_start is None:
+            return
+        try:
+            value = json.loads(buffer[self._value_start:end].strip())
+        except json.JSONDecodeError:
+            return
+        self.fields[self._key] = value
+        completed.append((self._key, value))
+        self._key = None
+        self._value_start = None
+
+    @property
+    def done(self) -> bool:
+        """顶层对象是否已经结束"""
+        return self._done
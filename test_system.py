@@ -76,6 +76,112 @@ def test_intent_classification():
         print(f"✗ 意图识别测试失败: {e}")
         return False
 
+def test_intent_engine():
+    """测试意图规则引擎与逐条正则匹配结果一致"""
+    print("\n测试意图规则引擎...")
+    try:
+        import re
+        from config import INTENT_RULES
+        from intent_classifier import IntentClassifier
+        
+        classifier = IntentClassifier()
+        test_cases = [
+            "巡检A区2号房主柜温度",
+            "查看温度",
+            "温度查看",
+            "查看\n温度",
+            "前往12号房",
+            "导航到３号房",
+            "设置UPS",
+            "报告副柜状态"
+        ]
+        
+        for text in test_cases:
+            expected = {}
+            for rule in INTENT_RULES:
+                if re.search(rule["pattern"], text):
+                    expected[rule["intent"]] = rule["score"]
+            actual = dict(classifier.classify_intent_rules(text))
+            if actual != expected:
+                print(f"✗ {text!r}: {actual} (期望: {expected})")
+                return False
+        
+        print(f"✓ {len(test_cases)} 条指令规则匹配结果一致")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 意图规则引擎测试失败: {e}")
+        return False
+
+def test_intent_batch():
+    """测试批量意图识别与逐条识别一致"""
+    print("\n测试批量意图识别...")
+    try:
+        from intent_classifier import IntentClassifier
+        
+        classifier = IntentClassifier()
+        texts = ["巡检A区2号房主柜温度", "开启B区空调", "查询UPS1状态", "前往C区3号房",
+                 "确认高温报警", "你好", "检查处理", ""]
+        
+        batch = classifier.classify_intent_batch(texts, chunk_size=3)
+        for text, intent in zip(texts, batch):
+            expected = classifier.classify_intent(text)
+            if (intent.type, intent.confidence) != (expected.type, expected.confidence):
+                print(f"✗ {text}: {intent.type} {intent.confidence} (期望: {expected.type} {expected.confidence})")
+                return False
+        
+        print(f"✓ {len(texts)} 条指令批量识别结果一致")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 批量意图识别测试失败: {e}")
+        return False
+
+def test_ngram_intent_model():
+    """测试字符n-gram意图模型的训练、保存加载和分层识别"""
+    print("\n测试n-gram意图模型...")
+    try:
+        import tempfile
+        from ngram_intent_model import NgramIntentModel
+        from intent_classifier import IntentClassifier
+        
+        samples = [
+            ("巡检A区主柜", "patrol_inspection"), ("去B区巡视一圈", "patrol_inspection"),
+            ("打开空调", "equipment_control"), ("把风机关掉", "equipment_control"),
+            ("前往C区", "navigation"), ("导航到配电室", "navigation")
+        ] * 20
+        texts, labels = zip(*samples)
+        model = NgramIntentModel.train(texts, labels, n_features=2 ** 12, epochs=5)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "model.npz")
+            model.save(path)
+            loaded = NgramIntentModel.load(path)
+        
+        label, confidence = loaded.predict("去B区巡视一圈")
+        if label != "patrol_inspection":
+            print(f"✗ 模型预测错误: {label} ({confidence:.2f})")
+            return False
+        
+        # 规则无法识别时采用模型结果，规则置信度高时保持规则结果
+        classifier = IntentClassifier(ngram_model=loaded)
+        rule_only = IntentClassifier()
+        tiered = classifier.classify_intent("去B区巡视一圈")
+        if tiered.type != "patrol_inspection" or tiered.confidence != confidence:
+            print(f"✗ 分层识别结果错误: {tiered.type} ({tiered.confidence:.2f})")
+            return False
+        text = "巡检A区2号房主柜温度"
+        if classifier.classify_intent(text).type != rule_only.classify_intent(text).type:
+            print("✗ 规则置信度足够时不应被模型覆盖")
+            return False
+        
+        print(f"✓ 模型识别: patrol_inspection ({confidence:.2f})")
+        return True
+        
+    except Exception as e:
+        print(f"✗ n-gram意图模型测试失败: {e}")
+        return False
+
 def test_entity_extraction():
     """测试实体抽取"""
     print("\n测试实体抽取...")
@@ -110,6 +216,1221 @@ def test_entity_extraction():
         print(f"✗ 实体抽取测试失败: {e}")
         return False
 
+def test_keyword_automaton():
+    """测试关键词自动机"""
+    print("\n测试关键词自动机...")
+    try:
+        from keyword_automaton import KeywordAutomaton
+        
+        automaton = KeywordAutomaton()
+        automaton.add("配电室", "location")
+        automaton.add("配电柜", "equipment")
+        automaton.add("电柜", "equipment")
+        automaton.add("ups", "equipment")
+        
+        matches = automaton.find_all("配电室和配电柜，UPS1与配电室")
+        expected = [
+            (0, 3, "location"),
+            (4, 7, "equipment"),
+            (5, 7, "equipment"),
+            (8, 11, "equipment"),
+            (13, 16, "location")
+        ]
+        
+        if matches == expected:
+            print(f"✓ 命中全部 {len(matches)} 处关键词")
+            return True
+        print(f"✗ 匹配结果: {matches} (期望: {expected})")
+        return False
+        
+    except Exception as e:
+        print(f"✗ 关键词自动机测试失败: {e}")
+        return False
+
+def test_fused_scanner():
+    """测试合并正则扫描器与逐个正则扫描结果一致"""
+    print("\n测试合并正则扫描器...")
+    try:
+        from entity_extractor import EntityExtractor
+        
+        legacy = EntityExtractor(scanner_mode="legacy")
+        fused = EntityExtractor(scanner_mode="fused")
+        
+        test_cases = [
+            "巡检A区2号房主柜温度",
+            "设置电压220V频率50Hz电流10A",
+            "14:30巡检3楼变压器1温度",
+            "10分钟后关闭空调2和配电室12的UPS3"
+        ]
+        
+        for text in test_cases:
+            legacy_spans = [(e.type, e.start, e.end) for e in legacy.extract_entities_regex(text)]
+            fused_spans = [(e.type, e.start, e.end) for e in fused.extract_entities_regex(text)]
+            if legacy_spans != fused_spans:
+                print(f"✗ {text}: {fused_spans} (期望: {legacy_spans})")
+                return False
+        
+        print(f"✓ {len(test_cases)} 条指令扫描结果一致")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 合并正则扫描器测试失败: {e}")
+        return False
+
+def test_span_resolver():
+    """测试实体重叠消解"""
+    print("\n测试实体重叠消解...")
+    try:
+        from models import Entity
+        from span_resolver import resolve_overlaps
+        
+        candidates = [
+            (Entity(type="equipment", value="空调", start=2, end=4, confidence=0.8), "keyword"),
+            (Entity(type="equipment", value="空调1", start=2, end=5, confidence=0.8), "keyword"),
+            (Entity(type="location", value="B区", start=0, end=2, confidence=0.9), "regex"),
+            (Entity(type="location", value="B区", start=0, end=2, confidence=0.9), "llm"),
+            (Entity(type="value", value="1", start=4, end=5, confidence=0.9), "regex")
+        ]
+        
+        # 候选顺序不应影响结果
+        forward = resolve_overlaps(candidates)
+        backward = resolve_overlaps(list(reversed(candidates)))
+        
+        expected = [("location", 0, 2), ("equipment", 2, 4), ("value", 4, 5)]
+        forward_spans = [(e.type, e.start, e.end) for e in forward]
+        backward_spans = [(e.type, e.start, e.end) for e in backward]
+        
+        if forward_spans == expected and backward_spans == expected:
+            print(f"✓ 消解结果: {forward_spans}")
+            return True
+        print(f"✗ 消解结果: {forward_spans} / {backward_spans} (期望: {expected})")
+        return False
+        
+    except Exception as e:
+        print(f"✗ 实体重叠消解测试失败: {e}")
+        return False
+
+def test_batch_extraction():
+    """测试批量实体抽取"""
+    print("\n测试批量实体抽取...")
+    try:
+        from entity_extractor import EntityExtractor
+        
+        extractor = EntityExtractor()
+        texts = ["巡检A区2号房主柜温度", "确认高温报警", "", "开启B区空调"]
+        
+        columns = extractor.extract_entities_batch(texts, chunk_size=3)
+        batch_rows = list(zip(columns["text_index"], columns["type"], columns["start"], columns["end"]))
+        
+        expected_rows = []
+        for index, text in enumerate(texts):
+            for entity in extractor.extract_entities(text):
+                expected_rows.append((index, entity.type, entity.start, entity.end))
+        
+        if batch_rows == expected_rows:
+            print(f"✓ 批量抽取 {len(texts)} 条文本，共 {len(batch_rows)} 个实体")
+            return True
+        print(f"✗ 批量结果: {batch_rows} (期望: {expected_rows})")
+        return False
+        
+    except Exception as e:
+        print(f"✗ 批量实体抽取测试失败: {e}")
+        return False
+
+def test_grammar_snapshot():
+    """测试语法快照的生成和加载"""
+    print("\n测试语法快照...")
+    try:
+        import tempfile
+        from entity_extractor import EntityExtractor
+        from grammar_snapshot import build_snapshot, load_snapshot
+        
+        extractor = EntityExtractor()
+        extractor.add_keywords("equipment", ["冷水机组"])
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = build_snapshot(os.path.join(directory, "grammar.pkl"), extractor)
+            snapshot = load_snapshot(path)
+        
+        if snapshot is None:
+            print("✗ 快照加载失败")
+            return False
+        
+        restored = EntityExtractor(snapshot=snapshot["entity_extractor"])
+        text = "巡检A区2号房冷水机组温度"
+        expected = [(e.type, e.value, e.start, e.end) for e in extractor.extract_entities(text)]
+        actual = [(e.type, e.value, e.start, e.end) for e in restored.extract_entities(text)]
+        
+        if actual == expected:
+            print(f"✓ 快照恢复后抽取结果一致: {actual}")
+            return True
+        print(f"✗ 快照恢复结果: {actual} (期望: {expected})")
+        return False
+        
+    except Exception as e:
+        print(f"✗ 语法快照测试失败: {e}")
+        return False
+
+def test_cascade_policy():
+    """测试级联策略在规则结果明确时跳过大模型"""
+    print("\n测试级联策略...")
+    try:
+        from nlp_processor import NLPProcessor
+        from cascade import CascadePolicy
+        
+        processor = NLPProcessor()
+        processor.cascade = CascadePolicy(mode="confidence", min_intent_confidence=0.6)
+        
+        calls = []
+        analyze_command = processor.llm_client.analyze_command
+        processor.llm_client.analyze_command = lambda text, **kwargs: calls.append(text) or analyze_command(text)
+        
+        decisive = processor.process_command("开启B区空调")
+        processor.process_command("你好")
+        
+        if calls != ["你好"]:
+            print(f"✗ 大模型调用不符合预期: {calls}")
+            return False
+        if not decisive.structured_command or decisive.structured_command.get("command_type") != "control":
+            print(f"✗ 跳过大模型时缺少结构化指令: {decisive.structured_command}")
+            return False
+        
+        stats = processor.get_cascade_stats()
+        if stats["total"] != 2 or stats["llm_skipped"] != 1:
+            print(f"✗ 级联统计错误: {stats}")
+            return False
+        
+        print(f"✓ 跳过率: {stats['skip_rate']:.0%}")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 级联策略测试失败: {e}")
+        return False
+
+def test_async_llm_client():
+    """测试异步大模型调用的并发上限和异步处理接口"""
+    print("\n测试异步大模型调用...")
+    try:
+        import json
+        import asyncio
+        from types import SimpleNamespace
+        from nlp_processor import NLPProcessor
+        from cascade import CascadePolicy
+        
+        state = {"active": 0, "peak": 0}
+        content = json.dumps({
+            "intent_type": "status_query", "intent_confidence": 0.95,
+            "entities": [{"type": "equipment", "value": "UPS1", "start": 2, "end": 6}],
+            "reasoning": "", "structured_command": {"action": "status_query"}
+        })
+        
+        async def create(**kwargs):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.01)
+            state["active"] -= 1
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+        
+        processor = NLPProcessor()
+        processor.cascade = CascadePolicy(mode="always")
+        processor.llm_client.max_concurrency = 2
+        processor.llm_client.async_client = SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+        )
+        
+        async def run():
+            return await asyncio.gather(*(processor.aprocess_command(f"查询UPS{i}状态") for i in range(6)))
+        
+        results = asyncio.run(run())
+        if state["peak"] != 2:
+            print(f"✗ 并发上限错误: {state['peak']}")
+            return False
+        if any(result.intent.confidence != 0.95 for result in results):
+            print("✗ 异步结果未采用大模型意图")
+            return False
+        
+        print(f"✓ 6 个请求的最大并发: {state['peak']}")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 异步大模型调用测试失败: {e}")
+        return False
+
+def test_llm_cache():
+    """测试大模型响应缓存的持久化、过期和日志预热"""
+    print("\n测试大模型响应缓存...")
+    try:
+        import time
+        import tempfile
+        from llm_cache import LLMResponseCache, warm_from_logs
+        
+        data = {"intent_type": "status_query", "intent_confidence": 0.9, "entities": [],
+                "reasoning": "", "structured_command": {}}
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "llm_cache.sqlite")
+            cache = LLMResponseCache(path=path, ttl=0, memory_size=10, max_entries=100)
+            cache.set("查询UPS1状态", "model", "v1", data)
+            
+            # 全角字符和首尾空白标准化后命中同一条缓存
+            if cache.get(" 查询ＵＰＳ1状态", "model", "v1") != data:
+                print("✗ 内存缓存未命中")
+                return False
+            if cache.get("查询UPS1状态", "model", "v2") is not None:
+                print("✗ 提示词版本变化后不应命中")
+                return False
+            cache.close()
+            
+            reopened = LLMResponseCache(path=path, ttl=0, memory_size=10, max_entries=100)
+            # 只查询内存时不读取数据库，也不计入未命中
+            if reopened.get("查询UPS1状态", "model", "v1", disk=False) is not None or reopened.stats()["misses"]:
+                print("✗ 只查询内存时不应读取数据库")
+                return False
+            if reopened.get("查询UPS1状态", "model", "v1") != data or reopened.stats()["disk_hits"] != 1:
+                print("✗ 持久化缓存未命中")
+                return False
+            reopened.close()
+            
+            expiring = LLMResponseCache(path="", ttl=0.01, memory_size=10, max_entries=100)
+            expiring.set("开启B区空调", "model", "v1", data)
+            time.sleep(0.02)
+            if expiring.get("开启B区空调", "model", "v1") is not None:
+                print("✗ 过期缓存不应命中")
+                return False
+            
+            log_path = os.path.join(directory, "nlp_processor.log")
+            with open(log_path, "w", encoding="utf-8") as f:
+                f.write("2024-01-01 | INFO | nlp_processor:_analyze_rules:45 - Processing command: 开启B区空调\n")
+                f.write("2024-01-01 | INFO | nlp_processor:_analyze_rules:45 - Processing command: 开启B区空调\n")
+                f.write("2024-01-01 | INFO | nlp_processor:_analyze_rules:45 - Processing command: 前往C区\n")
+            warmed = []
+            if warm_from_logs([log_path], warmed.append) != 2 or warmed != ["开启B区空调", "前往C区"]:
+                print(f"✗ 日志预热结果错误: {warmed}")
+                return False
+            
+            # 首尾空白不同的文本命中同一条缓存时，实体位置按当前文本重新计算
+            from llm_client import LLMClient
+            from models import LLMResponse
+            client = LLMClient()
+            client.cache = LLMResponseCache(path="", ttl=0, memory_size=10, max_entries=100)
+            client._cache_set("开启B区空调", LLMResponse(
+                intent_type="equipment_control", intent_confidence=0.9, reasoning="", structured_command={},
+                entities=[{"type": "location", "value": "B区", "start": 2, "end": 4}]
+            ))
+            hit = client._cache_get("  开启B区空调")
+            if hit is None or [(e["start"], e["end"]) for e in hit.entities] != [(4, 6)]:
+                print(f"✗ 缓存命中的实体位置未按当前文本计算: {hit}")
+                return False
+            
+            # 异步调用方的数据库读写在线程中执行
+            import asyncio
+            client.cache = LLMResponseCache(path=os.path.join(directory, "async.sqlite"), ttl=0,
+                                            memory_size=10, max_entries=100)
+            asyncio.run(client._acache_set("开启B区空调", hit))
+            client.cache.close()
+            client.cache = LLMResponseCache(path=os.path.join(directory, "async.sqlite"), ttl=0,
+                                            memory_size=10, max_entries=100)
+            if asyncio.run(client._acache_get("开启B区空调")) is None or client.cache.stats()["disk_hits"] != 1:
+                print("✗ 异步缓存读写失败")
+                return False
+        
+        print("✓ 缓存命中、持久化、过期和预热正常")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 大模型响应缓存测试失败: {e}")
+        return False
+
+def test_singleflight():
+    """测试相同请求的合并"""
+    print("\n测试请求合并...")
+    try:
+        import time
+        import asyncio
+        import threading
+        from singleflight import SingleFlight, AsyncSingleFlight
+        
+        calls = []
+        
+        def slow_call():
+            calls.append(1)
+            time.sleep(0.05)
+            return "结果"
+        
+        flight = SingleFlight()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("确认高温报警", slow_call)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(calls) != 1 or results != ["结果"] * 5 or flight.stats()["coalesced"] != 4:
+            print(f"✗ 同步合并错误: 调用{len(calls)}次, {flight.stats()}")
+            return False
+        
+        async_flight = AsyncSingleFlight()
+        
+        async def slow_async_call():
+            calls.append(2)
+            await asyncio.sleep(0.01)
+            return "结果"
+        
+        async def run():
+            return await asyncio.gather(*(async_flight.do("确认高温报警", slow_async_call) for _ in range(5)))
+        
+        if asyncio.run(run()) != ["结果"] * 5 or calls.count(2) != 1:
+            print(f"✗ 异步合并错误: {async_flight.stats()}")
+            return False
+        
+        # 等待者按自己的超时放弃等待，发起调用的一方仍拿到结果
+        def slower_call():
+            time.sleep(0.3)
+            return "结果"
+        
+        outcomes = []
+        
+        def follow():
+            try:
+                outcomes.append(flight.do("巡检A区", slower_call, timeout=0.05))
+            except TimeoutError:
+                outcomes.append("超时")
+        
+        leader = threading.Thread(target=lambda: outcomes.append(flight.do("巡检A区", slower_call)))
+        leader.start()
+        time.sleep(0.02)
+        started = time.perf_counter()
+        follow()
+        waited = time.perf_counter() - started
+        leader.join()
+        if outcomes != ["超时", "结果"] or waited > 0.2:
+            print(f"✗ 等待者未按超时返回: {outcomes}, {waited:.2f}s")
+            return False
+        
+        print("✓ 5 个并发请求合并为 1 次调用，等待者按超时返回")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 请求合并测试失败: {e}")
+        return False
+
+def test_llm_batcher():
+    """测试大模型微批处理的结果拆分和逐条重试"""
+    print("\n测试大模型微批处理...")
+    try:
+        import json
+        import asyncio
+        from types import SimpleNamespace
+        from llm_client import LLMClient
+        from llm_batcher import LLMBatcher
+        
+        requests = []
+        
+        def item(text):
+            return {"intent_type": "status_query", "intent_confidence": 0.9, "entities": [],
+                    "reasoning": text, "structured_command": {}}
+        
+        async def create(**kwargs):
+            lines = kwargs["messages"][-1]["content"].split("\n")
+            requests.append(len(lines))
+            if kwargs["messages"][-1]["content"].startswith("1. "):
+                # 批量响应顺序打乱，并缺少无法识别的一条
+                texts = [json.loads(line.split(". ", 1)[1]) for line in lines]
+                content = [dict(item(text), index=index) for index, text in enumerate(texts, 1) if text != "你好"]
+                content.reverse()
+            else:
+                content = item(lines[0])
+            message = SimpleNamespace(content=json.dumps(content, ensure_ascii=False))
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        
+        client = LLMClient()
+        client.async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        client.batcher = LLMBatcher(client, window_ms=20, max_size=8)
+        
+        texts = ["查询UPS1状态", "开启B区空调", "你好", "前往C区"]
+        
+        async def run():
+            return await asyncio.gather(*(client.aanalyze_command(text) for text in texts))
+        
+        results = asyncio.run(run())
+        if [result.reasoning for result in results] != texts:
+            print(f"✗ 批量结果拆分错误: {[result.reasoning for result in results]}")
+            return False
+        if requests != [4, 1]:
+            print(f"✗ 请求次数错误: {requests}")
+            return False
+        if client.router.stats()["models"][client.router.large_model]["batch_requests"] != 1:
+            print(f"✗ 批量请求未计入路由统计: {client.router.stats()}")
+            return False
+        
+        # 批量请求本身失败时整批返回None，不逐条重试
+        async def failing(**kwargs):
+            requests.append(len(kwargs["messages"][-1]["content"].split("\n")))
+            raise RuntimeError("connection reset")
+        
+        requests.clear()
+        client.async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=failing)))
+        failed = asyncio.run(client.aanalyze_commands_batch(["查询UPS2状态", "开启A区空调"]))
+        if failed != [None, None] or requests != [2]:
+            print(f"✗ 批量请求失败时不应逐条重试: {requests}")
+            return False
+        
+        # 返回条数不足或批次被取消时，等待中的调用方都会结束
+        async def short_batch(texts, timeout=None):
+            return [None] * (len(texts) - 1)
+        
+        async def hanging_batch(texts, timeout=None):
+            await asyncio.sleep(10)
+        
+        async def run_batcher(batch):
+            batcher = LLMBatcher(SimpleNamespace(aanalyze_commands_batch=batch), window_ms=1, max_size=8)
+            waiters = [asyncio.ensure_future(batcher.submit(text)) for text in texts]
+            await asyncio.sleep(0.05)
+            for task in list(batcher._tasks):
+                task.cancel()
+            return await asyncio.wait_for(asyncio.gather(*waiters, return_exceptions=True), 1)
+        
+        if asyncio.run(run_batcher(short_batch)) != [None] * len(texts):
+            print("✗ 返回条数不足时调用方未结束等待")
+            return False
+        cancelled = asyncio.run(run_batcher(hanging_batch))
+        if not all(isinstance(result, asyncio.CancelledError) for result in cancelled):
+            print(f"✗ 批次取消时调用方未结束等待: {cancelled}")
+            return False
+        
+        # 等待批量结果的时间不超过截止时间
+        import time
+        from deadline import Deadline
+        
+        async def slow_batch(texts, timeout=None):
+            await asyncio.sleep(0.5)
+            return [None] * len(texts)
+        
+        client.cache = None
+        client.aanalyze_commands_batch = slow_batch
+        started = time.perf_counter()
+        result = asyncio.run(client.aanalyze_command("巡检B区", deadline=Deadline(100, margin_ms=0)))
+        if result is not None or time.perf_counter() - started > 0.3:
+            print("✗ 批量模式未遵守截止时间")
+            return False
+        
+        print("✓ 4 条指令合并为 1 次批量请求，缺失条目逐条重试，请求失败或取消时不会挂起，等待时间受截止时间限制")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 大模型微批处理测试失败: {e}")
+        return False
+
+def test_streaming_intent():
+    """测试流式解析在大模型输出完成前回调意图"""
+    print("\n测试流式意图回调...")
+    try:
+        import json
+        import asyncio
+        from types import SimpleNamespace
+        from nlp_processor import NLPProcessor
+        from cascade import CascadePolicy
+        from stream_parser import IncrementalJSONParser
+        
+        content = json.dumps({
+            "intent_type": "status_query", "intent_confidence": 0.95,
+            "entities": [{"type": "equipment", "value": "UPS1", "start": 2, "end": 6}],
+            "reasoning": "查询UPS1的状态", "structured_command": {"action": "status_query"}
+        }, ensure_ascii=False)
+        
+        parser = IncrementalJSONParser()
+        fields = [key for index in range(0, len(content), 5) for key, _ in parser.feed(content[index:index + 5])]
+        if fields != ["intent_type", "intent_confidence", "entities", "reasoning", "structured_command"]:
+            print(f"✗ 增量解析字段错误: {fields}")
+            return False
+        
+        received = []
+        
+        async def stream():
+            for index in range(0, len(content), 8):
+                received.append(index)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[index:index + 8]))])
+        
+        async def create(**kwargs):
+            return stream()
+        
+        processor = NLPProcessor()
+        processor.cascade = CascadePolicy(mode="always")
+        processor.streaming = True
+        processor.llm_client.async_client = SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+        )
+        
+        early = []
+        result = asyncio.run(processor.aprocess_command(
+            "查询UPS1状态", on_intent=lambda intent: early.append((intent.type, len(received)))
+        ))
+        
+        total_chunks = len(received)
+        if not early or early[0][0] != "status_query" or early[0][1] >= total_chunks:
+            print(f"✗ 意图未提前回调: {early}, 共 {total_chunks} 块")
+            return False
+        if result.intent.type != "status_query" or len(early) != 1:
+            print("✗ 最终结果或回调次数错误")
+            return False
+        latency = processor.llm_client.latency.summary()
+        if "llm_first_intent" not in latency or "llm_total" not in latency:
+            print(f"✗ 缺少耗时统计: {latency}")
+            return False
+        
+        print(f"✓ 第 {early[0][1]}/{total_chunks} 块即得到意图")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 流式意图回调测试失败: {e}")
+        return False
+
+def test_compact_response():
+    """测试紧凑输出格式的解析和本地位置计算"""
+    print("\n测试紧凑输出格式...")
+    try:
+        from types import SimpleNamespace
+        from nlp_processor import NLPProcessor
+        from cascade import CascadePolicy
+        
+        processor = NLPProcessor()
+        processor.cascade = CascadePolicy(mode="always")
+        client = processor.llm_client
+        client.response_mode = "compact"
+        
+        content = '{"i":"patrol_inspection","c":0.97,"e":[["location","A区"],["equipment","主柜"],["parameter","湿度"]]}'
+        client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+            create=lambda **kwargs: SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+        )))
+        
+        result = processor.process_command("巡检A区主柜温度")
+        spans = [(entity.type, entity.value, entity.start, entity.end) for entity in result.entities]
+        # 原文中不存在的“湿度”被丢弃，位置按原文重新计算
+        expected = [("location", "A区", 2, 4), ("equipment", "主柜", 4, 6), ("parameter", "温度", 6, 8)]
+        if result.intent.confidence != 0.97 or spans != expected:
+            print(f"✗ 解析结果错误: {result.intent.confidence} {spans}")
+            return False
+        if not result.structured_command or result.structured_command.get("command_type") != "patrol":
+            print(f"✗ 未在本地生成结构化指令: {result.structured_command}")
+            return False
+        if "reasoning" in client._build_system_prompt():
+            print("✗ 紧凑提示词不应要求推理过程")
+            return False
+        
+        print(f"✓ 紧凑格式解析出 {len(spans)} 个实体")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 紧凑输出格式测试失败: {e}")
+        return False
+
+def test_prompt_builder():
+    """测试按候选意图精简提示词"""
+    print("\n测试提示词精简...")
+    try:
+        from prompt_builder import PromptBuilder
+        from intent_classifier import IntentClassifier
+        from llm_client import LLMClient
+        
+        builder = PromptBuilder()
+        full_prompt, full_tokens = builder.build_with_tokens(None)
+        if full_prompt != LLMClient()._build_system_prompt():
+            print("✗ 无候选意图时应使用完整提示词")
+            return False
+        
+        candidates = IntentClassifier().candidate_intents("前往C区3号房", 2)
+        pruned_prompt, pruned_tokens = builder.build_with_tokens(candidates)
+        if candidates[0] != "navigation" or "- navigation:" not in pruned_prompt:
+            print(f"✗ 候选意图错误: {candidates}")
+            return False
+        if "- alarm_type:" in pruned_prompt or pruned_tokens >= full_tokens:
+            print("✗ 提示词未按候选意图精简")
+            return False
+        if builder.build(["unknown"]) != full_prompt:
+            print("✗ 没有可用候选时应使用完整提示词")
+            return False
+        
+        print(f"✓ 提示词估算token数: {full_tokens} -> {pruned_tokens}")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 提示词精简测试失败: {e}")
+        return False
+
+def test_model_router():
+    """测试小模型和大模型之间的路由与升级"""
+    print("\n测试模型路由...")
+    try:
+        import json
+        from types import SimpleNamespace
+        from llm_client import LLMClient
+        from model_router import ModelRouter
+        
+        client = LLMClient()
+        client.cache = None
+        client.router = ModelRouter(large_model="large", small_model="small", max_small_length=8)
+        calls = []
+        
+        def create(**kwargs):
+            calls.append(kwargs["model"])
+            confidence = 0.5 if kwargs["model"] == "small" else 0.95
+            content = json.dumps({"intent_type": "status_query", "intent_confidence": confidence, "entities": [],
+                                  "reasoning": "", "structured_command": {}})
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+        
+        client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        
+        if client.router.choose("前往C区3号房前面的充电桩", ["navigation", "status_query"]) != "large":
+            print("✗ 较长且有歧义的指令应使用大模型")
+            return False
+        if client.router.choose("打开空调", ["equipment_control"]) != "large":
+            print("✗ 设备控制指令应使用大模型")
+            return False
+        
+        result = client.analyze_command("查询UPS状态", ["status_query"])
+        if calls != ["small", "large"] or result.intent_confidence != 0.95:
+            print(f"✗ 小模型置信度不足时应升级到大模型: {calls}")
+            return False
+        
+        stats = client.router.stats()["models"]
+        if stats["small"]["escalation_rate"] != 1.0 or stats["large"]["requests"] != 1:
+            print(f"✗ 路由统计错误: {stats}")
+            return False
+        order = " -> ".join(calls)
+        
+        # 缓存按给出结果的模型存放：小模型的结果不作为大模型的结果使用，大模型的结果可供选择小模型的请求使用
+        from llm_cache import LLMResponseCache
+        client.cache = LLMResponseCache(path="", ttl=0, memory_size=10, max_entries=100)
+        client.router = ModelRouter(large_model="large", small_model="small", max_small_length=8,
+                                    min_small_confidence=0.4)
+        calls.clear()
+        client.analyze_command("查询UPS状态", ["status_query"])
+        client.analyze_command("查询UPS状态", ["status_query"])
+        large_result = client.analyze_command("查询UPS状态", ["equipment_control"])
+        small_result = client.analyze_command("查询UPS状态", ["status_query"])
+        if calls != ["small", "large"] or (large_result.intent_confidence, small_result.intent_confidence) != (0.95, 0.95):
+            print(f"✗ 缓存未按模型区分: {calls}")
+            return False
+        
+        # 升级失败时返回小模型的结果但不缓存，下次相同指令仍会尝试升级
+        large_down = [True]
+        
+        def flaky_create(**kwargs):
+            if kwargs["model"] == "large" and large_down[0]:
+                calls.append("large")
+                raise RuntimeError("large model unavailable")
+            return create(**kwargs)
+        
+        client.cache = LLMResponseCache(path="", ttl=0, memory_size=10, max_entries=100)
+        client.router = ModelRouter(large_model="large", small_model="small", max_small_length=8)
+        client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=flaky_create)))
+        calls.clear()
+        fallback = client.analyze_command("查询UPS状态", ["status_query"])
+        large_down[0] = False
+        recovered = client.analyze_command("查询UPS状态", ["status_query"])
+        if calls != ["small", "large", "small", "large"] or (fallback.intent_confidence, recovered.intent_confidence) != (0.5, 0.95):
+            print(f"✗ 升级失败时不应缓存小模型的结果: {calls}")
+            return False
+        
+        print(f"✓ 模型调用顺序: {order}，缓存按模型区分，升级失败的结果不缓存")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 模型路由测试失败: {e}")
+        return False
+
+def test_deadline_and_hedging():
+    """测试截止时间降级和对冲请求"""
+    print("\n测试截止时间和对冲请求...")
+    try:
+        import json
+        import time
+        import asyncio
+        from types import SimpleNamespace
+        from nlp_processor import NLPProcessor
+        from cascade import CascadePolicy
+        
+        processor = NLPProcessor()
+        processor.cascade = CascadePolicy(mode="always")
+        client = processor.llm_client
+        client.cache = None
+        calls = []
+        
+        async def create(**kwargs):
+            # 第一次调用很慢，之后的调用立即返回
+            calls.append(kwargs["timeout"])
+            if len(calls) == 1:
+                await asyncio.sleep(1.0)
+            content = json.dumps({"intent_type": "status_query", "intent_confidence": 0.95, "entities": [],
+                                  "reasoning": "", "structured_command": {}})
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+        
+        client.async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        
+        started = time.perf_counter()
+        result = asyncio.run(processor.aprocess_command("查询UPS状态", deadline_ms=200))
+        elapsed = time.perf_counter() - started
+        if not result.degraded or elapsed > 0.5 or calls[0] > 0.2:
+            print(f"✗ 超过截止时间应返回降级的规则结果: degraded={result.degraded}, {elapsed:.2f}s")
+            return False
+        if result.intent.type != "status_query" or not result.structured_command:
+            print(f"✗ 降级结果应使用规则识别: {result.intent.type}")
+            return False
+        
+        # 该模型已有稳定的耗时样本，首个请求超过p95仍未返回时发出对冲请求
+        calls.clear()
+        client.hedge_enabled = True
+        for _ in range(20):
+            client.router.record(client.model_name, 50)
+        result = asyncio.run(processor.aprocess_command("查询配电柜状态", deadline_ms=500))
+        if result.degraded or len(calls) != 2 or client.hedging_stats()["won"] != 1:
+            print(f"✗ 对冲请求未生效: {client.hedging_stats()}")
+            return False
+        
+        # 未配置大模型时规则结果即为正常结果，不计为降级
+        plain = NLPProcessor()
+        plain.cascade = CascadePolicy(mode="always")
+        plain.llm_client.client = plain.llm_client.async_client = None
+        if plain.process_command("查询UPS状态").degraded or plain.degraded_results:
+            print("✗ 未配置大模型时不应标记降级")
+            return False
+        
+        print(f"✓ 截止时间内返回降级结果 ({elapsed * 1000:.0f}ms)，对冲请求先返回")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 截止时间和对冲请求测试失败: {e}")
+        return False
+
+def test_circuit_breaker():
+    """测试重试和熔断"""
+    print("\n测试重试和熔断...")
+    try:
+        import time
+        import openai
+        from types import SimpleNamespace
+        from llm_client import LLMClient
+        from circuit_breaker import CircuitBreaker
+        from http_transport import httpx
+        
+        client = LLMClient()
+        client.cache = None
+        client.max_retries = 1
+        client.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+        calls = []
+        healthy = []
+        
+        def create(**kwargs):
+            calls.append(kwargs["model"])
+            if not healthy:
+                raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.siliconflow.cn"))
+            content = '{"intent_type":"status_query","intent_confidence":0.9,"entities":[],"reasoning":"","structured_command":{}}'
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+        
+        client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        
+        for text in ("查询UPS状态", "查询空调状态"):
+            client.analyze_command(text)
+        if len(calls) != 4 or client.breaker.state != "open":
+            print(f"✗ 连续失败后应熔断: {len(calls)}次调用, {client.breaker.state}")
+            return False
+        
+        if client.analyze_command("查询配电柜状态") is not None or len(calls) != 4:
+            print("✗ 熔断期间不应调用大模型")
+            return False
+        
+        healthy.append(True)
+        time.sleep(0.15)
+        if client.analyze_command("查询配电柜状态") is None or client.breaker.state != "closed":
+            print(f"✗ 冷却后试探调用成功应恢复: {client.breaker.state}")
+            return False
+        stats = client.breaker.stats()
+        
+        # 只有占用试探名额的调用结束时才释放名额
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        earlier = breaker.allow()
+        breaker.record_failure()
+        time.sleep(0.08)
+        probe = breaker.allow()
+        breaker.release(earlier)
+        if probe is None or breaker.allow() is not None:
+            print("✗ 非试探调用不应释放试探名额")
+            return False
+        breaker.release(probe)
+        if breaker.allow() is None:
+            print("✗ 试探调用结束后应允许下一次试探")
+            return False
+        
+        # 流式读取中途连接中断时计为熔断器失败
+        def broken_stream(**kwargs):
+            def chunks():
+                delta = SimpleNamespace(content='{"intent_type": "status_query", ')
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+                raise httpx.ReadError("connection reset")
+            return chunks()
+        
+        client.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+        client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=broken_stream)))
+        if client.analyze_command_stream("查询UPS状态") is not None or client.breaker.stats()["consecutive_failures"] != 1:
+            print(f"✗ 流式读取失败未计入熔断: {client.breaker.stats()}")
+            return False
+        
+        print(f"✓ 熔断统计: {stats}，试探名额按调用释放，流式读取失败计入熔断")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 重试和熔断测试失败: {e}")
+        return False
+
+def test_concurrent_processing():
+    """测试规则分析和大模型分析并发执行"""
+    print("\n测试并发处理...")
+    try:
+        import json
+        import time
+        from types import SimpleNamespace
+        from nlp_processor import NLPProcessor
+        from cascade import CascadePolicy
+        
+        processor = NLPProcessor()
+        processor.cascade = CascadePolicy(mode="always")
+        processor.concurrent = True
+        client = processor.llm_client
+        client.cache = None
+        
+        calls = []
+        
+        def create(**kwargs):
+            calls.append(1)
+            time.sleep(0.3)
+            if "additional_entities" in kwargs["messages"][0]["content"]:
+                data = {"additional_entities": [{"type": "location", "value": "东区", "start": 2, "end": 4}]}
+            else:
+                data = {"intent_type": "patrol_inspection", "intent_confidence": 0.95, "entities": [],
+                        "reasoning": "", "structured_command": {}}
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(data)))])
+        
+        client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        
+        # 模拟耗时的实体抽取
+        analyze_rules = processor._analyze_rules_with_intent
+        processor._analyze_rules_with_intent = lambda text, intent: (time.sleep(0.3), analyze_rules(text, intent))[1]
+        
+        started = time.perf_counter()
+        result = processor.process_command("巡检东区主柜温度")
+        elapsed = time.perf_counter() - started
+        
+        # 规则分析、大模型分析和补充实体依次执行需要约0.9秒
+        if elapsed > 0.75:
+            print(f"✗ 各阶段未并发执行: {elapsed:.2f}s")
+            return False
+        locations = [entity.value for entity in result.entities if entity.type == "location"]
+        if locations != ["东区"] or not result.is_valid:
+            print(f"✗ 未合并补充的实体: {result.validation_errors}")
+            return False
+        
+        
+        # 规则结果足够确定的指令不发出大模型调用
+        processor.cascade = CascadePolicy(mode="confidence")
+        calls.clear()
+        result = processor.process_command("巡检A区2号房主柜温度")
+        if calls or result.degraded:
+            print(f"✗ 规则结果足够确定时不应调用大模型: {len(calls)} 次")
+            return False
+        
+        print(f"✓ 并发处理耗时 {elapsed * 1000:.0f}ms，补充实体: {locations}")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 并发处理测试失败: {e}")
+        return False
+
+def test_fake_llm_server():
+    """测试离线大模型替身服务"""
+    print("\n测试离线大模型替身服务...")
+    try:
+        from openai import OpenAI
+        from llm_client import LLMClient
+        from fake_llm_server import FakeLLMBackend, start_in_thread
+        
+        backend = FakeLLMBackend(latency_dist="fixed", latency_ms=0)
+        server, base_url = start_in_thread(backend)
+        try:
+            client = LLMClient()
+            client.cache = None
+            client.max_retries = 0
+            client.client = OpenAI(api_key="fake-key", base_url=base_url, max_retries=0)
+            
+            result = client.analyze_command("巡检A区2号房主柜温度")
+            if result is None or result.intent_type != "patrol_inspection" or len(result.entities) != 4:
+                print(f"✗ 替身服务回复错误: {result}")
+                return False
+            
+            intents = []
+            streamed = client.analyze_command_stream("前往C区3号房", on_intent=lambda *intent: intents.append(intent))
+            if streamed is None or intents != [("navigation", streamed.intent_confidence)]:
+                print(f"✗ 流式回复错误: {intents}")
+                return False
+            
+            backend.malformed_rate = 1.0
+            if client.analyze_command("查询UPS状态") is not None:
+                print("✗ 格式错误的JSON应解析失败")
+                return False
+            
+            backend.malformed_rate = 0.0
+            backend.error_rate = 1.0
+            if client.analyze_command("查询空调状态") is not None or client.breaker.stats()["consecutive_failures"] != 1:
+                print("✗ 注入的错误应计入熔断器")
+                return False
+        finally:
+            server.should_exit = True
+        
+        print(f"✓ 替身服务统计: {backend.stats()}")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 替身服务测试失败: {e}")
+        return False
+
+def test_process_batch():
+    """测试批量处理：去重、保持顺序和单条失败"""
+    print("\n测试批量处理...")
+    try:
+        import asyncio
+        from models import CommandResult, LLMResponse
+        from nlp_processor import NLPProcessor
+        from cascade import CascadePolicy
+        
+        processor = NLPProcessor()
+        processor.cascade = CascadePolicy(mode="always")
+        client = processor.llm_client
+        batches = []
+        
+        def respond(texts):
+            batches.append(list(texts))
+            return [LLMResponse(intent_type="patrol_inspection", intent_confidence=0.95, entities=[],
+                                reasoning="", structured_command={}) for _ in texts]
+        
+        async def arespond(texts, timeout=None):
+            return respond(texts)
+        
+        client.analyze_commands_batch = respond
+        client.aanalyze_commands_batch = arespond
+        
+        # 模拟单条指令的实体抽取失败
+        extract_spans = processor.entity_extractor.extract_spans
+        def failing_extract(text):
+            if text == "坏指令":
+                raise ValueError("实体抽取失败")
+            return extract_spans(text)
+        processor.entity_extractor.extract_spans = failing_extract
+        
+        texts = ["巡检A区2号房主柜温度", "开启B区空调", "坏指令", "巡检A区2号房主柜温度", "查询UPS1状态"]
+        for name, run in [("同步", lambda: processor.process_batch(texts)),
+                          ("异步", lambda: asyncio.run(processor.aprocess_batch(texts)))]:
+            batches.clear()
+            results = run()
+            if len(results) != len(texts) or not isinstance(results[2], ValueError):
+                print(f"✗ {name}批量结果数量或单条错误不正确: {results}")
+                return False
+            if [result.original_text for i, result in enumerate(results) if i != 2] != texts[:2] + texts[3:]:
+                print(f"✗ {name}批量结果顺序不正确")
+                return False
+            # 重复文本只处理一次，需要大模型的指令合并为一次批量请求
+            if batches != [["巡检A区2号房主柜温度", "开启B区空调", "查询UPS1状态"]] or results[0] is not results[3]:
+                print(f"✗ {name}批量请求未去重: {batches}")
+                return False
+            if not all(isinstance(result, CommandResult) and not result.degraded
+                       for i, result in enumerate(results) if i != 2):
+                print(f"✗ {name}批量结果未使用大模型结果")
+                return False
+        
+        print(f"✓ 批量处理 {len(texts)} 条指令，大模型请求 {len(batches)} 次，单条错误: {results[2]}")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 批量处理测试失败: {e}")
+        return False
+
+def test_segmenter():
+    """测试jieba分词边界，以及未安装jieba时的退化行为"""
+    print("\n测试分词边界...")
+    try:
+        import sys
+        import tempfile
+        from segmenter import Segmenter
+        from entity_extractor import EntityExtractor
+        
+        text = "巡检A区主柜温度"
+        baseline = [(span.type, span.value) for span in EntityExtractor(segmenter="none").extract_spans(text)]
+        
+        try:
+            import jieba  # noqa: F401
+            has_jieba = True
+        except ImportError:
+            has_jieba = False
+        
+        if has_jieba:
+            with tempfile.TemporaryDirectory() as directory:
+                segmenter = Segmenter(cache_file=os.path.join(directory, "jieba.cache"), user_words=["主柜"])
+                boundaries = segmenter.boundaries(text)
+                # 自定义词作为整词保留，词内位置不是边界
+                if not {0, 4, 6, len(text)} <= boundaries or 5 in boundaries:
+                    print(f"✗ 分词边界错误: {sorted(boundaries)}")
+                    return False
+        
+        # 模拟未安装jieba：不过滤关键词命中，抽取结果与免分词模式一致
+        saved = sys.modules.get("jieba")
+        sys.modules["jieba"] = None
+        try:
+            segmenter = Segmenter(cache_file=None)
+            if segmenter.boundaries(text) is not None or segmenter.cut(text) != [text]:
+                print("✗ 未安装jieba时不应返回词边界")
+                return False
+            extractor = EntityExtractor(segmenter="jieba")
+            spans = [(span.type, span.value) for span in extractor.extract_spans(text)]
+        finally:
+            if saved is None:
+                del sys.modules["jieba"]
+            else:
+                sys.modules["jieba"] = saved
+        if spans != baseline:
+            print(f"✗ 未安装jieba时抽取结果变化: {spans}")
+            return False
+        
+        print(f"✓ 分词边界正常（jieba{'已' if has_jieba else '未'}安装），未安装时不过滤")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 分词边界测试失败: {e}")
+        return False
+
+def _baseline_normalize(entity_type, value):
+    """预生成查找表之前的实体标准化实现，作为等价性对照"""
+    import re
+    from config import LOCATION_MAPPING, EQUIPMENT_MAPPING, PARAMETER_UNIT_MAPPING
+    if entity_type == "location":
+        if value in LOCATION_MAPPING:
+            return LOCATION_MAPPING[value]
+        zone_match = re.search(r'([A-Z])区', value)
+        room_match = re.search(r'(\d+)号房', value)
+        result = {}
+        if zone_match:
+            result["zone"] = zone_match.group(1)
+        if room_match:
+            result["room"] = room_match.group(1)
+        if result:
+            result["type"] = "compound"
+            return result
+    elif entity_type == "equipment":
+        if value in EQUIPMENT_MAPPING:
+            return EQUIPMENT_MAPPING[value]
+        for base_name, mapping in EQUIPMENT_MAPPING.items():
+            if base_name in value:
+                result = mapping.copy()
+                number_match = re.search(r'\d+', value)
+                if number_match:
+                    result["number"] = number_match.group()
+                return result
+    elif entity_type == "parameter":
+        return {"parameter_type": value, "unit": PARAMETER_UNIT_MAPPING.get(value, "")}
+    elif entity_type == "value":
+        value_match = re.search(r'(\d+\.?\d*)', value)
+        unit_match = re.search(r'(°C|%|V|A|Hz)', value)
+        if value_match:
+            result = {"numeric_value": float(value_match.group(1))}
+            if unit_match:
+                result["unit"] = unit_match.group(1)
+            return result
+    return None
+
+
+def test_entity_normalizer():
+    """测试实体标准化查找表与原实现结果一致，缓存写满后仍然正确"""
+    print("\n测试实体标准化...")
+    try:
+        from config import LOCATION_MAPPING, EQUIPMENT_MAPPING, PARAMETER_UNIT_MAPPING
+        from entity_normalizer import EntityNormalizer
+        
+        cases = [("location", value) for value in LOCATION_MAPPING]
+        cases += [("location", value) for value in ["A区2号房", "C区", "3号房", "D区12号房", "机房"]]
+        cases += [("equipment", value) for value in EQUIPMENT_MAPPING]
+        for name in EQUIPMENT_MAPPING:
+            cases += [("equipment", f"{name}{n}") for n in ("1", "12")]
+            cases += [("equipment", f"{name}{n}号") for n in ("2", "30")]
+            cases += [("equipment", f"2号{name}")]
+        cases += [("equipment", value) for value in ["发电机", "发电机3"]]
+        cases += [("parameter", value) for value in PARAMETER_UNIT_MAPPING]
+        cases += [("parameter", "噪声")]
+        cases += [("value", value) for value in ["25°C", "60%", "220V", "3.5A", "50Hz", "12", "abc"]]
+        cases += [("unknown", "A区")]
+        
+        def normalize_all(normalizer):
+            for entity_type, value in cases:
+                result = normalizer.normalize(entity_type, value)
+                actual = dict(result) if result is not None else None
+                expected = _baseline_normalize(entity_type, value)
+                if actual != expected:
+                    print(f"✗ 标准化结果不一致: {entity_type}={value}: {actual} != {expected}")
+                    return False
+            return True
+        
+        if not normalize_all(EntityNormalizer()):
+            return False
+        
+        # 缓存容量只比预生成表多几项，反复写满清空后结果仍然一致
+        table_size = len(EntityNormalizer()._table)
+        normalizer = EntityNormalizer(cache_size=table_size + 3)
+        for _ in range(3):
+            if not normalize_all(normalizer):
+                return False
+        if len(normalizer._lookup) > normalizer.cache_size:
+            print(f"✗ 缓存超出容量: {len(normalizer._lookup)} > {normalizer.cache_size}")
+            return False
+        
+        print(f"✓ {len(cases)} 个实体值与原实现一致，缓存写满后正常")
+        return True
+        
+    except Exception as e:
+        print(f"✗ 实体标准化测试失败: {e}")
+        return False
+
+def test_span_to_entity():
+    """测试内部Span转换为Entity时字段保持不变"""
+    print("\n测试Span转换...")
+    try:
+        from models import Span, Entity
+        from entity_extractor import EntityExtractor
+        
+        fields = ("type", "value", "start", "end", "confidence", "normalized_value")
+        span = Span("equipment", "UPS12", 3, 8, 0.85, {"type": "ups", "number": "12"}, source="llm")
+        entity = span.to_entity()
+        if not isinstance(entity, Entity):
+            print(f"✗ 转换结果类型错误: {type(entity)}")
+            return False
+        for field in fields:
+            if getattr(entity, field) != getattr(span, field):
+                print(f"✗ 字段 {field} 不一致: {getattr(entity, field)} != {getattr(span, field)}")
+                return False
+        
+        # 抽取器对外的Entity与内部Span逐项一致
+        extractor = EntityExtractor()
+        text = "检查A区2号房UPS12的温度是否超过25°C"
+        spans = extractor.extract_spans(text)
+        entities = extractor.extract_entities(text)
+        expected = [tuple(getattr(item, field) for field in fields) for item in spans]
+        actual = [tuple(getattr(item, field) for field in fields) for item in entities]
+        if not spans or actual != expected:
+            print(f"✗ 抽取结果转换不一致: {actual} != {expected}")
+            return False
+        
+        print(f"✓ Span转换保留全部字段，{len(entities)} 个抽取实体一致")
+        return True
+        
+    except Exception as e:
+        print(f"✗ Span转换测试失败: {e}")
+        return False
+
 def test_configuration():
     """测试配置"""
     print("\n测试配置...")
@@ -148,7 +1469,8 @@ def test_dependencies():
         'fastapi',
         'uvicorn',
         'requests',
-        'openai'
+        'openai',
+        'numpy'
     ]
     
     missing_packages = []
@@ -177,7 +1499,32 @@ def run_all_tests():
         ("模块导入测试", test_imports),
         ("配置测试", test_configuration),
         ("意图识别测试", test_intent_classification),
+        ("意图规则引擎测试", test_intent_engine),
+        ("批量意图识别测试", test_intent_batch),
+        ("n-gram意图模型测试", test_ngram_intent_model),
         ("实体抽取测试", test_entity_extraction),
+        ("关键词自动机测试", test_keyword_automaton),
+        ("合并正则扫描器测试", test_fused_scanner),
+        ("实体重叠消解测试", test_span_resolver),
+        ("批量实体抽取测试", test_batch_extraction),
+        ("语法快照测试", test_grammar_snapshot),
+        ("级联策略测试", test_cascade_policy),
+        ("异步大模型调用测试", test_async_llm_client),
+        ("大模型响应缓存测试", test_llm_cache),
+        ("请求合并测试", test_singleflight),
+        ("大模型微批处理测试", test_llm_batcher),
+        ("流式意图回调测试", test_streaming_intent),
+        ("紧凑输出格式测试", test_compact_response),
+        ("提示词精简测试", test_prompt_builder),
+        ("模型路由测试", test_model_router),
+        ("截止时间和对冲请求测试", test_deadline_and_hedging),
+        ("重试和熔断测试", test_circuit_breaker),
+        ("并发处理测试", test_concurrent_processing),
+        ("离线大模型替身服务测试", test_fake_llm_server),
+        ("批量处理测试", test_process_batch),
+        ("分词边界测试", test_segmenter),
+        ("实体标准化测试", test_entity_normalizer),
+        ("Span转换测试", test_span_to_entity),
         ("基本功能测试", test_basic_functionality)
     ]
     